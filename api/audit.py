@@ -0,0 +1,80 @@
+# internal imports
+import json
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+# external imports
+from services.audit import decode_cursor, encode_cursor, event_to_dict, fetch_events, iter_event_pages
+from services.catalog import catalog
+
+
+router = APIRouter(prefix="/api/audit", tags=["audit"])
+
+
+async def resolve_medicine_ids(medicine_id: int | None, drug_name: str | None, drug_type: str | None) -> list[int] | None:
+    """Drug filter as medicine ids: `medicine_id`, or the drugs registered under `drug_name` (and `drug_type`)."""
+    if medicine_id is not None:
+        return [medicine_id]
+    if drug_name:
+        await catalog.refresh_if_stale()
+        drug_type = drug_type.lower().strip() if drug_type else None
+        return [m.id for m in catalog.same_name(drug_name) if drug_type in (None, m.drug_type)]
+    if drug_type:
+        raise HTTPException(status_code=400, detail="drug_type can only be used together with drug_name.")
+    return None
+
+
+@router.get("/events")
+async def list_events(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    medicine_id: int | None = None,
+    drug_name: str | None = None,
+    drug_type: str | None = None,
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    One page of verification events, oldest first.
+
+    Args:
+        since, until: Time range (inclusive start, exclusive end); naive times are UTC
+        medicine_id, drug_name, drug_type: Only verifications resolved to these drugs
+        status: VERIFIED, HIGH-RISK, PENDING, REJECTED, CANCELLED or ERROR
+        cursor: "next_cursor" of the previous page
+
+    Events are buffered for up to AUDIT_FLUSH_INTERVAL_SECONDS before they
+    are written, so the newest verifications may not be listed yet.
+    """
+    medicine_ids = await resolve_medicine_ids(medicine_id, drug_name, drug_type)
+    after = decode_cursor(cursor) if cursor else None
+    events = await fetch_events(since, until, medicine_ids, status, after, limit)
+    return {
+        "events": [event_to_dict(event) for event in events],
+        "next_cursor": encode_cursor(events[-1]) if len(events) == limit else None,
+    }
+
+
+@router.get("/events/export")
+async def export_events(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    medicine_id: int | None = None,
+    drug_name: str | None = None,
+    drug_type: str | None = None,
+    status: str | None = None
+):
+    """
+    Every matching verification event as NDJSON, oldest first, streamed
+    page by page so an export of any size runs in constant memory. Takes
+    the same filters as /api/audit/events.
+    """
+    medicine_ids = await resolve_medicine_ids(medicine_id, drug_name, drug_type)
+
+    async def stream_events():
+        async for page in iter_event_pages(since, until, medicine_ids, status):
+            yield "".join(json.dumps(event_to_dict(event)) + "\n" for event in page)
+
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
@@ -0,0 +1,98 @@
+# internal imports
+import re
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+# external imports
+from services.image_store import RENDITIONS, image_store, image_mime_type, validate_object
+
+
+router = APIRouter(prefix="/api/images", tags=["images"])
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (start, end) inclusive for a single-range Range header, or None to send
+    the whole object (no header, or a form we do not serve, like multiple
+    ranges). Unsatisfiable ranges raise a 416.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable.",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+@router.get("/{digest}/{rendition}")
+async def get_image(digest: str, rendition: str, request: Request):
+    """
+    Streams a stored golden image rendition ("original", "normalized" or
+    "thumbnail") by its sha256. Supports single byte ranges (206 Partial
+    Content); objects never change, so responses are cacheable forever.
+    """
+    try:
+        validate_object(digest, rendition)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        size = await asyncio.to_thread(image_store.size, digest, rendition)
+        mime_type = await asyncio.to_thread(image_mime_type, digest, rendition)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found.")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{digest}-{rendition}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    # A sync iterator: Starlette reads each chunk in a worker thread
+    return StreamingResponse(
+        image_store.read_range(digest, rendition, start, end),
+        status_code=status_code,
+        media_type=mime_type,
+        headers=headers,
+    )
+
+
+@router.get("/{digest}")
+async def list_renditions(digest: str):
+    """Which renditions of an image are stored, with their sizes."""
+    try:
+        validate_object(digest, "original")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    renditions = {}
+    for rendition in RENDITIONS:
+        try:
+            renditions[rendition] = await asyncio.to_thread(image_store.size, digest, rendition)
+        except FileNotFoundError:
+            continue
+    if not renditions:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    return {"digest": digest, "renditions": renditions}
@@ -0,0 +1,87 @@
+# internal imports
+import os
+import uuid
+import shutil
+import asyncio
+import zipfile
+from pathlib import Path
+from fastapi import APIRouter, HTTPException, File, UploadFile
+
+# external imports
+from config.settings import INGEST_DIR, INGEST_MAX_ARCHIVE_BYTES
+from services.ingest import create_run, get_run, get_row_errors, run_to_dict, submit_run, resume_run
+from services.uploads import spool_upload
+
+
+router = APIRouter(prefix="/api/catalog", tags=["catalog"])
+
+
+@router.post("/ingest", status_code=202)
+async def ingest_catalog(
+    manifest: UploadFile = File(...),
+    archive: UploadFile = File(...)
+):
+    """
+    Bulk-loads drugs from a NAFDAC register export. Returns a run id at once;
+    rows are ingested in the background.
+
+    Args:
+        manifest: CSV with a header line, or JSON Lines. Each row has drug_name,
+            drug_type, nafdac_number, manufacturer, box_image and an optional
+            blister_pack_image (image file names in the archive)
+        archive: Zip of the images the manifest names
+
+    Existing drugs (same name and type) are updated. Rows that fail validation
+    or whose images cannot be read are reported per row and do not stop the
+    run. Poll GET /api/catalog/ingest/{run_id} for progress and row errors.
+    """
+    run_id = uuid.uuid4().hex
+    run_dir = Path(INGEST_DIR) / run_id
+    await asyncio.to_thread(run_dir.mkdir, parents=True, exist_ok=True)
+
+    try:
+        manifest_spool = await spool_upload(manifest, directory=str(run_dir))
+        manifest_path = run_dir / f"manifest{Path(manifest.filename or '').suffix.lower() or '.csv'}"
+        await asyncio.to_thread(os.replace, manifest_spool.path, manifest_path)
+
+        archive_spool = await spool_upload(archive, directory=str(run_dir), max_bytes=INGEST_MAX_ARCHIVE_BYTES)
+        archive_path = run_dir / "images.zip"
+        await asyncio.to_thread(os.replace, archive_spool.path, archive_path)
+        if not await asyncio.to_thread(zipfile.is_zipfile, archive_path):
+            raise HTTPException(status_code=400, detail="Image archive is not a valid zip file.")
+    except BaseException:
+        # Too large, invalid or the client went away: nothing will ever resume this run
+        await asyncio.shield(asyncio.to_thread(shutil.rmtree, run_dir, True))
+        raise
+
+    run = await asyncio.to_thread(
+        create_run, manifest.filename or "manifest", str(manifest_path), str(archive_path), run_id
+    )
+    submit_run(run.id)
+    return {"run_id": run.id, "status": run.status, "status_url": f"{router.prefix}/ingest/{run.id}"}
+
+
+@router.get("/ingest/{run_id}")
+async def ingest_status(run_id: str, errors_offset: int = 0, errors_limit: int = 100):
+    """Progress of an ingest run plus one page of its row errors (ordered by row)."""
+    run = await asyncio.to_thread(get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Ingest run not found.")
+    errors_limit = max(1, min(errors_limit, 1000))
+    errors = await asyncio.to_thread(get_row_errors, run_id, max(0, errors_offset), errors_limit)
+    return {
+        **run_to_dict(run),
+        "errors": [{"row": e.row, "drug_name": e.drug_name, "error": e.error} for e in errors],
+        "errors_next_offset": errors_offset + len(errors) if len(errors) == errors_limit else None,
+    }
+
+
+@router.post("/ingest/{run_id}/resume", status_code=202)
+async def resume_ingest(run_id: str):
+    """Continues a failed run after its last committed chunk."""
+    run = await asyncio.to_thread(get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Ingest run not found.")
+    if not await resume_run(run_id):
+        raise HTTPException(status_code=409, detail=f"Ingest run is {run.status}; only failed runs can be resumed.")
+    return {"run_id": run_id, "status": "queued", "status_url": f"{router.prefix}/ingest/{run_id}"}
@@ -0,0 +1,50 @@
+# internal imports
+import time
+from fastapi import APIRouter, Request, Response
+from starlette.routing import Match
+
+# external imports
+from services.metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT, render_metrics
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+async def track_requests(request: Request, call_next):
+    """
+    HTTP middleware recording in-flight requests and response latency per
+    route template (e.g. /api/verify/jobs/{job_id}), so ids do not blow up
+    the label set. Streaming responses are timed until their headers are sent.
+    """
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        # Routing happens after middleware; resolve the template ourselves
+        for candidate in request.app.router.routes:
+            match, _ = candidate.matches(request.scope)
+            if match == Match.FULL:
+                path = candidate.path
+                break
+    if path is None or path == "/metrics":
+        return await call_next(request)
+
+    in_flight = REQUESTS_IN_FLIGHT.labels(method=request.method, route=path)
+    in_flight.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        REQUEST_LATENCY.labels(
+            method=request.method, route=path, status_code=str(status_code)
+        ).observe(time.perf_counter() - start)
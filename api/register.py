@@ -1,24 +1,34 @@
 # internal imports 
-import os
+import logging
 from datetime import datetime
-from pathlib import Path
+import asyncio
 from fastapi import APIRouter, HTTPException, File, Form, UploadFile, Depends
-from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from PIL import UnidentifiedImageError
 from dotenv import load_dotenv
 
 # external imports
-from db.models import CreateMedicine
-from db.database import get_session
+from config.settings import REFERENCE_MAX_PER_DRUG
+from db.models import CreateMedicine, ReferenceImage
+from db.database import get_async_session
+from services.catalog import catalog, bump_catalog_version
+from services.gemini import context_cache
+from services.golden_cache import golden_images, build_golden_images
+from services.image_store import store_golden_image
+from services.uploads import spool_upload
+from services.prescreen import compute_descriptor, descriptor_to_row, forget_golden_descriptor
+from services.embeddings import compute_embedding
+from services.references import ROLES, new_reference, reference_to_dict, reference_index
+
+logger = logging.getLogger(__name__)
 
 
 load_dotenv()
 
 router = APIRouter(prefix="/api/register-drug", tags=["register drug"])
 
-# Create directory for storing medicine images if it doesn't exist
-IMAGES_DIR = Path("medicine_images")
-IMAGES_DIR.mkdir(exist_ok=True)
-
 
 @router.post("/")
 async def register_drug(
@@ -28,7 +38,7 @@ async def register_drug(
     manufacturer: str = Form(...),
     box_image: UploadFile = File(...),
     blister_pack_image: UploadFile | None = File(None),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Register a new drug in the database with its golden standard images.
@@ -57,11 +67,11 @@ async def register_drug(
         )
     
     # 3. Check if drug already exists in database
-    existing_drug = session.exec(
+    existing_drug = (await session.exec(
         select(CreateMedicine)
         .where(CreateMedicine.drug_name == drug_name_lower)
         .where(CreateMedicine.drug_type == drug_type_lower)
-    ).first()
+    )).first()
     
     if existing_drug:
         raise HTTPException(
@@ -69,52 +79,63 @@ async def register_drug(
             detail=f"Drug '{drug_name}' with type '{drug_type}' already exists in the database."
         )
     
-    # 4. Create directory for this drug's images
-    drug_dir = IMAGES_DIR / drug_name_lower
-    drug_dir.mkdir(exist_ok=True)
-    
-    # 5. Save box image
+    # 4. Save box image: stream it to a spool file and store it content-addressed
+    #    with its renditions (normalized once here, so verification never has to)
+    box_spool = None
     try:
-        box_image_filename = f"{drug_name_lower}_package{Path(box_image.filename).suffix}"
-        box_image_path = drug_dir / box_image_filename
-        
-        box_image_bytes = await box_image.read()
-        with open(box_image_path, "wb") as f:
-            f.write(box_image_bytes)
-        
-        golden_box_path = str(box_image_path)
-        
+        box_spool = await spool_upload(box_image)
+        stored_box = await store_golden_image(box_spool)
+        box_image_bytes = stored_box.normalized
+
+        # Perceptual descriptor used by the verification pre-screen
+        box_descriptor = await asyncio.to_thread(compute_descriptor, box_image_bytes)
+        # Embedding that makes the box image the drug's first reference image
+        box_embedding = await asyncio.to_thread(compute_embedding, box_image_bytes)
+
+        golden_box_path = stored_box.reference
+
+    except HTTPException:
+        raise
+    except UnidentifiedImageError:
+        raise HTTPException(
+            status_code=400,
+            detail="Box image is not a valid image."
+        )
     except Exception as e:
+        logger.exception("Error storing box image", extra={"drug_name": drug_name})
         raise HTTPException(
             status_code=500,
             detail=f"Error saving box image: {str(e)}"
         )
-    
-    # 6. Save blister pack image if provided
+
+    # 5. Save blister pack image if provided
     golden_blister_path = None
     if blister_pack_image:
         try:
-            blister_image_filename = f"{drug_name_lower}_blister_pack{Path(blister_pack_image.filename).suffix}"
-            blister_image_path = drug_dir / blister_image_filename
-            
-            blister_image_bytes = await blister_pack_image.read()
-            with open(blister_image_path, "wb") as f:
-                f.write(blister_image_bytes)
-            
-            golden_blister_path = str(blister_image_path)
-            
+            blister_spool = await spool_upload(blister_pack_image)
+            stored_blister = await store_golden_image(blister_spool)
+            blister_image_bytes = stored_blister.normalized
+            blister_embedding = await asyncio.to_thread(compute_embedding, blister_image_bytes)
+
+            golden_blister_path = stored_blister.reference
+
+        except HTTPException:
+            raise
+        except UnidentifiedImageError:
+            raise HTTPException(
+                status_code=400,
+                detail="Blister pack image is not a valid image."
+            )
         except Exception as e:
-            # Clean up box image if blister save fails
-            try:
-                os.unlink(box_image_path)
-            except:
-                pass
+            logger.exception("Error storing blister pack image", extra={"drug_name": drug_name})
             raise HTTPException(
                 status_code=500,
                 detail=f"Error saving blister pack image: {str(e)}"
             )
-    
-    # 7. Create database record
+    # Stored images are not removed when a later step fails: they may be
+    # shared with other drugs, and re-registering the same files reuses them
+
+    # 6. Create database record
     try:
         new_medicine = CreateMedicine(
             drug_name=drug_name_lower,
@@ -126,9 +147,30 @@ async def register_drug(
         )
         
         session.add(new_medicine)
-        session.commit()
-        session.refresh(new_medicine)
-        
+        await session.flush()
+
+        # Store the golden box descriptor alongside the medicine row (same transaction)
+        session.add(descriptor_to_row(new_medicine.id, box_descriptor))
+        # The golden images are the drug's first reference images (same transaction)
+        session.add(new_reference(new_medicine.id, "box", golden_box_path, box_embedding))
+        if golden_blister_path:
+            session.add(new_reference(new_medicine.id, "blister", golden_blister_path, blister_embedding))
+        # Tell every worker's catalog that a drug was added
+        catalog_version = await bump_catalog_version(session)
+        await session.commit()
+        await session.refresh(new_medicine)
+        forget_golden_descriptor(new_medicine.id)
+        catalog.add(new_medicine, catalog_version)
+
+        # Replace any cached golden images for this id with the freshly written ones
+        golden_images.invalidate(new_medicine.id)
+        context_cache.invalidate(new_medicine.id)
+        golden_images.put(
+            new_medicine.id,
+            build_golden_images(new_medicine, box_image_bytes, blister_image_bytes if golden_blister_path else None)
+        )
+        logger.info("Drug registered", extra={"medicine_id": new_medicine.id, "drug_name": new_medicine.drug_name})
+
         return {
             "status": "success",
             "message": f"Drug '{drug_name}' registered successfully",
@@ -143,17 +185,133 @@ async def register_drug(
                 "created_at": new_medicine.created_at.isoformat()
             }
         }
-        
+
+    except IntegrityError:
+        # Registered by a concurrent request since the check above
+        await session.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Drug '{drug_name}' with type '{drug_type}' already exists in the database."
+        )
     except Exception as e:
-        # Rollback and clean up files on database error
-        session.rollback()
-        try:
-            os.unlink(box_image_path)
-            if golden_blister_path:
-                os.unlink(blister_image_path)
-        except:
-            pass
+        # Rollback on database error
+        logger.exception("Error saving drug registration", extra={"drug_name": drug_name})
+        await session.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Error saving to database: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+# --- Reference Images (additional golden views of a registered drug) ---
+
+async def get_registered_drug(session: AsyncSession, medicine_id: int) -> CreateMedicine:
+    medicine = await session.get(CreateMedicine, medicine_id)
+    if medicine is None:
+        raise HTTPException(status_code=404, detail=f"Drug with id {medicine_id} not found.")
+    return medicine
+
+
+@router.post("/{medicine_id}/references")
+async def add_reference_image(
+    medicine_id: int,
+    image: UploadFile = File(...),
+    role: str = Form("box"),
+    label: str | None = Form(None),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Adds another golden image to a registered drug, e.g. a new packaging
+    revision or the box photographed from another angle.
+
+    Args:
+        medicine_id: Id of the registered drug
+        image: The reference image
+        role: "box" (default) or "blister"
+        label: Optional note, e.g. "2024 packaging"
+
+    Verification compares each upload with the drug's closest reference of
+    the same role, and box references are what /api/verify/identify matches.
+    """
+    role_lower = role.lower().strip()
+    if role_lower not in ROLES:
+        raise HTTPException(status_code=400, detail=f"Invalid role '{role}'. Must be either 'box' or 'blister'.")
+
+    medicine = await get_registered_drug(session, medicine_id)
+    count = (await session.exec(
+        select(func.count()).select_from(ReferenceImage).where(ReferenceImage.medicine_id == medicine_id)
+    )).one()
+    if count >= REFERENCE_MAX_PER_DRUG:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Drug '{medicine.drug_name}' already has {count} reference images (the maximum)."
+        )
+
+    try:
+        stored = await store_golden_image(await spool_upload(image))
+        embedding = await asyncio.to_thread(compute_embedding, stored.normalized)
+    except HTTPException:
+        raise
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Reference image is not a valid image.")
+    except Exception as e:
+        logger.exception("Error storing reference image", extra={"medicine_id": medicine_id})
+        raise HTTPException(status_code=500, detail=f"Error saving reference image: {str(e)}")
+
+    reference = new_reference(medicine.id, role_lower, stored.reference, embedding, label.strip() if label else None)
+    drug_name = medicine.drug_name  # a failed flush expires the loaded rows
+    session.add(reference)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"This image is already a {role_lower} reference of '{drug_name}'."
+        )
+    # References are part of the catalog: every worker's index picks it up on the next version
+    await bump_catalog_version(session)
+    await session.commit()
+    await session.refresh(reference)
+    await reference_index.refresh(force=True)
+    logger.info("Reference image added", extra={"medicine_id": medicine.id, "reference_id": reference.id})
+
+    return {"status": "success", "data": reference_to_dict(reference, medicine)}
+
+
+@router.get("/{medicine_id}/references")
+async def list_reference_images(medicine_id: int, session: AsyncSession = Depends(get_async_session)):
+    """The reference images of a registered drug; "primary" marks its own golden images."""
+    medicine = await get_registered_drug(session, medicine_id)
+    references = (await session.exec(
+        select(ReferenceImage).where(ReferenceImage.medicine_id == medicine_id).order_by(ReferenceImage.id)
+    )).all()
+    return {
+        "medicine_id": medicine.id,
+        "drug_name": medicine.drug_name,
+        "references": [reference_to_dict(reference, medicine) for reference in references],
+    }
+
+
+@router.delete("/{medicine_id}/references/{reference_id}")
+async def delete_reference_image(
+    medicine_id: int,
+    reference_id: int,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """Removes an additional reference image. The drug's own golden images cannot be removed."""
+    medicine = await get_registered_drug(session, medicine_id)
+    reference = await session.get(ReferenceImage, reference_id)
+    if reference is None or reference.medicine_id != medicine_id:
+        raise HTTPException(status_code=404, detail=f"Reference image {reference_id} not found for this drug.")
+    if reference_to_dict(reference, medicine)["primary"]:
+        raise HTTPException(status_code=400, detail="The drug's golden image cannot be removed from its references.")
+
+    # The stored image is kept: it may be shared with other drugs
+    await session.delete(reference)
+    await bump_catalog_version(session)
+    await session.commit()
+    await reference_index.refresh(force=True)
+    # Drop model-side contexts that may hold the removed image
+    context_cache.invalidate(medicine_id)
+    return {"status": "success", "message": f"Reference image {reference_id} removed"}
@@ -1,47 +1,26 @@
 import os
-import tempfile
-from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, File, Form, UploadFile, BackgroundTasks, APIRouter
-from pydantic import BaseModel, SecretStr
+import logging
+import asyncio
+from datetime import date
+from typing import Literal
+from fastapi import HTTPException, File, Form, UploadFile, APIRouter, Query
 from starlette.responses import JSONResponse
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+from PIL import UnidentifiedImageError
 
 # external imports 
-from config.report_html import HTML
+from config.settings import NAFDAC_EMAIL
+from services.images import normalize_spooled, extension_for
+from services.outbox import enqueue_report
+from services.report_stats import report_stats
+from services.uploads import spool_upload, discard
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix='/api/report', tags=["report"])
 
-# --- Email Configuration ---
-# WARNING: This is complex and requires a real mail server.
-# Do not do this during the hackathon.
-
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("MAIL_EMAIL", ""),         # Your Gmail address
-    MAIL_PASSWORD = SecretStr(os.getenv("MAIL_PASSWORD", "")),  # Gmail App Password
-    MAIL_FROM = os.getenv("MAIL_EMAIL", ""),                 
-    MAIL_PORT = 465,  # Changed from 587 to 465
-    MAIL_SERVER = "smtp.gmail.com",                  # Changed from SendGrid to Gmail
-    MAIL_FROM_NAME = "ChecMed Report",
-    MAIL_STARTTLS = False,  # Changed from True to False
-    MAIL_SSL_TLS = True,  # Changed from False to True
-    USE_CREDENTIALS = True,
-    VALIDATE_CERTS = True
-)
-
-# --- HTML Email Template ---
-# (See next section for the full HTML)
-HTML_TEMPLATE = HTML
-NAFDAC_EMAIL = os.getenv("NAFDAC_EMAIL")
-
-# Development mode flag - set to False when email is configured
-DEV_MODE = os.getenv("DEV_MODE", "true").lower() in ("true", "1", "yes")
-
 # --- The New Report Endpoint (The "Real" Version) ---
 @router.post("/")
 async def send_report(
-    background_tasks: BackgroundTasks,
     drug_name: str = Form(...),
     nafdac_number: str = Form(...),
     reason: str = Form(...),
@@ -50,7 +29,7 @@ async def send_report(
     blister_image: UploadFile | None = File(None)
 ):
     """
-    Receives a report and sends it to NAFDAC via email.
+    Receives a report and queues it in the outbox for emailing to NAFDAC.
     
     Args:
         drug_name: Name of the suspected counterfeit drug
@@ -61,33 +40,6 @@ async def send_report(
         blister_image: Image of blister pack (optional)
     """
     
-    # Read box image bytes (required)
-    box_image_bytes = await box_image.read()
-    
-    # Read blister image if provided
-    blister_image_bytes = None
-    if blister_image:
-        blister_image_bytes = await blister_image.read()
-
-    # Format the email body using the template
-    try:
-        html_body = HTML_TEMPLATE.format(
-            drug_name=drug_name or "N/A",
-            nafdac_number=nafdac_number or "N/A",
-            reason=reason or "N/A",
-            location=location or "N/A"
-        )
-    except KeyError as e:
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Email template error: missing placeholder {str(e)}"
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error formatting email: {str(e)}"
-        )
-
     # Validate NAFDAC email is configured
     if not NAFDAC_EMAIL:
         raise HTTPException(
@@ -95,79 +47,71 @@ async def send_report(
             detail="NAFDAC email not configured. Set NAFDAC_EMAIL environment variable."
         )
 
-    # Save images to temporary files (fastapi-mail needs file paths)
+    # Stream the images to temporary files, normalize them in place (smaller
+    # emails, no EXIF/GPS metadata) and hand those same files to the outbox
     temp_files = []
     try:
-        # Save box image
-        box_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', mode='wb')
-        box_temp.write(box_image_bytes)
-        box_temp.close()
-        temp_files.append(box_temp.name)
-        
-        # Save blister image if provided
-        if blister_image_bytes:
-            blister_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', mode='wb')
-            blister_temp.write(blister_image_bytes)
-            blister_temp.close()
-            temp_files.append(blister_temp.name)
+        for upload in (box_image, blister_image):
+            if upload is None:
+                continue
+            spool = await spool_upload(upload)
+            temp_files.append(spool.path)
+            attachment = await normalize_spooled(spool.path)
+
+            # Give the attachment the extension of its real image type
+            attachment_path = spool.path + extension_for(attachment.mime_type)
+            await asyncio.to_thread(os.replace, spool.path, attachment_path)
+            temp_files[-1] = attachment_path
+            logger.info("Report attachment stored", extra={"upload_filename": upload.filename, "bytes": spool.size, "sha256": spool.sha256})
     except Exception as e:
         # Clean up temp files on error
         for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+            discard(temp_file)
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, UnidentifiedImageError):
+            raise HTTPException(status_code=400, detail="Uploaded file is not a valid image.")
         raise HTTPException(
             status_code=500,
             detail=f"Error preparing attachments: {str(e)}"
         )
 
-    message = MessageSchema(
-        subject="CRITICAL: Counterfeit Drug Report (ChecMed)",
-        recipients=[NAFDAC_EMAIL], # type: ignore
-        body=html_body,
-        subtype=MessageType.html,
-        attachments=temp_files  # fastapi-mail expects file paths
-    )
+    # Persist the report before answering so it survives a restart; the
+    # outbox sender delivers it (with retries) in the background
+    try:
+        await enqueue_report(drug_name, nafdac_number, reason, location, temp_files)
+    except Exception as e:
+        for temp_file in temp_files:
+            discard(temp_file)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error queuing report: {str(e)}"
+        )
 
-    fm = FastMail(conf)
-    
-    # Background task to send email and cleanup temp files
-    async def send_and_cleanup():
-        try:
-            if DEV_MODE:
-                # Development mode: skip actual email sending, just log
-                print("\n=== DEV MODE: Email Report (Not Sent) ===")
-                print(f"To: {NAFDAC_EMAIL}")
-                print(f"Subject: {message.subject}")
-                print(f"Drug Name: {drug_name}")
-                print(f"NAFDAC Number: {nafdac_number}")
-                print(f"Reason: {reason}")
-                print(f"Location: {location}")
-                print(f"Attachments: {len(temp_files)} files")
-                print("========================================\n")
-            else:
-                # Production mode: send actual email
-                print(f"Attempting to send email to {NAFDAC_EMAIL}...")
-                print(f"SMTP Config: {conf.MAIL_SERVER}:{conf.MAIL_PORT}")
-                print(f"From: {conf.MAIL_FROM}")
-                await fm.send_message(message)
-                print(f"✅ Email sent successfully to {NAFDAC_EMAIL}")
-        except Exception as e:
-            print(f"❌ ERROR sending email: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-        finally:
-            # Clean up temporary files
-            for temp_file in temp_files:
-                try:
-                    os.unlink(temp_file)
-                    print(f"Cleaned up temp file: {temp_file}")
-                except Exception as cleanup_error:
-                    print(f"Error cleaning up {temp_file}: {cleanup_error}")
-    
-    # Add to background tasks so the user isn't waiting
-    background_tasks.add_task(send_and_cleanup)
-    
     # Return an instant response to the user
-    return JSONResponse(status_code=200, content={"message": "Report has been queued for sending."})
\ No newline at end of file
+    return JSONResponse(status_code=200, content={"message": "Report has been queued for sending."})
+
+
+@router.get("/stats")
+async def get_report_stats(
+    since: date | None = None,
+    until: date | None = None,
+    drug_name: str | None = None,
+    location: str | None = None,
+    group_by: Literal["location", "drug", "day"] = "location",
+    limit: int = Query(20, ge=1, le=500)
+):
+    """
+    Counterfeit report counts, to spot hotspots.
+
+    Args:
+        since, until: Days to cover (inclusive, in REPORT_STATS_TIMEZONE);
+            the last REPORT_STATS_DEFAULT_DAYS by default
+        drug_name, location: Only reports of this drug / from this place
+            (matched case- and punctuation-insensitively)
+        group_by: Count per location, drug or day
+        limit: Number of groups returned (the top ones, or the first days)
+    """
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until.")
+    return await report_stats(since, until, drug_name, location, group_by, limit)
@@ -1,62 +1,94 @@
 # internal imports 
+import logging
 import json
-import base64  
-import asyncio 
-from fastapi import APIRouter, HTTPException, File, Form, UploadFile, Depends
-from sqlmodel import Session, select
-from google import genai
-from google.genai import types
+import asyncio
+import zipfile
+from fastapi import APIRouter, Depends, HTTPException, File, Form, UploadFile, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import UnidentifiedImageError
 from dotenv import load_dotenv
 
 # external imports
-from config.system_prompts import OCR_CLERK, PACKAGE_INSPECTOR, BLISTER_PACK_CHECK
-from db.models import CreateMedicine
-from db.database import get_session
+from config.settings import BATCH_MAX_PARALLEL, DEGRADED_MODE, REFERENCE_INDEX_ENABLED
+from services.admission import admission, admit_verification, rate_limit
+from services.audit import audit_verification
+from services.batch import BatchImages, parse_manifest, verify_batch_item
+from services.gemini import context_cache
+from services.jobs import submit_job, get_job, job_to_dict
+from services.metrics import DEGRADED_RESPONSES, time_stage
+from services.references import identify_product, is_identified
+from services.resilience import ModelUnavailable
+from services.verdict_cache import verdict_cache
+from services.verification import (
+    normalize_drug_type,
+    lookup_golden_drug,
+    identify_golden_drug,
+    load_golden_images,
+    run_verification,
+)
+
+logger = logging.getLogger(__name__)
 
 
 load_dotenv()
-client = genai.Client()
 router = APIRouter(prefix="/api/verify", tags=["verify"])
 
 
 
-# --- 4. Reusable Gemini API Call Function ---
-# (This function is identical to the previous version. It's perfect.)
-async def run_gemini_call(system_prompt: str, contents: list) -> dict:
+# --- 5. Your Single API Endpoint (UPDATED) ---
+
+DEGRADED_REASON = "NAFDAC-only check passed, visual inspection pending."
+
+
+async def degraded_response(
+    error: ModelUnavailable,
+    drug_name: str,
+    drug_type: str,
+    nafdac_number: str,
+    box_image_bytes: bytes,
+    blister_pack_image_bytes: bytes | None
+):
     """
-    Sends a prompt (with text and image bytes) to the Gemini API
-    using the official Python SDK.
+    Answer for a submission that passed the local checks while the model's
+    circuit breaker is open, according to DEGRADED_MODE: queue it as a job
+    (202), report it as PENDING (200), or re-raise the 503.
     """
-    try:
-        response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        config=types.GenerateContentConfig(system_instruction=system_prompt),
-        contents=contents
-        
-        )
-        print(response)
-        ai_response_text = response.text
-        
-        if not ai_response_text:
-            raise HTTPException(status_code=502, detail="Gemini returned empty response")
-        
-        return json.loads(ai_response_text)
-    except Exception as e:
-        print(f"Gemini SDK error: {e}")
-        raise HTTPException(status_code=502, detail=f"Gemini API error: {str(e)}")
+    if DEGRADED_MODE == "reject":
+        raise error
+    DEGRADED_RESPONSES.labels(mode=DEGRADED_MODE).inc()
+    logger.warning("Model unavailable, answering in degraded mode", extra={"mode": DEGRADED_MODE, "model": error.model})
+    if DEGRADED_MODE == "pending":
+        return {"status": "PENDING", "reason": DEGRADED_REASON}
 
+    job = await submit_job(drug_name, drug_type, nafdac_number, box_image_bytes, blister_pack_image_bytes)
+    return JSONResponse(status_code=202, content={
+        "status": "PENDING",
+        "reason": DEGRADED_REASON,
+        "job_id": job.id,
+        "status_url": f"{router.prefix}/jobs/{job.id}",
+    })
 
-# --- 5. Your Single API Endpoint (UPDATED) ---
+@router.get("/cache/stats")
+async def verdict_cache_stats():
+    """Hit/miss counters of the verdict cache on this worker."""
+    return verdict_cache.stats()
+
+
+@router.get("/context-cache/stats")
+async def context_cache_stats():
+    """Model-side cached contexts held and hit/miss counters on this worker."""
+    return context_cache.stats()
 
-@router.post("/")
+
+@router.post("/", dependencies=[Depends(admit_verification)])
 async def verify_drug(
+    request: Request,
     # Instead of a BaseModel, we now define the form fields one by one.
-    drug_name: str = Form(...),
-    drug_type: str = Form(...),
+    drug_name: str | None = Form(None),
+    drug_type: str | None = Form(None),
     nafdac_number: str = Form(...),
     box_image: UploadFile = File(...),
-    blister_pack_image: UploadFile | None = File(None),
-    session: Session = Depends(get_session)
+    blister_pack_image: UploadFile | None = File(None)
 ):
     """
     The main verification endpoint. Accepts multipart/form-data.
@@ -67,152 +99,219 @@ async def verify_drug(
         nafdac_number: The NAFDAC registration number
         box_image: Image of the drug packaging/box
         blister_pack_image: Optional image of blister pack (for tablets)
-        session: Database session (injected)
+
+    Without both drug_name and drug_type the product is identified from the
+    box image (among drugs matching the fields that were given); a 404 lists
+    the closest products when none matches clearly.
+
+    Model calls are cancelled if the client disconnects mid-verification.
+    For tablets the box and blister inspections run together when
+    INSPECTION_MODE is "concurrent", or one after the other (stopping at
+    the first HIGH-RISK) when it is "sequential". Each upload is compared
+    with the drug's closest reference image, and a local perceptual-hash
+    pre-screen runs first and can settle the box check without a model call.
+
+    While the model is unavailable (circuit breaker open) a submission that
+    passes the NAFDAC check is answered by degraded_response instead.
+    Requests over the client's rate limit or the global concurrency cap are
+    rejected up front with 429 and Retry-After. Every answer is recorded in
+    the verification audit log (see /api/audit/events).
     """
     
-    # 0. Normalize input
-    drug_name_lower = drug_name.lower().strip()
-    drug_type_lower = drug_type.lower().strip()
-    
-    # 1. Validate drug_type format
-    valid_types = ["syrup", "tablet"]
-    
-    if drug_type_lower not in valid_types:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Invalid drug type '{drug_type}'. Must be either 'syrup' or 'tablet'."
-        )
-    
-    # 2. Query database for the drug
-    golden_drug = session.exec(
-        select(CreateMedicine)
-        .where(CreateMedicine.drug_name == drug_name_lower)
-        .where(CreateMedicine.drug_type == drug_type_lower)
-    ).first()
-    
-    if not golden_drug:
-        # Check if drug exists with different type
-        any_drug = session.exec(
-            select(CreateMedicine)
-            .where(CreateMedicine.drug_name == drug_name_lower)
-        ).all()
-        
-        if any_drug:
-            # Drug exists but not with this type
-            available_types = [drug.drug_type for drug in any_drug]
-            raise HTTPException(
-                status_code=404,
-                detail=f"'{drug_name}' is not available as a '{drug_type_lower}'. Available types: {', '.join(available_types)}."
-            )
+    with audit_verification("verify", drug_name, drug_type, nafdac_number) as audit:
+        # 0. Normalize and validate input
+        drug_type_lower = normalize_drug_type(drug_type) if drug_type else None
+
+        # 1. Read the *user's* uploaded files into bytes
+        try:
+            with time_stage("upload_read"):
+                box_image_bytes = await box_image.read()
+
+                # Handle optional blister pack image
+                blister_pack_image_bytes = None
+                if blister_pack_image:
+                    blister_pack_image_bytes = await blister_pack_image.read()
+        except Exception as e:
+            logger.warning("File read error: %s", e)
+            raise HTTPException(status_code=400, detail="Error reading uploaded files.")
+
+        # 2. Look the drug up in the in-memory catalog (no per-request query),
+        #    or identify it from the box image when it was not fully named
+        if drug_name and drug_type_lower:
+            golden_drug = await lookup_golden_drug(drug_name, drug_type_lower)
         else:
-            # Drug doesn't exist at all
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Drug '{drug_name}' not found in our database."
+            golden_drug = await identify_golden_drug(box_image_bytes, drug_name, drug_type_lower)
+        audit.set_drug(golden_drug)
+
+        # 3. Fetch the golden standard images
+        golden = await load_golden_images(golden_drug)
+
+        # 4. Run the verification stages
+        try:
+            result = await run_verification(
+                golden_drug,
+                golden,
+                nafdac_number,
+                box_image_bytes,
+                blister_pack_image_bytes,
+                request
             )
-    
-    # 3. Read the golden standard images from disk
-    try:
-        with open(golden_drug.golden_box_image_path, "rb") as f:
-            golden_box_bytes = f.read()
-        
-        # Optional: read blister if path exists
-        golden_blister_pack_bytes = None
-        if golden_drug.golden_blister_image_path:
-            with open(golden_drug.golden_blister_image_path, "rb") as f:
-                golden_blister_pack_bytes = f.read()
-    except FileNotFoundError as e:
-        print(f"Golden image not found: {e}")
-        raise HTTPException(status_code=500, detail=f"Golden standard image not found: {str(e)}")
-    except Exception as e:
-        print(f"Error reading golden images: {e}")
-        raise HTTPException(status_code=500, detail=f"Error reading golden images: {str(e)}")
-    
-    
-    # 4. Read the *user's* uploaded files into bytes
+        except ModelUnavailable as e:
+            result = await degraded_response(
+                e, golden_drug.drug_name, golden_drug.drug_type, nafdac_number, box_image_bytes, blister_pack_image_bytes
+            )
+        return audit.complete(result)
+
+
+@router.post("/identify", dependencies=[Depends(rate_limit)])
+async def identify_drug(
+    box_image: UploadFile = File(...),
+    drug_type: str | None = Form(None)
+):
+    """
+    "Which product is this?": the registered products whose box reference
+    images look most like `box_image`, best first, with a similarity score
+    (0-1). "identified" is true when the best match is clear enough for
+    /api/verify/ to use it without a drug name. No model call is made.
+
+    Args:
+        box_image: Image of the drug packaging/box
+        drug_type: Optional "syrup" or "tablet" to narrow the search
+    """
+    if not REFERENCE_INDEX_ENABLED:
+        raise HTTPException(status_code=404, detail="Product identification is disabled.")
+    drug_type_lower = normalize_drug_type(drug_type) if drug_type else None
     try:
         box_image_bytes = await box_image.read()
-        
-        # Handle optional blister pack image
-        blister_pack_image_bytes = None
-        if blister_pack_image:
-            blister_pack_image_bytes = await blister_pack_image.read()
     except Exception as e:
-        print(f"File read error: {e}")
+        logger.warning("File read error: %s", e)
         raise HTTPException(status_code=400, detail="Error reading uploaded files.")
-    
     try:
-        # --- CALL 1 (REPLACED): Direct NAFDAC number check (no model call) ---
-        # Use the user-supplied nafdac_number form field and compare against the golden standard.
-        user_nafdac = (nafdac_number or "").strip()
-        golden_nafdac = golden_drug.nafdac_number.strip()
-        
-        if user_nafdac != golden_nafdac:
-            message =  {
-                "status": "HIGH-RISK",
-                "reason": "NAFDAC number mismatch",
-                "expected_nafdac": golden_nafdac,
-                "provided_nafdac": user_nafdac
-            }
-
-            raise HTTPException(status_code=404, detail=message)
-
-        # Passed the NAFDAC check
-        print({"status": "OK", "reason": "NAFDAC number matches"})
-
-        # --- CALL 2: The "Package Inspector" (Box Check) ---
-        system_prompt_2 = PACKAGE_INSPECTOR
-        contents_2 = [
-            "GENUINE Box",
-            types.Part.from_bytes(
-                data=golden_box_bytes, 
-                mime_type="image/jpeg"
-            ),
-            "USER'S Box. Compare this to the GENUINE Box.",
-            types.Part.from_bytes(
-                data=box_image_bytes, 
-                mime_type=box_image.content_type or "image/jpeg"
-            )
-        ]
-        call_2_result = await run_gemini_call(system_prompt_2, contents_2)
-        if call_2_result.get("status") == "HIGH-RISK":
-            raise HTTPException(status_code=404, detail=call_2_result)
-
-        # passed Package Inspector Check
-        print(call_2_result)
-
-        if golden_drug.drug_type == "tablet":
-            # --- CALL 3: The "Pharmacist" (Blister Pack) ---
-            # Ensure we actually have the golden blister and the user's blister bytes before passing to from_bytes
-            if golden_blister_pack_bytes is None:
-                raise HTTPException(status_code=500, detail="Golden blister image not available for this product.")
-            if blister_pack_image_bytes is None:
-                raise HTTPException(status_code=400, detail="User blister pack image not provided.")
-    
-            system_prompt_3 = BLISTER_PACK_CHECK
-            contents_3 = [
-                "GENUINE Blister Pack",
-                types.Part.from_bytes(
-                    data=golden_blister_pack_bytes,
-                    mime_type="image/jpeg"
-                ),
-                "USER'S Blister Pack. Compare this to the GENUINE Blister Pack",
-                types.Part.from_bytes(
-                    data=blister_pack_image_bytes,
-                    mime_type=(getattr(blister_pack_image, "content_type", None) or "image/jpeg")
-                )
-            ]
-            call_3_result = await run_gemini_call(system_prompt_3, contents_3)
-            if call_3_result.get("status") == "HIGH-RISK":
-                raise HTTPException(status_code=404, detail=call_3_result)
-            
-            print(call_3_result)
-
-        # --- 6. All Checks Passed ---
-        return {"status": "VERIFIED", "reason": "All checks passed."}
-
-    except HTTPException as e:
-        raise e
+        with time_stage("identify"):
+            candidates = await identify_product(box_image_bytes, drug_type=drug_type_lower)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a valid image.")
+    return {
+        "identified": is_identified(candidates),
+        "candidates": [candidate.to_dict() for candidate in candidates],
+    }
+
+
+# --- Batch Endpoint (bulk audits) ---
+
+@router.post("/batch", dependencies=[Depends(rate_limit)])
+async def verify_batch(
+    manifest: str | None = Form(None),
+    images: list[UploadFile] | None = File(None),
+    archive: UploadFile | None = File(None)
+):
+    """
+    Verifies many products in one upload and streams one NDJSON line per
+    item as soon as its verdict is ready (so lines arrive out of order;
+    use "index" to match them to the manifest).
+
+    Args:
+        manifest: JSON array or JSON Lines; each item has drug_name, drug_type,
+            nafdac_number, box_image and optional blister_pack_image, where the
+            image fields are file names
+        images: The image files referenced by the manifest (multipart upload)
+        archive: Alternatively, a zip holding manifest.json/manifest.jsonl and the images
+
+    Drugs are resolved from the in-memory catalog and at most
+    BATCH_MAX_PARALLEL items are verified at the same time. The upload
+    takes one rate limit token, however many items it holds; each item
+    then holds a global concurrency slot while it runs, waiting for one
+    while the service is at capacity.
+    """
+    archive_zip = None
+    if archive is not None:
+        try:
+            archive_zip = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Batch archive is not a valid zip file.")
+    batch_images = BatchImages(images, archive_zip)
+
+    manifest_text = manifest or batch_images.manifest_text()
+    if not manifest_text:
+        raise HTTPException(status_code=400, detail="Batch manifest not provided.")
+    items = parse_manifest(manifest_text)
+
+    slots = asyncio.Semaphore(BATCH_MAX_PARALLEL)
+
+    async def bounded(item):
+        async with slots:
+            lease = await admission.wait_for_slot()
+            try:
+                return await verify_batch_item(item, batch_images)
+            finally:
+                await admission.release(lease)
+
+    async def stream_verdicts():
+        tasks = [asyncio.create_task(bounded(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away or the stream failed: stop paying for model calls
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if archive_zip is not None:
+                archive_zip.close()
+
+    return StreamingResponse(stream_verdicts(), media_type="application/x-ndjson")
+
+
+# --- Job Endpoints (submit now, poll or receive a callback later) ---
+
+@router.post("/jobs", status_code=202, dependencies=[Depends(rate_limit)])
+async def submit_verification_job(
+    drug_name: str = Form(...),
+    drug_type: str = Form(...),
+    nafdac_number: str = Form(...),
+    box_image: UploadFile = File(...),
+    blister_pack_image: UploadFile | None = File(None),
+    callback_url: str | None = Form(None)
+):
+    """
+    Queues a verification and returns a job id immediately, so the client
+    does not have to hold the connection open for the model calls.
+
+    Args:
+        drug_name: Name of the drug to verify
+        drug_type: Type of drug formulation - must be either "syrup" or "tablet"
+        nafdac_number: The NAFDAC registration number
+        box_image: Image of the drug packaging/box
+        blister_pack_image: Optional image of blister pack (for tablets)
+        callback_url: Optional URL that receives the finished job as a JSON POST
+
+    Poll GET /api/verify/jobs/{job_id} for the result. "status_code" and
+    "result" carry what POST /api/verify/ would have returned.
+    """
+    normalize_drug_type(drug_type)
+    try:
+        box_image_bytes = await box_image.read()
+        blister_pack_image_bytes = await blister_pack_image.read() if blister_pack_image else None
     except Exception as e:
-        print(f"Main endpoint error: {e}")
-        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
\ No newline at end of file
+        logger.warning("File read error: %s", e)
+        raise HTTPException(status_code=400, detail="Error reading uploaded files.")
+
+    job = await submit_job(
+        drug_name,
+        drug_type,
+        nafdac_number,
+        box_image_bytes,
+        blister_pack_image_bytes,
+        callback_url
+    )
+    return {"job_id": job.id, "status": job.status, "status_url": f"{router.prefix}/jobs/{job.id}"}
+
+
+@router.get("/jobs/{job_id}")
+async def get_verification_job(job_id: str):
+    """Returns the status of a verification job and, once finished, its result."""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Verification job '{job_id}' not found.")
+    return job_to_dict(job)
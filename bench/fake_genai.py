@@ -0,0 +1,195 @@
+# internal imports
+import io
+import json
+import math
+import random
+import asyncio
+import itertools
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from google.genai import errors as genai_errors
+from google.genai import types
+from PIL import Image
+
+
+@dataclass
+class FakeModelProfile:
+    """
+    How the stand-in model behaves. Latency is drawn from a log-normal
+    distribution with the given median (so there is a realistic long tail);
+    each call independently returns HIGH-RISK with `high_risk_rate`, a
+    low-confidence verdict with `low_confidence_rate` and raises with
+    `error_rate`.
+
+    Prompt tokens are estimated the way Gemini counts them (about 4
+    characters per text token, 258 tokens per 768px image tile). Calls
+    that reference a cached context report its tokens as cached and take
+    `cached_latency_factor` times as long (set it from measurements
+    against the real API). Like the real API, contexts below
+    `min_cache_tokens` cannot be created.
+    """
+    median_latency_ms: float = 1500.0
+    latency_sigma: float = 0.35
+    high_risk_rate: float = 0.1
+    low_confidence_rate: float = 0.1
+    error_rate: float = 0.0
+    output_tokens: int = 40
+    min_cache_tokens: int = 1024
+    cached_latency_factor: float = 1.0
+    seed: int | None = None
+
+
+def _image_tokens(data: bytes) -> int:
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+    except Exception:
+        return 258
+    if width <= 384 and height <= 384:
+        return 258
+    return math.ceil(width / 768) * math.ceil(height / 768) * 258
+
+
+def estimate_tokens(items) -> int:
+    """Input tokens of strings, Parts and Contents, estimated like Gemini counts them."""
+    tokens = 0
+    for item in items or ():
+        if item is None:
+            continue
+        if isinstance(item, types.Content):
+            tokens += estimate_tokens(item.parts)
+        elif isinstance(item, types.Part) and item.inline_data is not None:
+            tokens += _image_tokens(item.inline_data.data or b"")
+        elif isinstance(item, types.Part):
+            tokens += math.ceil(len(item.text or "") / 4)
+        else:
+            tokens += math.ceil(len(str(item)) / 4)
+    return tokens
+
+
+class FakeCaches:
+    """
+    Drop-in for `client.aio.caches`: contexts expire after their TTL and
+    ones below `min_tokens` are rejected, like the real ones.
+    """
+
+    def __init__(self, min_tokens: int = 1024):
+        self.min_tokens = min_tokens
+        self.contexts: dict[str, datetime] = {}
+        self.tokens: dict[str, int] = {}
+        self.rejected = 0
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _expiry(config) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=float(config.ttl.rstrip("s")))
+
+    def not_found(self, name: str) -> genai_errors.ClientError:
+        return genai_errors.ClientError(403, {"error": {
+            "code": 403, "status": "PERMISSION_DENIED", "message": f"CachedContent not found: {name}"
+        }})
+
+    def is_live(self, name: str) -> bool:
+        expire_time = self.contexts.get(name)
+        return expire_time is not None and expire_time > datetime.now(timezone.utc)
+
+    async def create(self, *, model: str, config) -> types.CachedContent:
+        tokens = estimate_tokens([config.system_instruction]) + estimate_tokens(config.contents)
+        if tokens < self.min_tokens:
+            self.rejected += 1
+            raise genai_errors.ClientError(400, {"error": {
+                "code": 400, "status": "INVALID_ARGUMENT",
+                "message": f"Cached content is too small. total_token_count={tokens}, min_total_token_count={self.min_tokens}",
+            }})
+        self.created += 1
+        name = f"cachedContents/fake-{next(self._ids)}"
+        self.contexts[name] = self._expiry(config)
+        self.tokens[name] = tokens
+        return types.CachedContent(name=name, model=model, display_name=config.display_name, expire_time=self.contexts[name])
+
+    async def update(self, *, name: str, config) -> types.CachedContent:
+        if not self.is_live(name):
+            raise self.not_found(name)
+        self.updated += 1
+        self.contexts[name] = self._expiry(config)
+        return types.CachedContent(name=name, expire_time=self.contexts[name])
+
+    async def delete(self, *, name: str, config=None) -> None:
+        if self.contexts.pop(name, None) is None:
+            raise self.not_found(name)
+        self.tokens.pop(name, None)
+        self.deleted += 1
+
+
+class FakeModels:
+    """Drop-in for `client.aio.models`: generate_content and count_tokens."""
+
+    def __init__(self, profile: FakeModelProfile, caches: FakeCaches | None = None):
+        self.profile = profile
+        self.caches = caches or FakeCaches(profile.min_cache_tokens)
+        self.random = random.Random(profile.seed)
+        self.calls = 0
+        self.cached_calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def _latency_seconds(self) -> float:
+        if self.profile.median_latency_ms <= 0:
+            return 0.0
+        return self.random.lognormvariate(0, self.profile.latency_sigma) * self.profile.median_latency_ms / 1000
+
+    async def count_tokens(self, *, model: str, contents, config=None) -> types.CountTokensResponse:
+        return types.CountTokensResponse(total_tokens=estimate_tokens(contents))
+
+    async def generate_content(self, *, model: str, contents, config=None) -> types.GenerateContentResponse:
+        self.calls += 1
+        cached_content = getattr(config, "cached_content", None)
+        latency = self._latency_seconds()
+        prompt_tokens = estimate_tokens([getattr(config, "system_instruction", None)]) + estimate_tokens(contents)
+        cached_tokens = 0
+        if cached_content is not None:
+            if not self.caches.is_live(cached_content):
+                raise self.caches.not_found(cached_content)
+            self.cached_calls += 1
+            cached_tokens = self.caches.tokens[cached_content]
+            prompt_tokens += cached_tokens
+            latency *= self.profile.cached_latency_factor
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        await asyncio.sleep(latency)
+        if self.random.random() < self.profile.error_rate:
+            raise RuntimeError("Fake model error")
+
+        if self.random.random() < self.profile.high_risk_rate:
+            verdict = {"status": "HIGH-RISK", "reason": "Fake model: print quality differs from the genuine item."}
+        else:
+            verdict = {"status": "VERIFIED", "reason": "Fake model: matches the genuine item."}
+        verdict["confidence"] = 0.5 if self.random.random() < self.profile.low_confidence_rate else 0.95
+        return types.GenerateContentResponse(
+            model_version=model,
+            candidates=[types.Candidate(
+                content=types.Content(role="model", parts=[types.Part(text=json.dumps(verdict))]),
+                finish_reason=types.FinishReason.STOP,
+            )],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                cached_content_token_count=cached_tokens or None,
+                candidates_token_count=self.profile.output_tokens,
+                total_token_count=prompt_tokens + self.profile.output_tokens,
+            ),
+        )
+
+
+def install_fake_genai(profile: FakeModelProfile) -> FakeModels:
+    """Points the shared SDK client in services.gemini at a FakeModels (and FakeCaches) instance."""
+    from services import gemini
+
+    fake = FakeModels(profile)
+    gemini.client.aio.models.generate_content = fake.generate_content
+    gemini.client.aio.models.count_tokens = fake.count_tokens
+    caches = gemini.client.aio.caches
+    caches.create, caches.update, caches.delete = fake.caches.create, fake.caches.update, fake.caches.delete
+    return fake
@@ -0,0 +1,64 @@
+# internal imports
+from dataclasses import dataclass
+from pathlib import Path
+
+
+MEDICINE_IMAGES_DIR = Path("medicine_images")
+
+
+@dataclass
+class SeedDrug:
+    drug_name: str
+    drug_type: str
+    nafdac_number: str
+    box_image_path: str
+    blister_image_path: str | None
+
+
+def discover_seed_drugs(images_dir: Path = MEDICINE_IMAGES_DIR) -> list[SeedDrug]:
+    """
+    One drug per folder of medicine_images/: <name>_package.* is the box,
+    and a <name>_blister_pack.* image makes it a tablet (otherwise a syrup).
+    NAFDAC numbers are synthetic but stable across runs.
+    """
+    drugs = []
+    for index, folder in enumerate(sorted(p for p in images_dir.iterdir() if p.is_dir())):
+        box = next(folder.glob(f"{folder.name}_package.*"), None)
+        if box is None:
+            continue
+        blister = next(folder.glob(f"{folder.name}_blister_pack.*"), None)
+        drugs.append(SeedDrug(
+            drug_name=folder.name,
+            drug_type="tablet" if blister else "syrup",
+            nafdac_number=f"B{index:02d}-{1000 + index}",
+            box_image_path=str(box),
+            blister_image_path=str(blister) if blister else None,
+        ))
+    return drugs
+
+
+def reset_and_seed(drugs: list[SeedDrug]) -> None:
+    """
+    Recreates every table on the configured database (RENDER_DATABASE_URL,
+    SQLite or Postgres) and registers `drugs`, so each run starts from the
+    same state. Must run before main is imported so the catalog and golden
+    image cache are loaded from the seeded rows.
+    """
+    from sqlmodel import SQLModel, Session
+    from db.database import engine, init_db
+    from db.models import CatalogVersion, CreateMedicine
+
+    SQLModel.metadata.drop_all(bind=engine)
+    init_db()
+    with Session(engine) as session:
+        for drug in drugs:
+            session.add(CreateMedicine(
+                drug_name=drug.drug_name,
+                drug_type=drug.drug_type,
+                nafdac_number=drug.nafdac_number,
+                manufacturer="Benchmark Fixture",
+                golden_box_image_path=drug.box_image_path,
+                golden_blister_image_path=drug.blister_image_path,
+            ))
+        session.add(CatalogVersion(id=1, version=1))
+        session.commit()
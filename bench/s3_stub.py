@@ -0,0 +1,231 @@
+# internal imports
+import io
+import uuid
+import hashlib
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+
+def _error(code: str, message: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>'.encode()
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_S3Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _target(self) -> tuple[str, str, dict]:
+        """Bucket, key and query of a path-style request."""
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        return bucket, unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _not_found(self, key: str) -> None:
+        self._send(404, _error("NoSuchKey", f"{key} does not exist"), {"Content-Type": "application/xml"})
+
+    def _read_chunked(self) -> bytes:
+        """Body sent with HTTP chunked transfer or as aws-chunked (signed chunks plus trailers)."""
+        data = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                # Trailers (aws-chunked checksums) up to the blank line
+                while self.rfile.readline().strip():
+                    pass
+                return bytes(data)
+            data += self.rfile.read(size)
+            self.rfile.readline()
+
+    def _body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            data = self._read_chunked()
+        else:
+            data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        encoding = self.headers.get("Content-Encoding", "")
+        if "aws-chunked" in encoding or self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+            reader, self.rfile = self.rfile, io.BytesIO(data)
+            try:
+                data = self._read_chunked()
+            finally:
+                self.rfile = reader
+        return data
+
+    def do_HEAD(self):
+        bucket, key, _ = self._target()
+        self.server.count("head")
+        data = self.server.get(bucket, key)
+        if data is None:
+            return self._send(404)
+        self._send(200, headers={"Content-Length": str(len(data)), "ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+
+    def do_GET(self):
+        bucket, key, _ = self._target()
+        self.server.count("get")
+        data = self.server.get(bucket, key)
+        if data is None:
+            return self._not_found(key)
+        byte_range = self.headers.get("Range")
+        if not byte_range:
+            return self._send(200, data, {"Content-Type": "application/octet-stream"})
+        start, _, end = byte_range.removeprefix("bytes=").partition("-")
+        start, end = int(start), min(int(end) if end else len(data) - 1, len(data) - 1)
+        self._send(206, data[start:end + 1], {
+            "Content-Type": "application/octet-stream",
+            "Content-Range": f"bytes {start}-{end}/{len(data)}",
+        })
+
+    def do_PUT(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        if "uploadId" in query:
+            self.server.count("put_part")
+            if not self.server.put_part(query["uploadId"][0], int(query["partNumber"][0]), body):
+                return self._send(404, _error("NoSuchUpload", "Unknown upload"), {"Content-Type": "application/xml"})
+        else:
+            self.server.count("put")
+            self.server.put(bucket, key, body)
+        self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"', "Content-Length": "0"})
+
+    def do_POST(self):
+        bucket, key, query = self._target()
+        self._body()
+        if "uploads" in query:
+            self.server.count("create_multipart")
+            upload_id = self.server.create_upload(bucket, key)
+            result = (
+                f'<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                f"</InitiateMultipartUploadResult>"
+            )
+            return self._send(200, result.encode(), {"Content-Type": "application/xml"})
+        if "uploadId" in query:
+            self.server.count("complete_multipart")
+            if not self.server.complete_upload(query["uploadId"][0]):
+                return self._send(404, _error("NoSuchUpload", "Unknown upload"), {"Content-Type": "application/xml"})
+            result = (
+                f'<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>\"{uuid.uuid4().hex}\"</ETag>"
+                f"</CompleteMultipartUploadResult>"
+            )
+            return self._send(200, result.encode(), {"Content-Type": "application/xml"})
+        self._send(400, _error("InvalidRequest", "Unsupported POST"), {"Content-Type": "application/xml"})
+
+    def do_DELETE(self):
+        bucket, key, query = self._target()
+        self.server.count("delete")
+        if "uploadId" in query:
+            self.server.abort_upload(query["uploadId"][0])
+        else:
+            self.server.delete(bucket, key)
+        self._send(204)
+
+
+class _S3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, _S3Handler)
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.uploads: dict[str, tuple[str, str, dict[int, bytes]]] = {}
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, operation: str) -> None:
+        with self._lock:
+            self.requests[operation] += 1
+
+    def get(self, bucket: str, key: str) -> bytes | None:
+        with self._lock:
+            return self.objects.get((bucket, key))
+
+    def put(self, bucket: str, key: str, data: bytes) -> None:
+        with self._lock:
+            self.objects[(bucket, key)] = data
+
+    def delete(self, bucket: str, key: str) -> None:
+        with self._lock:
+            self.objects.pop((bucket, key), None)
+
+    def create_upload(self, bucket: str, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = (bucket, key, {})
+        return upload_id
+
+    def put_part(self, upload_id: str, number: int, data: bytes) -> bool:
+        with self._lock:
+            if upload_id not in self.uploads:
+                return False
+            self.uploads[upload_id][2][number] = data
+            return True
+
+    def complete_upload(self, upload_id: str) -> bool:
+        with self._lock:
+            upload = self.uploads.pop(upload_id, None)
+            if upload is None:
+                return False
+            bucket, key, parts = upload
+            self.objects[(bucket, key)] = b"".join(parts[n] for n in sorted(parts))
+            return True
+
+    def abort_upload(self, upload_id: str) -> None:
+        with self._lock:
+            self.uploads.pop(upload_id, None)
+
+
+class S3Stub:
+    """
+    In-memory S3-compatible server (path-style object GET with ranges, HEAD,
+    PUT, DELETE and multipart uploads), standing in for MinIO so the s3
+    image store backend can be benchmarked and tried without a bucket.
+    Every bucket exists; signatures are not checked.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9000, bucket: str = "checkmed-bench"):
+        self.host = host
+        self.port = port
+        self.bucket = bucket
+        self._server = _S3Server((host, port))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def requests(self) -> Counter:
+        return self._server.requests
+
+    @property
+    def objects(self) -> int:
+        return len(self._server.objects)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def env(self) -> dict[str, str]:
+        """Settings that point the golden image store at this stand-in."""
+        return {
+            "IMAGE_STORE_BACKEND": "s3",
+            "S3_BUCKET": self.bucket,
+            "S3_ENDPOINT_URL": f"http://{self.host}:{self.port}",
+            "S3_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+        }
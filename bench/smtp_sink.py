@@ -0,0 +1,80 @@
+# internal imports
+import threading
+from collections import deque
+
+# aiosmtpd is only needed for benchmarking; install with `uv sync --extra bench`
+from aiosmtpd.controller import Controller
+
+
+class _CountingHandler:
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.sessions = 0
+        self.rejected = 0
+        self.reject_next = 0
+        # Raw content of the latest messages, for tests to inspect
+        self.recent: deque[bytes] = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self.received = threading.Condition(self._lock)
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        with self._lock:
+            self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        with self._lock:
+            if self.reject_next > 0:
+                self.reject_next -= 1
+                self.rejected += 1
+                return "451 4.3.0 Temporary failure, try again later"
+            self.recent.append(envelope.content)
+            self.messages += 1
+            self.bytes += len(envelope.content)
+            self.received.notify_all()
+        return "250 Message accepted"
+
+
+class SmtpSink:
+    """
+    Local SMTP server that accepts mail, keeping only the latest messages,
+    and counts messages, bytes and SMTP sessions (a low session count means
+    connections were reused). It can also reject messages to test retries.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025):
+        self.host = host
+        self.port = port
+        self.handler = _CountingHandler()
+        self._controller = Controller(self.handler, hostname=host, port=port)
+
+    def start(self) -> None:
+        self._controller.start()
+
+    def stop(self) -> None:
+        self._controller.stop()
+
+    def reject(self, count: int) -> None:
+        """Answers the next `count` messages with a temporary failure (451), as a busy server would."""
+        with self.handler.received:
+            self.handler.reject_next = count
+
+    def wait_for(self, messages: int, timeout: float) -> bool:
+        """Blocks until `messages` emails have arrived or `timeout` seconds pass."""
+        with self.handler.received:
+            return self.handler.received.wait_for(lambda: self.handler.messages >= messages, timeout)
+
+    def env(self) -> dict[str, str]:
+        """Mail settings that point the report outbox at this sink."""
+        return {
+            "DEV_MODE": "false",
+            "MAIL_SERVER": self.host,
+            "MAIL_PORT": str(self.port),
+            "MAIL_SSL_TLS": "false",
+            "MAIL_STARTTLS": "false",
+            "MAIL_USE_CREDENTIALS": "false",
+            "MAIL_EMAIL": "bench@checkmed.local",
+            "NAFDAC_EMAIL": "nafdac@checkmed.local",
+        }
@@ -0,0 +1,357 @@
+import os
+import json
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_bool(name: str, default: str = "false") -> bool:
+    """Reads a boolean flag from the environment ("true", "1" or "yes")."""
+    return os.getenv(name, default).lower() in ("true", "1", "yes")
+
+
+# --- Gemini Client ---
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Maximum number of Gemini calls a single worker keeps in flight at once.
+# Extra calls wait for a free slot instead of opening more connections.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+
+# Hard timeout (seconds) for a single Gemini round-trip
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+
+# Bind inspection prompts to the verdict response schema (JSON mode)
+GEMINI_STRUCTURED_OUTPUT = env_bool("GEMINI_STRUCTURED_OUTPUT", "true")
+
+# Extra model calls allowed when output cannot be parsed even after local repair
+VERDICT_REQUERY_ATTEMPTS = int(os.getenv("VERDICT_REQUERY_ATTEMPTS", "1"))
+
+# How often (seconds) an in-flight call checks whether the client has gone away
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+# --- Verification Pipeline ---
+# "concurrent": box and blister inspections start together and the first
+#               HIGH-RISK verdict cancels the other (lower latency).
+# "sequential": blister inspection only runs after the box passes (lower API cost).
+INSPECTION_MODE = os.getenv("INSPECTION_MODE", "concurrent").lower()
+if INSPECTION_MODE not in ("concurrent", "sequential"):
+    raise ValueError(f"Invalid INSPECTION_MODE '{INSPECTION_MODE}'. Must be 'concurrent' or 'sequential'.")
+
+# --- Circuit Breaker and Retries ---
+# Each model gets a breaker that opens when, over the last CIRCUIT_WINDOW_SECONDS
+# (and at least CIRCUIT_MIN_CALLS calls), the share of failed calls reaches
+# CIRCUIT_ERROR_RATE or the share slower than CIRCUIT_SLOW_CALL_SECONDS reaches
+# CIRCUIT_SLOW_CALL_RATE. While open, calls fail at once; after CIRCUIT_OPEN_SECONDS
+# up to CIRCUIT_HALF_OPEN_PROBES trial calls decide whether it closes again.
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "20"))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# Timeouts, 429s and 5xx from Gemini are retried with full-jitter exponential
+# backoff, but retries may not exceed RETRY_BUDGET_RATIO of recent calls
+# (plus RETRY_BUDGET_MIN_PER_SECOND), so a struggling API is not hammered.
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "0.5"))
+GEMINI_RETRY_MAX_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_SECONDS", "8"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("RETRY_BUDGET_WINDOW_SECONDS", "10"))
+
+# What /api/verify/ answers when the model is unavailable (breaker open):
+# "queue":   turn the submission into a verification job (202 + job id)
+# "pending": 200 with a PENDING status (NAFDAC check passed, visual inspection pending)
+# "reject":  503 with Retry-After
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "queue").lower()
+if DEGRADED_MODE not in ("queue", "pending", "reject"):
+    raise ValueError(f"Invalid DEGRADED_MODE '{DEGRADED_MODE}'. Must be 'queue', 'pending' or 'reject'.")
+
+# --- Admission Control (verify endpoints) ---
+# Each client (API key, else IP address) gets a token bucket of RATE_LIMIT_BURST
+# requests refilled at RATE_LIMIT_PER_MINUTE, and at most ADMISSION_MAX_CONCURRENT
+# verifications (and so their model calls) run at once across all workers.
+# Requests over either limit get a 429 with Retry-After instead of queueing.
+ADMISSION_ENABLED = env_bool("ADMISSION_ENABLED", "true")
+# "memory": per-worker counters, "database": shared tables in the app database
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory").lower()
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "64"))
+# Retry-After (seconds) sent when every concurrency slot is taken
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+# Slots held longer than this (e.g. by a crashed worker) are reclaimed
+ADMISSION_LEASE_SECONDS = int(os.getenv("ADMISSION_LEASE_SECONDS", "300"))
+API_KEY_HEADER = os.getenv("API_KEY_HEADER", "X-API-Key")
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = env_bool("TRUST_FORWARDED_FOR", "false")
+
+# --- Model Tiering ---
+# Each inspection first runs on a fast/cheap model and is re-run on a stronger
+# model only when the first pass is unsure, says HIGH-RISK, or fails.
+MODEL_TIERING_ENABLED = env_bool("MODEL_TIERING_ENABLED", "true")
+GEMINI_FIRST_PASS_MODEL = os.getenv("GEMINI_FIRST_PASS_MODEL", "gemini-2.5-flash-lite")
+GEMINI_ESCALATION_MODEL = os.getenv("GEMINI_ESCALATION_MODEL", GEMINI_MODEL)
+# First-pass verdicts with a confidence below this are escalated
+ESCALATION_CONFIDENCE_THRESHOLD = float(os.getenv("ESCALATION_CONFIDENCE_THRESHOLD", "0.7"))
+# Have the escalation model confirm every first-pass HIGH-RISK verdict
+ESCALATE_HIGH_RISK = env_bool("ESCALATE_HIGH_RISK", "true")
+# Per-stage / per-drug-type models as JSON, most specific key wins, e.g.
+# {"blister_inspection": {"first_pass": "gemini-2.5-flash"},
+#  "box_inspection:syrup": {"first_pass": "gemini-2.5-flash-lite", "escalation": "gemini-2.5-pro"}}
+# An "escalation" of null turns escalation off for that stage.
+try:
+    INSPECTION_MODEL_OVERRIDES = json.loads(os.getenv("INSPECTION_MODEL_OVERRIDES") or "{}")
+except json.JSONDecodeError as e:
+    raise ValueError(f"Invalid INSPECTION_MODEL_OVERRIDES: {e}")
+if not isinstance(INSPECTION_MODEL_OVERRIDES, dict) or not all(
+    isinstance(value, dict) and set(value) <= {"first_pass", "escalation"}
+    for value in INSPECTION_MODEL_OVERRIDES.values()
+):
+    raise ValueError(
+        "Invalid INSPECTION_MODEL_OVERRIDES. Expected a JSON object of "
+        "{\"<stage>[:<drug_type>]\": {\"first_pass\": model, \"escalation\": model or null}}."
+    )
+
+# --- Golden Image Cache ---
+# Memory budget (bytes) for golden-standard images kept in-process; least
+# recently used drugs are evicted first once the budget is exceeded.
+GOLDEN_CACHE_MAX_BYTES = int(os.getenv("GOLDEN_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# --- Verdict Cache ---
+# "memory": per-worker cache, "database": shared table in the app database,
+# "none": disable caching of model verdicts.
+VERDICT_CACHE_BACKEND = os.getenv("VERDICT_CACHE_BACKEND", "memory").lower()
+VERDICT_CACHE_TTL_SECONDS = int(os.getenv("VERDICT_CACHE_TTL_SECONDS", "3600"))
+# Maximum number of verdicts the in-memory backend keeps per worker
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "10000"))
+
+# --- Context Cache (model-side cached golden images + stage prompt) ---
+# "gemini": each drug's golden image and stage prompt are uploaded once as
+# cached content and referenced by every inspection of that drug,
+# "none": send them inline with every call. Contexts smaller than the
+# model's minimum cache size cannot be cached and are always sent inline.
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "gemini").lower()
+if CONTEXT_CACHE_BACKEND not in ("gemini", "none"):
+    raise ValueError(f"Invalid CONTEXT_CACHE_BACKEND '{CONTEXT_CACHE_BACKEND}'. Must be 'gemini' or 'none'.")
+# Lifetime of a cached context; contexts still in use are extended by this
+# much once they have less than CONTEXT_CACHE_REFRESH_SECONDS left
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+CONTEXT_CACHE_REFRESH_SECONDS = int(os.getenv("CONTEXT_CACHE_REFRESH_SECONDS", "300"))
+if not 0 < CONTEXT_CACHE_REFRESH_SECONDS < CONTEXT_CACHE_TTL_SECONDS:
+    raise ValueError("CONTEXT_CACHE_REFRESH_SECONDS must be positive and below CONTEXT_CACHE_TTL_SECONDS.")
+# Cached contexts each worker keeps (least recently used are deleted first)
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "200"))
+# After a failed create, the context is sent inline for this long before retrying
+CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("CONTEXT_CACHE_RETRY_SECONDS", "600"))
+# Minimum tokens the model accepts in a cached context, as JSON by model name
+# prefix (longest matching prefix wins). Contexts are counted before they are
+# created and smaller ones are never created.
+try:
+    CONTEXT_CACHE_MIN_TOKENS = json.loads(
+        os.getenv("CONTEXT_CACHE_MIN_TOKENS") or '{"gemini": 1024, "gemini-2.5-pro": 4096}'
+    )
+except json.JSONDecodeError as e:
+    raise ValueError(f"Invalid CONTEXT_CACHE_MIN_TOKENS: {e}")
+if not isinstance(CONTEXT_CACHE_MIN_TOKENS, dict) or not all(
+    isinstance(value, int) for value in CONTEXT_CACHE_MIN_TOKENS.values()
+):
+    raise ValueError("Invalid CONTEXT_CACHE_MIN_TOKENS. Expected a JSON object of {\"<model prefix>\": tokens}.")
+
+# --- Pre-screen (local perceptual-hash check before the Package Inspector) ---
+PRESCREEN_ENABLED = env_bool("PRESCREEN_ENABLED", "true")
+# Grayscale standard deviation below which an upload is treated as blank
+PRESCREEN_BLANK_STDDEV = float(os.getenv("PRESCREEN_BLANK_STDDEV", "6"))
+# A box is a clear mismatch only when BOTH its dHash distance to the golden box
+# is at least this many bits (out of 64) ...
+PRESCREEN_MISMATCH_DHASH_BITS = int(os.getenv("PRESCREEN_MISMATCH_DHASH_BITS", "40"))
+# ... AND its colour histogram similarity (0-1) is at most this value
+PRESCREEN_MISMATCH_HIST_SIMILARITY = float(os.getenv("PRESCREEN_MISMATCH_HIST_SIMILARITY", "0.30"))
+# Uploads within this dHash distance of a previously verified submission skip
+# the Package Inspector model call
+PRESCREEN_DUPLICATE_DHASH_BITS = int(os.getenv("PRESCREEN_DUPLICATE_DHASH_BITS", "3"))
+PRESCREEN_DUPLICATE_HIST_SIMILARITY = float(os.getenv("PRESCREEN_DUPLICATE_HIST_SIMILARITY", "0.95"))
+# Number of verified submissions remembered per drug for the fast path
+PRESCREEN_KNOWN_GOOD_PER_DRUG = int(os.getenv("PRESCREEN_KNOWN_GOOD_PER_DRUG", "50"))
+
+# --- Reference Images (local embeddings + vector index) ---
+# A drug can have several golden reference images (packaging revisions,
+# angles), each described by a locally computed embedding. Verification
+# compares an upload with the claimed drug's closest reference, rejects
+# boxes that clearly show another registered product before any model call,
+# and can identify the product from the box photo when no drug name is given.
+REFERENCE_INDEX_ENABLED = env_bool("REFERENCE_INDEX_ENABLED", "true")
+# Directory of the memory-mapped vector index snapshot (one per worker host)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+REFERENCE_MAX_PER_DRUG = int(os.getenv("REFERENCE_MAX_PER_DRUG", "20"))
+# Identification names a product only when its similarity (0-1) is at least
+# IDENTIFY_MIN_SCORE and beats the next product by IDENTIFY_MIN_MARGIN
+IDENTIFY_MIN_SCORE = float(os.getenv("IDENTIFY_MIN_SCORE", "0.75"))
+IDENTIFY_MIN_MARGIN = float(os.getenv("IDENTIFY_MIN_MARGIN", "0.05"))
+IDENTIFY_TOP_K = int(os.getenv("IDENTIFY_TOP_K", "5"))
+# A box is HIGH-RISK without a model call when its similarity to the claimed
+# drug's references is at most REFERENCE_MISMATCH_MAX_SCORE and another
+# product's references score at least REFERENCE_MISMATCH_MARGIN higher
+REFERENCE_MISMATCH_MAX_SCORE = float(os.getenv("REFERENCE_MISMATCH_MAX_SCORE", "0.6"))
+REFERENCE_MISMATCH_MARGIN = float(os.getenv("REFERENCE_MISMATCH_MARGIN", "0.25"))
+# Additional (non-primary) reference images kept in memory per worker
+REFERENCE_IMAGE_CACHE_ENTRIES = int(os.getenv("REFERENCE_IMAGE_CACHE_ENTRIES", "128"))
+
+# --- Image Normalization ---
+# Uploads are decoded, EXIF-oriented, downscaled to fit IMAGE_MAX_DIMENSION
+# and re-encoded as JPEG (dropping EXIF metadata) before use.
+IMAGE_NORMALIZATION_ENABLED = env_bool("IMAGE_NORMALIZATION_ENABLED", "true")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# "thread" or "process" pool used for decoding/re-encoding
+IMAGE_POOL = os.getenv("IMAGE_POOL", "thread").lower()
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# --- Golden Image Storage ---
+# Golden images are stored content-addressed (sha256 of the uploaded file),
+# so a picture registered for several drugs is kept once, each with an
+# "original", "normalized" and "thumbnail" rendition.
+# "local": files under IMAGE_STORE_DIR (a single node or a shared volume)
+# "s3":    an S3-compatible bucket (AWS, MinIO, ...) read through a local
+#          cache in IMAGE_CACHE_DIR; credentials come from the usual AWS_* variables
+IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "local").lower()
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "image_store")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "golden-images/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+# Disk budget of the read-through cache; least recently read objects go first
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Longest side (pixels) of the thumbnail rendition
+THUMBNAIL_MAX_DIMENSION = int(os.getenv("THUMBNAIL_MAX_DIMENSION", "256"))
+
+# --- Batch Verification ---
+# Maximum number of items accepted in one /api/verify/batch upload
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+# Number of batch items verified at the same time per request
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "8"))
+
+# --- Verification Jobs ---
+# Number of background workers processing queued verification jobs per process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Submissions are rejected with 503 once this many jobs are waiting on this process
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+# A "running" job not updated for this long is assumed orphaned by a restart and re-run
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# Directory where uploaded job images are kept until the job finishes
+JOBS_DIR = os.getenv("JOBS_DIR", "verification_jobs")
+# Callback delivery attempts and timeout (seconds) per attempt
+JOB_CALLBACK_ATTEMPTS = int(os.getenv("JOB_CALLBACK_ATTEMPTS", "3"))
+JOB_CALLBACK_TIMEOUT_SECONDS = float(os.getenv("JOB_CALLBACK_TIMEOUT_SECONDS", "10"))
+# Callbacks are only sent to hosts resolving to public addresses. When set, only
+# these hosts are allowed instead (comma-separated; ".example.com" also matches
+# its subdomains), private addresses included
+JOB_CALLBACK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+# --- Verification Audit Log ---
+# Every verification (verify endpoint, batch items, jobs) is recorded as a
+# VerificationEvent. Events are buffered in memory and written in batches by
+# a background task, never on the request path.
+AUDIT_LOG_ENABLED = env_bool("AUDIT_LOG_ENABLED", "true")
+# Buffered events are written as soon as this many are waiting (one INSERT
+# per batch) and otherwise at least every AUDIT_FLUSH_INTERVAL_SECONDS
+AUDIT_FLUSH_BATCH_SIZE = int(os.getenv("AUDIT_FLUSH_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+# Events kept in memory per process while the database is slow or down; newer
+# events are dropped (and counted) beyond this
+AUDIT_BUFFER_MAX_EVENTS = int(os.getenv("AUDIT_BUFFER_MAX_EVENTS", "50000"))
+# Rows fetched per query when streaming an export
+AUDIT_EXPORT_PAGE_SIZE = int(os.getenv("AUDIT_EXPORT_PAGE_SIZE", "1000"))
+
+# --- Bulk Catalog Ingest ---
+# Directory where uploaded ingest manifests and image archives are kept until the run finishes
+INGEST_DIR = os.getenv("INGEST_DIR", "catalog_ingest")
+# Rows upserted per transaction; progress is checkpointed after each chunk
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "200"))
+# Rows of a chunk whose images are normalized and stored at the same time
+INGEST_PARALLEL = int(os.getenv("INGEST_PARALLEL", "8"))
+# Largest accepted image archive upload (bytes)
+INGEST_MAX_ARCHIVE_BYTES = int(os.getenv("INGEST_MAX_ARCHIVE_BYTES", str(4 * 1024 * 1024 * 1024)))
+# A "running" ingest not checkpointed for this long is assumed orphaned and resumed
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "900"))
+
+# --- Drug Catalog Index ---
+# How often (seconds) a worker checks the shared catalog version for
+# registrations made by other workers
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "5"))
+# A lookup miss checks again once the last check is this old (seconds), so
+# misspelled names cannot send every request to the database
+CATALOG_MISS_CHECK_SECONDS = float(os.getenv("CATALOG_MISS_CHECK_SECONDS", "1"))
+
+# --- Uploads ---
+# Largest accepted image upload (bytes); enforced while the upload is streamed to disk
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+# Size of each chunk read from the request and written to disk
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Directory for spooled uploads (defaults to the system temp directory)
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+# --- Report Email ---
+NAFDAC_EMAIL = os.getenv("NAFDAC_EMAIL")
+# Development mode flag - set to False when email is configured
+DEV_MODE = env_bool("DEV_MODE", "true")
+MAIL_USERNAME = os.getenv("MAIL_EMAIL", "")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "")
+MAIL_FROM = os.getenv("MAIL_EMAIL", "")
+MAIL_FROM_NAME = "ChecMed Report"
+# Defaults target Gmail over SSL; point these at a local SMTP stand-in
+# (e.g. aiosmtpd on localhost:1025 with TLS and credentials off) for testing
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", "465"))
+MAIL_SSL_TLS = env_bool("MAIL_SSL_TLS", "true")
+MAIL_STARTTLS = env_bool("MAIL_STARTTLS", "false")
+MAIL_USE_CREDENTIALS = env_bool("MAIL_USE_CREDENTIALS", "true")
+MAIL_VALIDATE_CERTS = env_bool("MAIL_VALIDATE_CERTS", "true")
+
+# --- Report Outbox ---
+# Directory holding report attachments until their email has been sent
+REPORT_OUTBOX_DIR = os.getenv("REPORT_OUTBOX_DIR", "report_outbox")
+# Maximum reports sent per pass over one SMTP connection
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "20"))
+# Delivery attempts before a report is marked failed; retries back off
+# exponentially from REPORT_RETRY_BASE_SECONDS (with jitter)
+REPORT_MAX_ATTEMPTS = int(os.getenv("REPORT_MAX_ATTEMPTS", "8"))
+REPORT_RETRY_BASE_SECONDS = float(os.getenv("REPORT_RETRY_BASE_SECONDS", "30"))
+# How often the sender looks for due reports when it has not been woken up
+REPORT_POLL_SECONDS = float(os.getenv("REPORT_POLL_SECONDS", "10"))
+# Close the pooled SMTP connection after this long without sending
+REPORT_SMTP_IDLE_SECONDS = float(os.getenv("REPORT_SMTP_IDLE_SECONDS", "60"))
+# A report stuck in "sending" this long (e.g. after a crash) is retried
+REPORT_STALE_SECONDS = int(os.getenv("REPORT_STALE_SECONDS", "600"))
+# If > 0, pending reports are grouped into one digest email every N seconds
+REPORT_DIGEST_SECONDS = float(os.getenv("REPORT_DIGEST_SECONDS", "0"))
+
+# --- Report Analytics ---
+# Reports are counted per day in this time zone for /api/report/stats
+REPORT_STATS_TIMEZONE = os.getenv("REPORT_STATS_TIMEZONE", "Africa/Lagos")
+try:
+    REPORT_STATS_ZONE = ZoneInfo(REPORT_STATS_TIMEZONE)
+except (ZoneInfoNotFoundError, ValueError):
+    raise ValueError(f"Invalid REPORT_STATS_TIMEZONE '{REPORT_STATS_TIMEZONE}'. Must be an IANA time zone name.")
+# Days covered by /api/report/stats when no range is given
+REPORT_STATS_DEFAULT_DAYS = int(os.getenv("REPORT_STATS_DEFAULT_DAYS", "30"))
+
+# --- Logging ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction (0-1) of Gemini responses whose full payload is logged
+LOG_MODEL_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_MODEL_PAYLOAD_SAMPLE_RATE", "0.01"))
+# User-provided fields whose values are replaced with "[REDACTED]" in logs
+LOG_REDACT_FIELDS = frozenset(
+    field.strip()
+    for field in os.getenv(
+        "LOG_REDACT_FIELDS",
+        "report_reason,report_location,upload_filename,callback_url,nafdac_number,provided_nafdac"
+    ).split(",")
+    if field.strip()
+)
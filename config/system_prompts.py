@@ -5,11 +5,14 @@ Respond ONLY with a single, minified JSON object in the format: {\"status\": \"V
 \"reason\": \"your_concise_analysis\"}"
 """
 
+# The inspection prompts below are sent with JSON mode and bound to the
+# services.verdicts.ModelVerdict response schema (status, reason, confidence).
 PACKAGE_INSPECTOR = """
 You are an expert visual inspector for pharmaceutical packaging. Your job is to find subtle counterfeit 
 differences between two images. Ignore differences in lighting, angles, or reflections. Focus ONLY on print 
 quality, font weight, logo placement, and color saturation. Respond ONLY with a single, minified JSON object
-in the format: {\"status\": \"VERIFIED\" or \"HIGH-RISK\", \"reason\": \"your_concise_analysis\"}
+in the format: {\"status\": \"VERIFIED\" or \"HIGH-RISK\", \"reason\": \"your_concise_analysis\",
+\"confidence\": a number from 0 to 1 for how certain you are of the status}
 if the status of the response is high-risk, let them know that this is a Package Inspector Check
 """
 
@@ -22,6 +25,7 @@ glare from the foil. Focus ONLY on the underlying:
 2. Logo clarity and placement.
 3. Color and pattern of the foil or backing.
 Respond ONLY with a single, minified JSON object in the format: 
-{"status": "VERIFIED" or "HIGH-RISK", "reason": "your_concise_analysis_of_print_and_pattern"}
+{"status": "VERIFIED" or "HIGH-RISK", "reason": "your_concise_analysis_of_print_and_pattern",
+"confidence": a number from 0 to 1 for how certain you are of the status}
 if the status of the response is high-risk, let them know that this is a Blister Pack Check
 """
\ No newline at end of file
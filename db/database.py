@@ -1,18 +1,82 @@
 import os
+import logging
 from dotenv import load_dotenv
+from sqlalchemy import inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-load_dotenv()  
+load_dotenv()
+logger = logging.getLogger(__name__)
 
 RENDER_DATABASE_URL = os.getenv("RENDER_DATABASE_URL")
 
 SQLITE_DATABASE_NAME = "check_med.db"
 SQLITE_DATABASE_URL = f"sqlite:///{SQLITE_DATABASE_NAME}"
 
+# --- Connection Pool Settings ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "yes")
+# Server-side statement timeout (Postgres only); 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
 
 # Use the render database URL if provided, otherwise fall back to the local SQLite URL
-database_url = RENDER_DATABASE_URL 
-engine = create_engine(database_url)
+database_url = RENDER_DATABASE_URL or SQLITE_DATABASE_URL
+# Render hands out "postgres://" URLs, which SQLAlchemy no longer accepts
+if database_url.startswith("postgres://"):
+    database_url = "postgresql://" + database_url[len("postgres://"):]
+
+IS_SQLITE = database_url.startswith("sqlite")
+
+
+def _pool_options() -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if not IS_SQLITE:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        )
+    return options
+
+
+def _sync_connect_args() -> dict:
+    if IS_SQLITE:
+        # Sessions are used from worker threads as well as the event loop thread
+        return {"check_same_thread": False}
+    if DB_STATEMENT_TIMEOUT_MS:
+        return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def _async_url_and_connect_args():
+    """Maps the configured URL onto its async driver (asyncpg / aiosqlite)."""
+    url = make_url(database_url)
+    connect_args = {}
+    if IS_SQLITE:
+        return url.set(drivername="sqlite+aiosqlite"), connect_args
+
+    # asyncpg does not understand libpq's sslmode query parameter
+    sslmode = url.query.get("sslmode")
+    if sslmode:
+        url = url.difference_update_query(["sslmode"])
+        connect_args["ssl"] = sslmode  # asyncpg accepts the same mode names
+    if DB_STATEMENT_TIMEOUT_MS:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return url.set(drivername="postgresql+asyncpg"), connect_args
+
+
+engine = create_engine(database_url, connect_args=_sync_connect_args(), **_pool_options())
+
+_async_url, _async_connect_args = _async_url_and_connect_args()
+async_engine = create_async_engine(_async_url, connect_args=_async_connect_args, **_pool_options())
 
 
 # ✅ Dependency to get DB session in routes
@@ -20,6 +84,48 @@ def get_session() :
     with Session(engine) as session:
         yield session
 
+# ✅ Async dependency: queries are awaited instead of blocking the event loop
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+# ✅ INSERT ... ON CONFLICT for bulk writes
+def upsert(model, rows: list[dict], conflict: list[str], update_columns: list[str], increment_columns: list[str] = ()):
+    """
+    INSERT ... ON CONFLICT DO UPDATE of `update_columns` for the configured
+    database (SQLite or Postgres); DO NOTHING when there are none to update.
+    `increment_columns` are added to the existing values instead of replacing them.
+    """
+    if engine.dialect.name == "postgresql":
+        statement = postgresql.insert(model).values(rows)
+    elif engine.dialect.name == "sqlite":
+        statement = sqlite.insert(model).values(rows)
+    else:
+        raise ValueError(f"Upserts are not supported on the '{engine.dialect.name}' database.")
+    set_ = {column: statement.excluded[column] for column in update_columns}
+    set_.update({column: statement.table.c[column] + statement.excluded[column] for column in increment_columns})
+    if not set_:
+        return statement.on_conflict_do_nothing(index_elements=conflict)
+    return statement.on_conflict_do_update(index_elements=conflict, set_=set_)
+
 # ✅ Function to create tables
 def init_db():
-    SQLModel.metadata.create_all(bind=engine)
\ No newline at end of file
+    SQLModel.metadata.create_all(bind=engine)
+
+    # create_all skips indexes on tables that already exist; add any new ones
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                # e.g. duplicate rows under a new unique index; upserts that rely on it fail until it exists
+                logger.error("Could not create index %s: %s", index.name, e)
+
+
+def has_unique_index(model, columns: list[str]) -> bool:
+    """Whether the model's table has a unique index or constraint on exactly `columns`."""
+    inspector = inspect(engine)
+    table = model.__tablename__
+    keys = [i["column_names"] for i in inspector.get_indexes(table) if i["unique"]]
+    keys += [c["column_names"] for c in inspector.get_unique_constraints(table)]
+    return any(set(key) == set(columns) for key in keys)
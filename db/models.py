@@ -1,12 +1,18 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 # -------------------
 # MEDICINE MODEL
 # -------------------
 class CreateMedicine(SQLModel, table=True):
+    __table_args__ = (
+        # One registration per (name, formulation); also serves verify lookups
+        Index("ix_createmedicine_drug_name_drug_type", "drug_name", "drug_type", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     drug_name: str = Field(index=True)
     drug_type: str  # "tablet" or "syrup"
@@ -16,3 +22,188 @@ class CreateMedicine(SQLModel, table=True):
     golden_blister_image_path: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+
+# -------------------
+# VERDICT CACHE MODEL
+# -------------------
+class VerdictCacheEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # sha256 of prompt, model and images
+    verdict: str  # JSON-encoded model verdict
+    expires_at: datetime = Field(index=True)
+
+# -------------------
+# IMAGE DESCRIPTOR MODEL
+# -------------------
+class MedicineDescriptor(SQLModel, table=True):
+    # Perceptual descriptors of a drug's golden box image, computed at registration
+    medicine_id: int = Field(foreign_key="createmedicine.id", primary_key=True)
+    box_dhash: str  # 64-bit difference hash as 16 hex characters
+    box_histogram: str  # comma-separated 64-bin RGB colour histogram
+    box_stddev: float  # grayscale standard deviation
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# -------------------
+# VERIFICATION JOB MODEL
+# -------------------
+class VerificationJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)  # uuid4 hex
+    status: str = Field(default="queued", index=True)  # queued, running, completed, failed
+    drug_name: str
+    drug_type: str
+    nafdac_number: str
+    box_image_path: str
+    blister_image_path: Optional[str] = None
+    callback_url: Optional[str] = None
+    status_code: Optional[int] = None  # HTTP status the synchronous endpoint would have returned
+    result: Optional[str] = None  # JSON-encoded verdict or error detail
+    attempts: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+# -------------------
+# CATALOG VERSION MODEL
+# -------------------
+class CatalogVersion(SQLModel, table=True):
+    # Single row bumped on every registration so workers know to reload their catalog
+    id: int = Field(default=1, primary_key=True)
+    version: int = 0
+
+# -------------------
+# REPORT OUTBOX MODEL
+# -------------------
+class ReportOutbox(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    drug_name: str
+    nafdac_number: str
+    reason: str
+    location: str
+    attachment_paths: str = "[]"  # JSON list of files under REPORT_OUTBOX_DIR
+    status: str = Field(default="pending", index=True)  # pending, sending, sent, failed
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
+
+# -------------------
+# RATE LIMIT MODELS
+# -------------------
+class RateLimitBucket(SQLModel, table=True):
+    # Token bucket of one client, shared by every worker (ADMISSION_BACKEND=database)
+    key: str = Field(primary_key=True)  # "key:<sha256 prefix>" or "ip:<address>"
+    tokens: float
+    updated_at: float = Field(index=True)  # unix time of the last refill
+
+
+class AdmissionSlot(SQLModel, table=True):
+    # One of ADMISSION_MAX_CONCURRENT verification slots, leased until expires_at
+    slot: int = Field(primary_key=True)
+    holder: Optional[str] = None  # lease id while taken
+    expires_at: Optional[datetime] = None
+
+# -------------------
+# CATALOG INGEST MODELS
+# -------------------
+class IngestRun(SQLModel, table=True):
+    id: str = Field(primary_key=True)  # uuid4 hex
+    status: str = Field(default="queued", index=True)  # queued, running, completed, failed
+    source: str  # manifest file name, for display
+    manifest_path: str
+    images_path: str  # zip archive or directory
+    rows_done: int = 0  # manifest rows committed so far; a resumed run skips them
+    rows_ok: int = 0
+    rows_failed: int = 0
+    error: Optional[str] = None  # why the run stopped, if it failed as a whole
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class IngestRowError(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    run_id: str = Field(foreign_key="ingestrun.id", index=True)
+    row: int  # 1-based data row of the manifest
+    drug_name: Optional[str] = None
+    error: str
+
+# -------------------
+# REFERENCE IMAGE MODEL
+# -------------------
+class ReferenceImage(SQLModel, table=True):
+    # A golden view of a drug (packaging revision, angle) with its image embedding.
+    # The drug's own golden_*_image_path images are references too.
+    __table_args__ = (
+        Index("ix_referenceimage_medicine_id_role_image_ref", "medicine_id", "role", "image_ref", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    medicine_id: int = Field(foreign_key="createmedicine.id")
+    role: str  # "box" or "blister"
+    image_ref: str  # content address in the image store (or a legacy file path)
+    label: Optional[str] = None  # e.g. "2024 packaging", "side view"
+    embedding: bytes  # little-endian float32 vector, see services.embeddings
+    embedding_version: int = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# -------------------
+# VERIFICATION EVENT MODEL
+# -------------------
+class VerificationEvent(SQLModel, table=True):
+    # Append-only audit record of one verification; never updated or deleted by the app
+    __table_args__ = (
+        # Time-range exports and per-drug exports, both paged by (created_at, id)
+        Index("ix_verificationevent_created_at_id", "created_at", "id"),
+        Index("ix_verificationevent_medicine_id_created_at_id", "medicine_id", "created_at", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime  # when the verification finished (UTC)
+    request_id: Optional[str] = None  # X-Request-ID, or "job-<id>" for jobs
+    source: str  # "verify", "batch" or "job"
+    medicine_id: Optional[int] = None  # None when the drug could not be resolved
+    drug_name: Optional[str] = None  # resolved name, else as submitted
+    drug_type: Optional[str] = None
+    nafdac_number: str
+    status: str  # VERIFIED, HIGH-RISK, PENDING, REJECTED (bad input / unknown drug), CANCELLED or ERROR
+    status_code: int  # HTTP status of the answer
+    reason: Optional[str] = None
+    duration_ms: float
+    stages: str = "{}"  # JSON {stage: {"ms": duration, "status": verdict}}
+    model_outputs: str = "[]"  # JSON list of model verdicts with their stage and model
+
+# -------------------
+# DRUG REPORT MODELS
+# -------------------
+class DrugReport(SQLModel, table=True):
+    # A counterfeit report as submitted, with normalized keys for lookups
+    __table_args__ = (
+        Index("ix_drugreport_drug_key_created_at", "drug_key", "created_at"),
+        Index("ix_drugreport_nafdac_key_created_at", "nafdac_key", "created_at"),
+        Index("ix_drugreport_location_key_created_at", "location_key", "created_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    outbox_id: Optional[int] = Field(default=None, foreign_key="reportoutbox.id", unique=True)
+    drug_name: str
+    drug_key: str  # see services.report_stats.normalize_drug
+    nafdac_number: str
+    nafdac_key: str
+    location: str
+    location_key: str  # see services.report_stats.normalize_location
+    reason: str
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class ReportDailyCount(SQLModel, table=True):
+    # Reports per (day, location, drug), incremented with every stored report
+    __table_args__ = (
+        Index("ix_reportdailycount_day_location_key_drug_key", "day", "location_key", "drug_key", unique=True),
+        Index("ix_reportdailycount_drug_key_day", "drug_key", "day"),
+        Index("ix_reportdailycount_location_key_day", "location_key", "day"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: date  # in REPORT_STATS_TIMEZONE
+    location_key: str
+    drug_key: str
+    reports: int = 0
@@ -1,19 +1,71 @@
 # local imports
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
 # external imports
-from api import verify, report, register
-from db.database import init_db
+from api import verify, report, register, metrics, images, ingest, audit
+from db.database import init_db, engine, async_engine
+from services.audit import start_audit_log, stop_audit_log
+from services.catalog import catalog
+from services.gemini import context_cache
+from services.golden_cache import warm_golden_cache
+from services.ingest import start_ingest_worker, stop_ingest_worker
+from services.jobs import start_job_workers, stop_job_workers
+from services.log import configure_logging, bind_request_id
+from services.outbox import start_report_sender, stop_report_sender
+from services.references import reference_index, start_reference_backfill, stop_reference_backfill
+from services.report_stats import start_report_backfill, stop_report_backfill
 
 load_dotenv()
 
+# JSON logs written from a background thread (never blocks the event loop)
+configure_logging()
+
 # Initialize database tables
 init_db()
 
+# Load the drug catalog index used by verification lookups
+catalog.load()
+
+# Map the reference image vector index and catch up with the database
+reference_index.load()
+
+# Preload golden standard images so verification never reads them from disk
+warm_golden_cache(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers for /api/verify/jobs (also resumes unfinished jobs)
+    await start_job_workers()
+    # Delivers queued NAFDAC report emails (also resumes unsent reports)
+    await start_report_sender()
+    # Bulk catalog ingest runs (also resumes interrupted runs)
+    await start_ingest_worker()
+    # Reference images for drugs registered before references existed
+    await start_reference_backfill()
+    # Writes buffered verification audit events in batches
+    await start_audit_log()
+    # Counts reports queued before they were stored for analytics
+    await start_report_backfill()
+    yield
+    await stop_reference_backfill()
+    await stop_report_backfill()
+    await stop_ingest_worker()
+    await stop_report_sender()
+    await stop_job_workers()
+    # After the verification workers, so their last events are written too
+    await stop_audit_log()
+    # Model-side contexts of this worker would otherwise be billed until they expire
+    await context_cache.close()
+    await async_engine.dispose()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="CheckMed Verification API",
     description="""
     **CheckMed** is a pharmaceutical verification API that uses AI to authenticate medications 
@@ -58,6 +110,16 @@ if not API_KEY:
 app.include_router(verify.router)
 app.include_router(report.router)
 app.include_router(register.router)
+app.include_router(images.router)
+app.include_router(ingest.router)
+app.include_router(audit.router)
+app.include_router(metrics.router)
+
+# Latency histograms and in-flight gauges per route, exported on /metrics
+app.middleware("http")(metrics.track_requests)
+
+# Tags every log line of a request with its X-Request-ID (outermost middleware)
+app.middleware("http")(bind_request_id)
 
 
 
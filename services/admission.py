@@ -0,0 +1,301 @@
+# internal imports
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Request
+from sqlalchemy import case, delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, update, or_
+
+# external imports
+from config.settings import (
+    ADMISSION_ENABLED,
+    ADMISSION_BACKEND,
+    RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_RETRY_AFTER_SECONDS,
+    ADMISSION_LEASE_SECONDS,
+    API_KEY_HEADER,
+    TRUST_FORWARDED_FOR,
+)
+from db.database import engine
+from db.models import RateLimitBucket, AdmissionSlot
+from services.metrics import ADMISSION_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Idle buckets are dropped once they would have refilled completely anyway
+PRUNE_INTERVAL_SECONDS = 60
+# How often work already admitted checks for a free concurrency slot
+SLOT_POLL_SECONDS = 0.5
+
+
+def client_key(request: Request) -> str:
+    """Who a request is rate limited as: its API key (hashed) if sent, else its IP."""
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return "ip:" + forwarded.split(",")[0].strip()
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+@dataclass(frozen=True)
+class Lease:
+    slot: int
+    holder: str
+
+
+# --- Backends ---
+class MemoryAdmissionBackend:
+    """Per-worker token buckets and concurrency counter."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._in_flight = 0
+        self._pruned_at = time.monotonic()
+
+    def _prune(self, now: float, rate: float, burst: int) -> None:
+        if now - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = now
+        full_after = burst / rate
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        self._prune(now, rate, burst)
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    async def acquire_slot(self, limit: int) -> Lease | None:
+        if self._in_flight >= limit:
+            return None
+        self._in_flight += 1
+        return Lease(slot=self._in_flight, holder="memory")
+
+    async def release_slot(self, lease: Lease) -> None:
+        self._in_flight -= 1
+
+
+class DatabaseAdmissionBackend:
+    """
+    Token buckets and concurrency slots in the app database, shared by every
+    worker. Buckets are refilled and debited in one conditional UPDATE, and
+    slots are leased with a conditional claim that expires after
+    ADMISSION_LEASE_SECONDS, so a crashed worker cannot hold them forever.
+    Queries run in a worker thread so they never block the event loop.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._slots_ready = 0
+        self._pruned_at = 0.0
+
+    def _take_token(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+        refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate
+        available = case((refilled > burst, burst), else_=refilled)
+        with Session(self.engine) as session:
+            if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                self._pruned_at = now
+                session.execute(delete(RateLimitBucket).where(RateLimitBucket.updated_at < now - burst / rate))
+                session.commit()
+
+            rowcount = session.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.key == key)
+                .where(available >= 1)
+                .values(tokens=available - 1, updated_at=now)
+            ).rowcount
+            session.commit()
+            if rowcount:
+                return 0.0
+
+            bucket = session.get(RateLimitBucket, key)
+            if bucket is None:
+                try:
+                    session.add(RateLimitBucket(key=key, tokens=burst - 1, updated_at=now))
+                    session.commit()
+                    return 0.0
+                except IntegrityError:
+                    # Another worker created it first; its row decides
+                    session.rollback()
+                    return self._take_token(key, rate, burst)
+            tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * rate)
+            return max(0.0, (1 - tokens) / rate)
+
+    def _ensure_slots(self, limit: int) -> None:
+        with Session(self.engine) as session:
+            existing = set(session.exec(select(AdmissionSlot.slot).where(AdmissionSlot.slot < limit)).all())
+            for slot in range(limit):
+                if slot not in existing:
+                    session.add(AdmissionSlot(slot=slot))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()  # created concurrently by another worker
+        self._slots_ready = limit
+
+    def _acquire_slot(self, limit: int) -> Lease | None:
+        if self._slots_ready < limit:
+            self._ensure_slots(limit)
+        now = datetime.utcnow()
+        free = or_(AdmissionSlot.holder.is_(None), AdmissionSlot.expires_at < now)
+        holder = uuid.uuid4().hex
+        with Session(self.engine) as session:
+            candidates = list(session.exec(
+                select(AdmissionSlot.slot).where(AdmissionSlot.slot < limit).where(free).limit(8)
+            ).all())
+            # Workers racing for the same first free slot would mostly lose
+            random.shuffle(candidates)
+            for slot in candidates:
+                rowcount = session.execute(
+                    update(AdmissionSlot)
+                    .where(AdmissionSlot.slot == slot)
+                    .where(free)
+                    .values(holder=holder, expires_at=now + timedelta(seconds=ADMISSION_LEASE_SECONDS))
+                ).rowcount
+                session.commit()
+                if rowcount:
+                    return Lease(slot=slot, holder=holder)
+        return None
+
+    def _release_slot(self, lease: Lease) -> None:
+        with Session(self.engine) as session:
+            session.execute(
+                update(AdmissionSlot)
+                .where(AdmissionSlot.slot == lease.slot)
+                .where(AdmissionSlot.holder == lease.holder)
+                .values(holder=None, expires_at=None)
+            )
+            session.commit()
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        return await asyncio.to_thread(self._take_token, key, rate, burst)
+
+    async def acquire_slot(self, limit: int) -> Lease | None:
+        return await asyncio.to_thread(self._acquire_slot, limit)
+
+    async def release_slot(self, lease: Lease) -> None:
+        await asyncio.to_thread(self._release_slot, lease)
+
+
+# --- Admission Front ---
+class AdmissionController:
+    """
+    Decides whether a verify request may start. Rejections are fast 429s
+    with Retry-After; backend errors are logged and the request admitted,
+    since admission control must never take the service down by itself.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def check_rate(self, request: Request) -> None:
+        """Debits the client's token bucket or raises 429."""
+        if not self.enabled:
+            return
+        key = client_key(request)
+        try:
+            wait_seconds = await self.backend.take_token(key, RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST)
+        except Exception as e:
+            logger.warning("Rate limiter error: %s", e)
+            return
+        if wait_seconds > 0:
+            ADMISSION_REJECTIONS.labels(reason="rate_limited").inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many verification requests. Please slow down.",
+                headers={"Retry-After": str(max(1, round(wait_seconds + 0.5)))},
+            )
+
+    async def acquire(self) -> Lease | None:
+        """Takes a concurrency slot or raises 429. Returns None if no slot needs releasing."""
+        if not self.enabled:
+            return None
+        try:
+            lease = await self.backend.acquire_slot(ADMISSION_MAX_CONCURRENT)
+        except Exception as e:
+            logger.warning("Admission slot error: %s", e)
+            return None
+        if lease is None:
+            ADMISSION_REJECTIONS.labels(reason="over_capacity").inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Verification service is at capacity. Please retry shortly.",
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+        return lease
+
+    async def wait_for_slot(self) -> Lease | None:
+        """
+        Takes a concurrency slot, polling while the service is at capacity
+        instead of rejecting (for work a request was already admitted for).
+        """
+        if not self.enabled:
+            return None
+        while True:
+            try:
+                lease = await self.backend.acquire_slot(ADMISSION_MAX_CONCURRENT)
+            except Exception as e:
+                logger.warning("Admission slot error: %s", e)
+                return None
+            if lease is not None:
+                return lease
+            await asyncio.sleep(SLOT_POLL_SECONDS * random.uniform(0.5, 1.5))
+
+    async def release(self, lease: Lease | None) -> None:
+        if lease is None:
+            return
+        try:
+            await self.backend.release_slot(lease)
+        except Exception as e:
+            # The lease expires on its own after ADMISSION_LEASE_SECONDS
+            logger.warning("Admission slot release error: %s", e)
+
+
+def _make_backend():
+    if not ADMISSION_ENABLED:
+        return None
+    if ADMISSION_BACKEND == "memory":
+        return MemoryAdmissionBackend()
+    if ADMISSION_BACKEND == "database":
+        return DatabaseAdmissionBackend(engine)
+    raise ValueError(f"Invalid ADMISSION_BACKEND '{ADMISSION_BACKEND}'. Must be 'memory' or 'database'.")
+
+
+admission = AdmissionController(_make_backend())
+
+
+# --- FastAPI Dependencies ---
+async def rate_limit(request: Request) -> None:
+    """Per-client token bucket only (for endpoints that just queue work)."""
+    await admission.check_rate(request)
+
+
+async def admit_verification(request: Request):
+    """Per-client token bucket plus a global concurrency slot held until the response is sent."""
+    await admission.check_rate(request)
+    lease = await admission.acquire()
+    try:
+        yield
+    finally:
+        await admission.release(lease)
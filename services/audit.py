@@ -0,0 +1,285 @@
+# internal imports
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert, and_, or_
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# external imports
+from config.settings import (
+    AUDIT_LOG_ENABLED,
+    AUDIT_FLUSH_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL_SECONDS,
+    AUDIT_BUFFER_MAX_EVENTS,
+    AUDIT_EXPORT_PAGE_SIZE,
+)
+from db.database import engine, async_engine
+from db.models import CreateMedicine, VerificationEvent
+from services.log import request_id_var
+from services.metrics import AUDIT_EVENTS, AUDIT_BUFFERED, StageTrail, stage_trail_var
+
+logger = logging.getLogger(__name__)
+
+
+# Rows waiting to be written, oldest first
+_buffer: deque[dict] = deque()
+_flusher: asyncio.Task | None = None
+_wake: asyncio.Event | None = None
+
+
+# --- Recording ---
+def _status_for_code(status_code: int | None) -> str:
+    if status_code is None or status_code == 499:
+        return "CANCELLED"
+    if status_code >= 500:
+        return "ERROR"
+    if status_code >= 400:
+        return "REJECTED"
+    return "VERIFIED"
+
+
+class VerificationAudit:
+    """What one verification was asked, how it was answered and how each stage went."""
+
+    def __init__(self, source: str, drug_name: str | None, drug_type: str | None, nafdac_number: str):
+        self.source = source
+        self.drug_name = drug_name
+        self.drug_type = drug_type
+        self.nafdac_number = nafdac_number
+        self.medicine_id: int | None = None
+        self.trail = StageTrail()
+        self.status_code: int | None = None
+        self.detail = None
+
+    def set_drug(self, medicine: CreateMedicine) -> None:
+        """The drug the submission was resolved to."""
+        self.medicine_id = medicine.id
+        self.drug_name = medicine.drug_name
+        self.drug_type = medicine.drug_type
+
+    def complete(self, result):
+        """Records the answer (a result dict or a JSONResponse) and returns it unchanged."""
+        if isinstance(result, JSONResponse):
+            self.status_code, self.detail = result.status_code, json.loads(result.body)
+        else:
+            self.status_code, self.detail = 200, result
+        return result
+
+    def to_row(self, duration_ms: float) -> dict:
+        if isinstance(self.detail, dict) and "status" in self.detail:
+            status, reason = self.detail["status"], self.detail.get("reason")
+        else:
+            status = _status_for_code(self.status_code)
+            reason = None if self.detail is None else str(self.detail)
+        return {
+            "created_at": datetime.utcnow(),
+            "request_id": request_id_var.get(),
+            "source": self.source,
+            "medicine_id": self.medicine_id,
+            "drug_name": self.drug_name,
+            "drug_type": self.drug_type,
+            "nafdac_number": self.nafdac_number,
+            "status": status,
+            "status_code": self.status_code or 499,
+            "reason": reason,
+            "duration_ms": round(duration_ms, 1),
+            "stages": json.dumps(self.trail.stages),
+            "model_outputs": json.dumps(self.trail.model_outputs, default=str),
+        }
+
+
+@contextmanager
+def audit_verification(source: str, drug_name: str | None, drug_type: str | None, nafdac_number: str):
+    """
+    Records the enclosed verification as a VerificationEvent: the answer
+    passed to `complete`, or the HTTPException (HIGH-RISK verdicts, bad
+    input) or error it raised, plus the duration and verdict of every
+    stage timed inside the block. Only buffers the event; nothing is
+    written on the caller's path.
+    """
+    audit = VerificationAudit(source, drug_name, drug_type, nafdac_number)
+    token = stage_trail_var.set(audit.trail)
+    started = time.perf_counter()
+    try:
+        yield audit
+    except HTTPException as e:
+        audit.status_code, audit.detail = e.status_code, e.detail
+        raise
+    except Exception as e:
+        audit.status_code, audit.detail = 500, f"An internal error occurred: {str(e)}"
+        raise
+    finally:
+        stage_trail_var.reset(token)
+        record_event(audit.to_row((time.perf_counter() - started) * 1000))
+
+
+def record_event(row: dict) -> None:
+    """Buffers one event row; drops it (counted) when the buffer is full."""
+    if not AUDIT_LOG_ENABLED:
+        return
+    if len(_buffer) >= AUDIT_BUFFER_MAX_EVENTS:
+        AUDIT_EVENTS.labels(outcome="dropped").inc()
+        return
+    _buffer.append(row)
+    AUDIT_BUFFERED.set(len(_buffer))
+    if _wake is not None and len(_buffer) >= AUDIT_FLUSH_BATCH_SIZE:
+        _wake.set()
+
+
+# --- Flushing ---
+def _insert_events(rows: list[dict]) -> None:
+    """Writes a batch of event rows in one multi-row INSERT (blocking)."""
+    with Session(engine) as session:
+        session.execute(insert(VerificationEvent), rows)
+        session.commit()
+
+
+async def flush_events() -> int:
+    """
+    Writes the buffered events in batches of AUDIT_FLUSH_BATCH_SIZE. A batch
+    that fails goes back to the front of the buffer for the next flush.
+    Returns the number of events written.
+    """
+    written = 0
+    while _buffer:
+        batch = [_buffer.popleft() for _ in range(min(len(_buffer), AUDIT_FLUSH_BATCH_SIZE))]
+        try:
+            await asyncio.to_thread(_insert_events, batch)
+        except Exception as e:
+            _buffer.extendleft(reversed(batch))
+            AUDIT_EVENTS.labels(outcome="retried").inc(len(batch))
+            logger.warning("Could not write audit events, will retry: %s", e, extra={"events": len(batch)})
+            break
+        written += len(batch)
+        AUDIT_EVENTS.labels(outcome="written").inc(len(batch))
+    AUDIT_BUFFERED.set(len(_buffer))
+    return written
+
+
+async def _run_flusher() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=AUDIT_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            await flush_events()
+        except Exception:
+            logger.exception("Audit flusher error")
+
+
+async def start_audit_log() -> None:
+    """Starts the background task writing buffered verification events."""
+    global _flusher, _wake
+    if not AUDIT_LOG_ENABLED:
+        return
+    _wake = asyncio.Event()
+    _flusher = asyncio.create_task(_run_flusher())
+
+
+async def stop_audit_log() -> None:
+    """Stops the flusher and writes whatever is still buffered."""
+    global _flusher, _wake
+    if _flusher is not None:
+        _flusher.cancel()
+        await asyncio.gather(_flusher, return_exceptions=True)
+        _flusher = None
+        _wake = None
+    await flush_events()
+    if _buffer:
+        logger.error("Audit events lost at shutdown", extra={"events": len(_buffer)})
+
+
+# --- Queries ---
+def _utc(value: datetime | None) -> datetime | None:
+    """Stored times are naive UTC; convert aware filter values to match."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def encode_cursor(event: VerificationEvent) -> str:
+    return f"{event.created_at.isoformat()}_{event.id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Position after which a page continues; raises a 400 for a malformed cursor."""
+    try:
+        created_at, event_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(event_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _events_query(
+    since: datetime | None,
+    until: datetime | None,
+    medicine_ids: list[int] | None,
+    status: str | None,
+    after: tuple[datetime, int] | None
+):
+    # Ordered by (created_at, id) so both indexes serve the range and the order
+    query = select(VerificationEvent)
+    if since is not None:
+        query = query.where(VerificationEvent.created_at >= _utc(since))
+    if until is not None:
+        query = query.where(VerificationEvent.created_at < _utc(until))
+    if medicine_ids is not None:
+        query = query.where(VerificationEvent.medicine_id.in_(medicine_ids))
+    if status is not None:
+        query = query.where(VerificationEvent.status == status)
+    if after is not None:
+        created_at, event_id = after
+        query = query.where(or_(
+            VerificationEvent.created_at > created_at,
+            and_(VerificationEvent.created_at == created_at, VerificationEvent.id > event_id),
+        ))
+    return query.order_by(VerificationEvent.created_at, VerificationEvent.id)
+
+
+async def fetch_events(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    medicine_ids: list[int] | None = None,
+    status: str | None = None,
+    after: tuple[datetime, int] | None = None,
+    limit: int = 100
+) -> list[VerificationEvent]:
+    """One page of written events matching the filters, oldest first, after the `after` position."""
+    async with AsyncSession(async_engine) as session:
+        result = await session.exec(_events_query(since, until, medicine_ids, status, after).limit(limit))
+        return list(result.all())
+
+
+async def iter_event_pages(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    medicine_ids: list[int] | None = None,
+    status: str | None = None
+) -> AsyncIterator[list[VerificationEvent]]:
+    """Every written event matching the filters, oldest first, in pages of AUDIT_EXPORT_PAGE_SIZE."""
+    after = None
+    while True:
+        page = await fetch_events(since, until, medicine_ids, status, after, AUDIT_EXPORT_PAGE_SIZE)
+        if page:
+            yield page
+        if len(page) < AUDIT_EXPORT_PAGE_SIZE:
+            return
+        after = (page[-1].created_at, page[-1].id)
+
+
+def event_to_dict(event: VerificationEvent) -> dict:
+    data = event.model_dump()
+    data["created_at"] = event.created_at.isoformat()
+    data["stages"] = json.loads(event.stages)
+    data["model_outputs"] = json.loads(event.model_outputs)
+    return data
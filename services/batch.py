@@ -0,0 +1,127 @@
+# internal imports
+import logging
+import json
+import asyncio
+import zipfile
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile
+
+# external imports
+from config.settings import BATCH_MAX_ITEMS
+from services.audit import audit_verification
+from services.verification import normalize_drug_type, lookup_golden_drug, load_golden_images, run_verification
+
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_NAMES = ("manifest.json", "manifest.jsonl")
+
+
+@dataclass
+class BatchItem:
+    index: int
+    drug_name: str
+    drug_type: str
+    nafdac_number: str
+    box_image: str  # file name in the upload or archive
+    blister_pack_image: str | None = None
+
+
+def parse_manifest(text: str) -> list[BatchItem]:
+    """
+    Parses a batch manifest: either a JSON array or JSON Lines, one object
+    per item with drug_name, drug_type, nafdac_number, box_image and an
+    optional blister_pack_image (the latter two are image file names).
+    """
+    text = text.strip()
+    try:
+        if text.startswith("["):
+            rows = json.loads(text)
+        else:
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch manifest: {str(e)}")
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="Batch manifest is empty.")
+    if len(rows) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(rows)} items; the maximum is {BATCH_MAX_ITEMS}."
+        )
+
+    items = []
+    for index, row in enumerate(rows):
+        try:
+            items.append(BatchItem(
+                index=index,
+                drug_name=str(row["drug_name"]),
+                drug_type=str(row["drug_type"]),
+                nafdac_number=str(row["nafdac_number"]),
+                box_image=str(row["box_image"]),
+                blister_pack_image=row.get("blister_pack_image"),
+            ))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise HTTPException(status_code=400, detail=f"Batch item {index} is missing field {str(e)}.")
+    return items
+
+
+class BatchImages:
+    """Reads batch images by name from multipart files or from a zip archive."""
+
+    def __init__(self, uploads: list[UploadFile] | None = None, archive: zipfile.ZipFile | None = None):
+        self.uploads = {upload.filename: upload for upload in (uploads or [])}
+        self.archive = archive
+        # UploadFile and ZipFile reads share a file position; serialize them
+        self._lock = asyncio.Lock()
+
+    def manifest_text(self) -> str | None:
+        if self.archive is None:
+            return None
+        for name in MANIFEST_NAMES:
+            if name in self.archive.namelist():
+                return self.archive.read(name).decode("utf-8")
+        return None
+
+    async def read(self, name: str) -> bytes:
+        async with self._lock:
+            if self.archive is not None:
+                try:
+                    return await asyncio.to_thread(self.archive.read, name)
+                except KeyError:
+                    pass
+            upload = self.uploads.get(name)
+            if upload is None:
+                raise HTTPException(status_code=400, detail=f"Image '{name}' is not part of the batch upload.")
+            await upload.seek(0)
+            return await upload.read()
+
+
+async def verify_batch_item(item: BatchItem, images: BatchImages) -> dict:
+    """
+    Verifies one batch item and returns its NDJSON record. HTTP errors
+    (including HIGH-RISK verdicts) become the item's status_code/detail
+    instead of failing the whole batch.
+    """
+    record = {"index": item.index, "drug_name": item.drug_name}
+    try:
+        with audit_verification("batch", item.drug_name, item.drug_type, item.nafdac_number) as audit:
+            drug_type_lower = normalize_drug_type(item.drug_type)
+            golden_drug = await lookup_golden_drug(item.drug_name, drug_type_lower)
+            audit.set_drug(golden_drug)
+            golden = await load_golden_images(golden_drug)
+
+            box_bytes = await images.read(item.box_image)
+            blister_bytes = await images.read(item.blister_pack_image) if item.blister_pack_image else None
+
+            result = audit.complete(await run_verification(golden_drug, golden, item.nafdac_number, box_bytes, blister_bytes))
+        record["status_code"] = 200
+        record["result"] = result
+    except HTTPException as e:
+        record["status_code"] = e.status_code
+        record["detail"] = e.detail
+    except Exception as e:
+        logger.exception("Batch item failed", extra={"item_index": item.index})
+        record["status_code"] = 500
+        record["detail"] = f"An internal error occurred: {str(e)}"
+    return record
@@ -0,0 +1,134 @@
+# internal imports
+import time
+import asyncio
+import difflib
+from sqlalchemy import update
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# external imports
+from config.settings import CATALOG_VERSION_CHECK_SECONDS, CATALOG_MISS_CHECK_SECONDS
+from db.database import engine, async_engine
+from db.models import CreateMedicine, CatalogVersion
+
+
+def normalize_name(drug_name: str) -> str:
+    return drug_name.lower().strip()
+
+
+def normalize_nafdac(nafdac_number: str) -> str:
+    return "".join(nafdac_number.split()).upper()
+
+
+class DrugCatalog:
+    """
+    In-memory index of the CreateMedicine table keyed by id, normalized
+    name, (name, type) and NAFDAC number, so verification needs no per-request
+    query. Registrations on any worker bump the shared CatalogVersion row;
+    each worker reloads when it sees a newer version.
+    """
+
+    def __init__(self):
+        self.version = -1
+        self.by_id: dict[int, CreateMedicine] = {}
+        self.by_name_type: dict[tuple[str, str], CreateMedicine] = {}
+        self.by_name: dict[str, list[CreateMedicine]] = {}
+        self.by_nafdac: dict[str, list[CreateMedicine]] = {}
+        self._names: list[str] = []
+        self._checked_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    # --- Loading ---
+    def _index(self, medicines: list[CreateMedicine], version: int) -> None:
+        by_id, by_name_type, by_name, by_nafdac = {}, {}, {}, {}
+        for medicine in medicines:
+            by_id[medicine.id] = medicine
+            name = normalize_name(medicine.drug_name)
+            by_name_type[(name, medicine.drug_type)] = medicine
+            by_name.setdefault(name, []).append(medicine)
+            by_nafdac.setdefault(normalize_nafdac(medicine.nafdac_number), []).append(medicine)
+        # Swap in complete indexes at once so readers never see a partial catalog
+        self.by_id, self.by_name_type, self.by_name, self.by_nafdac = by_id, by_name_type, by_name, by_nafdac
+        self._names = sorted(by_name)
+        self.version = version
+
+    def load(self) -> None:
+        """Loads the whole catalog (blocking; used at startup)."""
+        with Session(engine) as session:
+            row = session.get(CatalogVersion, 1)
+            if row is None:
+                row = CatalogVersion(id=1, version=0)
+                session.add(row)
+                session.commit()
+            version = row.version
+            medicines = list(session.exec(select(CreateMedicine)).all())
+        self._index(medicines, version)
+        self._checked_at = time.monotonic()
+
+    async def refresh_if_stale(self, force: bool = False, max_age: float = CATALOG_VERSION_CHECK_SECONDS) -> None:
+        """
+        Reloads when another worker has registered drugs since our last load,
+        checking the version once the last check is `max_age` seconds old (or
+        at once with `force`). Checks are serialized: callers that arrive
+        while one runs wait for it instead of querying the database as well.
+        """
+        requested_at = time.monotonic()
+        if not force and requested_at - self._checked_at < max_age:
+            return
+        async with self._refresh_lock:
+            # A check that started after this call was made has seen the same data
+            if self._checked_at >= requested_at or (not force and time.monotonic() - self._checked_at < max_age):
+                return
+            started_at = time.monotonic()
+            async with AsyncSession(async_engine) as session:
+                version = (await session.exec(select(CatalogVersion.version).where(CatalogVersion.id == 1))).first() or 0
+                if version != self.version:
+                    medicines = list((await session.exec(select(CreateMedicine))).all())
+                    self._index(medicines, version)
+            self._checked_at = started_at
+
+    def add(self, medicine: CreateMedicine, version: int) -> None:
+        """Adds a drug registered by this worker without a full reload."""
+        medicines = [m for m in self.by_name_type.values() if m.id != medicine.id]
+        medicines.append(medicine)
+        # Another worker's registration may sit between our version and this one
+        self._index(medicines, version if version == self.version + 1 else self.version)
+
+    # --- Lookups ---
+    async def get(self, drug_name: str, drug_type_lower: str) -> CreateMedicine | None:
+        await self.refresh_if_stale()
+        key = (normalize_name(drug_name), drug_type_lower)
+        medicine = self.by_name_type.get(key)
+        if medicine is None:
+            # Could have been registered on another worker moments ago
+            await self.refresh_if_stale(max_age=CATALOG_MISS_CHECK_SECONDS)
+            medicine = self.by_name_type.get(key)
+        return medicine
+
+    def same_name(self, drug_name: str) -> list[CreateMedicine]:
+        return list(self.by_name.get(normalize_name(drug_name), []))
+
+    def by_nafdac_number(self, nafdac_number: str) -> list[CreateMedicine]:
+        return list(self.by_nafdac.get(normalize_nafdac(nafdac_number), []))
+
+    def suggest(self, drug_name: str, limit: int = 3) -> list[str]:
+        """Registered names starting with, or close in spelling to, `drug_name`."""
+        name = normalize_name(drug_name)
+        if not name:
+            return []
+        prefix_matches = [candidate for candidate in self._names if candidate.startswith(name)]
+        close_matches = difflib.get_close_matches(name, self._names, n=limit, cutoff=0.7)
+        suggestions = []
+        for candidate in prefix_matches + close_matches:
+            if candidate not in suggestions and candidate != name:
+                suggestions.append(candidate)
+        return suggestions[:limit]
+
+
+catalog = DrugCatalog()
+
+
+async def bump_catalog_version(session: AsyncSession) -> int:
+    """Increments the shared catalog version inside the caller's transaction."""
+    await session.exec(update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1))
+    return (await session.exec(select(CatalogVersion.version).where(CatalogVersion.id == 1))).one()
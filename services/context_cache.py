@@ -0,0 +1,316 @@
+# internal imports
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from google.genai import errors as genai_errors
+from google.genai import types
+
+# external imports
+from config.settings import (
+    CONTEXT_CACHE_BACKEND,
+    CONTEXT_CACHE_TTL_SECONDS,
+    CONTEXT_CACHE_REFRESH_SECONDS,
+    CONTEXT_CACHE_MAX_ENTRIES,
+    CONTEXT_CACHE_RETRY_SECONDS,
+    CONTEXT_CACHE_MIN_TOKENS,
+)
+from services.metrics import CONTEXT_CACHE_EVENTS
+from services.verdict_cache import verdict_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+# A context this close to expiry is no longer handed out: the call using it
+# could reach the model after it is gone
+_EXPIRY_GUARD_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class SharedContext:
+    """
+    Marks the first `prefix` items of an inspection's contents (the caption
+    and golden image) as the same for every inspection of `medicine_id` at
+    `stage`, so they can be cached on the model side with the system prompt.
+    """
+    medicine_id: int
+    stage: str
+    prefix: int
+
+
+class StaleContext(Exception):
+    """The model no longer knows a cached context this worker still held."""
+
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Cached context {name} is gone")
+
+
+def is_missing_context(error: BaseException) -> bool:
+    """True for the error the model returns when a cached context expired or was deleted."""
+    return (
+        isinstance(error, genai_errors.ClientError)
+        and error.code in (403, 404)
+        and "cache" in str(error.message or "").lower()
+    )
+
+
+def is_too_small(error: BaseException) -> bool:
+    """True for the error the model returns for a context below its minimum cache size."""
+    return (
+        isinstance(error, genai_errors.ClientError)
+        and error.code == 400
+        and "too small" in str(error.message or "").lower()
+    )
+
+
+def min_context_tokens(model: str) -> int:
+    """Smallest context `model` caches, per CONTEXT_CACHE_MIN_TOKENS (longest matching prefix)."""
+    prefixes = [prefix for prefix in CONTEXT_CACHE_MIN_TOKENS if model.startswith(prefix)]
+    return CONTEXT_CACHE_MIN_TOKENS[max(prefixes, key=len)] if prefixes else 0
+
+
+# --- Backends ---
+class GeminiContextBackend:
+    """Cached contents on the Gemini API (`client.aio.caches`)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _parts(contents: list) -> list[types.Part]:
+        return [item if isinstance(item, types.Part) else types.Part(text=str(item)) for item in contents]
+
+    async def count_tokens(self, model: str, system_prompt: str, contents: list) -> int:
+        """Input tokens of a context holding `system_prompt` and `contents`."""
+        response = await self.client.aio.models.count_tokens(
+            model=model,
+            contents=[types.Content(role="user", parts=[types.Part(text=system_prompt), *self._parts(contents)])],
+        )
+        return response.total_tokens or 0
+
+    @staticmethod
+    def _seconds_left(cached: types.CachedContent, ttl_seconds: int) -> float:
+        if cached.expire_time is None:
+            return ttl_seconds
+        return (cached.expire_time - datetime.now(timezone.utc)).total_seconds()
+
+    async def create(self, model: str, system_prompt: str, contents: list, ttl_seconds: int, display_name: str) -> tuple[str, float]:
+        """Uploads the context; returns its name and the seconds until it expires."""
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_prompt,
+                contents=[types.Content(role="user", parts=self._parts(contents))],
+                ttl=f"{ttl_seconds}s",
+                display_name=display_name,
+            ),
+        )
+        return cached.name, self._seconds_left(cached, ttl_seconds)
+
+    async def extend(self, name: str, ttl_seconds: int) -> float:
+        """Pushes the expiry of `name` to `ttl_seconds` from now; returns the seconds left."""
+        cached = await self.client.aio.caches.update(
+            name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s")
+        )
+        return self._seconds_left(cached, ttl_seconds)
+
+    async def delete(self, name: str) -> None:
+        await self.client.aio.caches.delete(name=name)
+
+
+@dataclass
+class _Entry:
+    name: str
+    model: str
+    medicine_id: int
+    expires_at: float  # time.monotonic()
+    refreshing: bool = False
+
+
+# --- Cache Front ---
+class ContextCache:
+    """
+    Keeps a handle to a model-side cached context per (model, golden image,
+    stage prompt), so inspections send only the user's image and reference
+    the golden image and prompt instead of uploading them as new input
+    tokens on every call.
+
+    No request ever waits for the cache: a miss is answered inline while the
+    context is created in the background, and contexts in use are extended
+    in the background shortly before they expire. Failures are logged and
+    the contents are sent inline; the cache must never fail a verification.
+    Keys are content addresses, so changed images or prompts get a new
+    context; `invalidate` only deletes the old ones early instead of letting
+    them run out their TTL. Contexts are counted before they are created,
+    and those below the model's minimum cache size are remembered and
+    always sent inline. Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, backend, ttl_seconds: int, refresh_seconds: int, max_entries: int, retry_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self.max_entries = max_entries
+        self.retry_seconds = retry_seconds
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._pending: set[str] = set()
+        self._failed: dict[str, float] = {}
+        self._too_small: set[str] = set()  # content addresses, so this never goes stale
+        self._tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def lookup(self, model: str, system_prompt: str, contents: list, context: SharedContext) -> str | None:
+        """
+        Name of the cached context holding `system_prompt` and the shared
+        prefix of `contents` for `model`, or None when it must be sent
+        inline (not cached yet, being created, or recently failed).
+        """
+        if not self.enabled:
+            return None
+        prefix = contents[:context.prefix]
+        key = await asyncio.to_thread(verdict_cache_key, system_prompt, model, prefix)
+        if key in self._too_small:
+            return None
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - now > _EXPIRY_GUARD_SECONDS:
+            self._entries.move_to_end(key)
+            if entry.expires_at - now < self.refresh_seconds and not entry.refreshing:
+                entry.refreshing = True
+                self._spawn(self._refresh(key, entry))
+            self.hits += 1
+            CONTEXT_CACHE_EVENTS.labels(event="hit").inc()
+            return entry.name
+        if entry is not None:
+            # Expired (or about to): the model drops it on its own
+            del self._entries[key]
+
+        self.misses += 1
+        CONTEXT_CACHE_EVENTS.labels(event="miss").inc()
+        if key not in self._pending and self._failed.get(key, 0) <= now:
+            self._failed.pop(key, None)
+            self._pending.add(key)
+            self._spawn(self._create(key, model, system_prompt, prefix, context))
+        return None
+
+    async def _create(self, key: str, model: str, system_prompt: str, contents: list, context: SharedContext) -> None:
+        try:
+            min_tokens = min_context_tokens(model)
+            if min_tokens:
+                tokens = await self.backend.count_tokens(model, system_prompt, contents)
+                if tokens < min_tokens:
+                    self._mark_too_small(key)
+                    logger.info("Context below the model's minimum cache size, sending it inline", extra={
+                        "model": model, "stage": context.stage, "medicine_id": context.medicine_id,
+                        "tokens": tokens, "min_tokens": min_tokens,
+                    })
+                    return
+            name, seconds_left = await self.backend.create(
+                model, system_prompt, contents, self.ttl_seconds,
+                display_name=f"checkmed-{context.stage}-{context.medicine_id}"
+            )
+        except Exception as e:
+            if is_too_small(e):
+                # Under a minimum CONTEXT_CACHE_MIN_TOKENS does not know yet
+                self._mark_too_small(key)
+                return
+            self._failed[key] = time.monotonic() + self.retry_seconds
+            CONTEXT_CACHE_EVENTS.labels(event="create_failed").inc()
+            logger.warning("Could not cache context, sending it inline: %s", e, extra={
+                "model": model, "stage": context.stage, "medicine_id": context.medicine_id
+            })
+            return
+        finally:
+            self._pending.discard(key)
+
+        CONTEXT_CACHE_EVENTS.labels(event="created").inc()
+        self._entries[key] = _Entry(name, model, context.medicine_id, time.monotonic() + seconds_left)
+        while len(self._entries) > self.max_entries:
+            _, oldest = self._entries.popitem(last=False)
+            CONTEXT_CACHE_EVENTS.labels(event="evicted").inc()
+            self._spawn(self._delete(oldest.name))
+
+    def _mark_too_small(self, key: str) -> None:
+        if len(self._too_small) >= self.max_entries * 10:
+            self._too_small.clear()
+        self._too_small.add(key)
+        CONTEXT_CACHE_EVENTS.labels(event="too_small").inc()
+
+    async def _refresh(self, key: str, entry: _Entry) -> None:
+        try:
+            seconds_left = await self.backend.extend(entry.name, self.ttl_seconds)
+        except Exception as e:
+            # Keep using it until it expires; the next miss creates a new one
+            CONTEXT_CACHE_EVENTS.labels(event="refresh_failed").inc()
+            logger.warning("Could not extend cached context: %s", e, extra={"model": entry.model, "context": entry.name})
+            return
+        finally:
+            entry.refreshing = False
+        entry.expires_at = time.monotonic() + seconds_left
+        CONTEXT_CACHE_EVENTS.labels(event="refreshed").inc()
+
+    async def _delete(self, name: str) -> None:
+        try:
+            await self.backend.delete(name)
+        except Exception as e:
+            # It expires on its own at the end of its TTL
+            logger.warning("Could not delete cached context: %s", e, extra={"context": name})
+
+    def discard(self, name: str) -> None:
+        """Forgets the context `name` after the model reported it missing."""
+        CONTEXT_CACHE_EVENTS.labels(event="stale").inc()
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                del self._entries[key]
+
+    def invalidate(self, medicine_id: int) -> None:
+        """Deletes every cached context of `medicine_id` (its golden images changed)."""
+        for key, entry in list(self._entries.items()):
+            if entry.medicine_id == medicine_id:
+                del self._entries[key]
+                CONTEXT_CACHE_EVENTS.labels(event="invalidated").inc()
+                self._spawn(self._delete(entry.name))
+
+    async def close(self) -> None:
+        """Deletes this worker's cached contexts so they stop accruing storage."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        entries = list(self._entries.values())
+        self._entries.clear()
+        await asyncio.gather(*(self._delete(entry.name) for entry in entries))
+
+    def stats(self) -> dict:
+        return {
+            "backend": CONTEXT_CACHE_BACKEND,
+            "contexts": len(self._entries),
+            "too_small": len(self._too_small),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def make_context_cache(client) -> ContextCache:
+    """The context cache for the shared SDK `client`, per CONTEXT_CACHE_BACKEND."""
+    backend = GeminiContextBackend(client) if CONTEXT_CACHE_BACKEND == "gemini" else None
+    return ContextCache(
+        backend,
+        ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+        refresh_seconds=CONTEXT_CACHE_REFRESH_SECONDS,
+        max_entries=CONTEXT_CACHE_MAX_ENTRIES,
+        retry_seconds=CONTEXT_CACHE_RETRY_SECONDS,
+    )
@@ -0,0 +1,70 @@
+# internal imports
+import io
+import numpy as np
+from PIL import Image, ImageOps
+
+
+# Bump when compute_embedding changes: stored embeddings of older versions are recomputed
+EMBEDDING_VERSION = 1
+EMBEDDING_DIM = 256
+
+# Side (pixels) of the square the image is reduced to before describing it
+_SIZE = 64
+# Share of each part in the cosine similarity of two embeddings
+_COLOUR_WEIGHT, _LAYOUT_WEIGHT, _SHAPE_WEIGHT = 0.4, 0.3, 0.3
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def compute_embedding(image_bytes: bytes) -> np.ndarray:
+    """
+    Describes the look of an image as a unit-length float32 vector of
+    EMBEDDING_DIM values, so the dot product of two embeddings is their
+    cosine similarity (close to 1.0 for photos of the same packaging).
+    It concatenates three parts:
+
+    - colour: 8x4x4 HSV histogram (128), square-rooted so no single colour dominates
+    - layout: 8x8 grayscale thumbnail, mean-centred (64)
+    - shape: 16-bin gradient orientation histograms of the four quadrants (64)
+
+    Raises PIL.UnidentifiedImageError if the bytes are not an image.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Let the JPEG decoder downscale while decoding; we only need a thumbnail
+        img.draft("RGB", (2 * _SIZE, 2 * _SIZE))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    small = img.resize((_SIZE, _SIZE), Image.Resampling.BILINEAR)
+
+    hsv = np.asarray(small.convert("HSV"), dtype=np.int64)
+    bins = (hsv[..., 0] >> 5) * 16 + (hsv[..., 1] >> 6) * 4 + (hsv[..., 2] >> 6)
+    colour = np.sqrt(np.bincount(bins.ravel(), minlength=128).astype(np.float32))
+
+    gray = np.asarray(small.convert("L"), dtype=np.float32)
+    layout = gray.reshape(8, _SIZE // 8, 8, _SIZE // 8).mean(axis=(1, 3)).ravel()
+    layout -= layout.mean()
+
+    # Unsigned gradient orientation (0-180°), weighted by gradient magnitude
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy)
+    orientation = (np.arctan2(gy, gx) % np.pi / np.pi * 16).astype(np.int64) % 16
+    half = np.arange(_SIZE) // (_SIZE // 2)
+    quadrant = half[:, None] * 2 + half[None, :]
+    shape = np.sqrt(np.bincount((quadrant * 16 + orientation).ravel(), weights=magnitude.ravel(), minlength=64))
+
+    embedding = np.concatenate([
+        _unit(colour) * np.sqrt(_COLOUR_WEIGHT),
+        _unit(layout) * np.sqrt(_LAYOUT_WEIGHT),
+        _unit(shape) * np.sqrt(_SHAPE_WEIGHT),
+    ])
+    return _unit(embedding).astype(np.float32)
+
+
+def embedding_to_bytes(embedding: np.ndarray) -> bytes:
+    return embedding.astype("<f4").tobytes()
+
+
+def embedding_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<f4")
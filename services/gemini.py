@@ -0,0 +1,266 @@
+# internal imports
+import time
+import logging
+import asyncio
+from fastapi import HTTPException, Request
+from google import genai
+from google.genai import types
+from dotenv import load_dotenv
+
+# external imports
+from config.settings import (
+    GEMINI_MODEL,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_TIMEOUT_SECONDS,
+    GEMINI_STRUCTURED_OUTPUT,
+    GEMINI_MAX_RETRIES,
+    VERDICT_REQUERY_ATTEMPTS,
+    DISCONNECT_POLL_SECONDS,
+)
+from services.context_cache import SharedContext, StaleContext, is_missing_context, make_context_cache
+from services.log import should_log_payload
+from services.metrics import (
+    GEMINI_CALLS,
+    GEMINI_IN_FLIGHT,
+    GEMINI_LATENCY,
+    GEMINI_RETRIES,
+    RETRIES_DENIED,
+    VERDICT_PARSES,
+    record_model_output,
+    record_token_usage,
+)
+from services.resilience import ModelUnavailable, backoff_delay, circuit_breaker, is_retryable, retry_budget
+from services.verdict_cache import verdict_cache, verdict_cache_key
+from services.verdicts import ModelVerdict, InspectionVerdict, VerdictParseError, parse_verdict
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+client = genai.Client()
+# Golden images and stage prompts kept on the model side between calls
+context_cache = make_context_cache(client)
+
+# Caps the number of concurrent Gemini calls on this worker
+_gemini_slots = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+async def _generate_content(model: str, system_prompt: str, contents: list, cached_content: str | None = None):
+    """
+    Runs one generate_content call on the SDK's async client, waiting
+    for a free concurrency slot and enforcing the per-call timeout.
+    With `cached_content` the system prompt is already part of that
+    context and must not be sent again.
+    """
+    if cached_content is not None:
+        config = types.GenerateContentConfig(cached_content=cached_content)
+    else:
+        config = types.GenerateContentConfig(system_instruction=system_prompt)
+    if GEMINI_STRUCTURED_OUTPUT:
+        config.response_mime_type = "application/json"
+        config.response_schema = ModelVerdict
+    async with _gemini_slots:
+        return await asyncio.wait_for(
+            client.aio.models.generate_content(
+                model=model,
+                config=config,
+                contents=contents
+            ),
+            timeout=GEMINI_TIMEOUT_SECONDS
+        )
+
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Awaits `coro` while watching the HTTP connection. If the client
+    disconnects before the result is ready the work is cancelled and a
+    499 is raised so no further model calls are made for that request.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _call_model(
+    model: str,
+    system_prompt: str,
+    contents: list,
+    request: Request | None,
+    stage: str,
+    cached_content: str | None = None
+):
+    """
+    One model call behind the model's circuit breaker. Retryable failures
+    (timeouts, 429s, 5xx) are retried with jittered backoff up to
+    GEMINI_MAX_RETRIES times while the global retry budget allows. Raises
+    ModelUnavailable (503) when the breaker is open, 504 on a final
+    timeout, StaleContext when `cached_content` no longer exists and 502
+    on any other SDK error.
+    """
+    breaker = circuit_breaker(model)
+    retry_budget.record_call()
+    retries = 0
+    while True:
+        try:
+            breaker.before_call()
+        except ModelUnavailable:
+            GEMINI_CALLS.labels(stage=stage, model=model, outcome="circuit_open").inc()
+            raise
+
+        started = time.monotonic()
+        try:
+            with GEMINI_IN_FLIGHT.track_inprogress(), GEMINI_LATENCY.labels(stage=stage, model=model).time():
+                call = _generate_content(model, system_prompt, contents, cached_content)
+                if request is not None:
+                    response = await cancel_on_disconnect(request, call)
+                else:
+                    response = await call
+        except HTTPException:
+            # Client disconnected: says nothing about the model
+            breaker.release()
+            GEMINI_CALLS.labels(stage=stage, model=model, outcome="cancelled").inc()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            if cached_content is not None and is_missing_context(e):
+                # Our handle outlived the context; says nothing about the model
+                breaker.release()
+                raise StaleContext(cached_content) from e
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record(failed=True, latency=time.monotonic() - started)
+            else:
+                breaker.release()
+
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            GEMINI_CALLS.labels(stage=stage, model=model, outcome="timeout" if timed_out else "error").inc()
+            if retryable and retries < GEMINI_MAX_RETRIES and breaker.allows_calls():
+                if retry_budget.try_spend():
+                    retries += 1
+                    delay = backoff_delay(retries)
+                    GEMINI_RETRIES.labels(stage=stage, model=model).inc()
+                    logger.warning("Retrying Gemini call: %r", e, extra={
+                        "stage": stage, "model": model, "retry": retries, "delay_seconds": round(delay, 3)
+                    })
+                    await asyncio.sleep(delay)
+                    continue
+                RETRIES_DENIED.inc()
+
+            if timed_out:
+                logger.warning("Gemini call timed out", extra={"stage": stage, "model": model, "timeout_seconds": GEMINI_TIMEOUT_SECONDS})
+                raise HTTPException(status_code=504, detail="Gemini API timed out")
+            logger.exception("Gemini SDK error", extra={"stage": stage, "model": model})
+            raise HTTPException(status_code=502, detail=f"Gemini API error: {str(e)}")
+
+        breaker.record(failed=False, latency=time.monotonic() - started)
+        return response
+
+
+async def _call_with_context(
+    model: str,
+    system_prompt: str,
+    contents: list,
+    request: Request | None,
+    stage: str,
+    context: SharedContext | None
+):
+    """
+    Calls the model with the shared prefix of `contents` (and the system
+    prompt) taken from its cached context when one is ready, else inline.
+    """
+    if context is not None:
+        cached_content = await context_cache.lookup(model, system_prompt, contents, context)
+        if cached_content is not None:
+            try:
+                return await _call_model(
+                    model, system_prompt, contents[context.prefix:], request, stage, cached_content
+                )
+            except StaleContext:
+                context_cache.discard(cached_content)
+                logger.info("Cached context gone, sending it inline", extra={"stage": stage, "model": model})
+    return await _call_model(model, system_prompt, contents, request, stage)
+
+
+def _verdict_from_response(response, stage: str) -> InspectionVerdict:
+    """Typed verdict from a response: the SDK-parsed object, else the (repaired) text."""
+    parsed = getattr(response, "parsed", None)
+    if isinstance(parsed, ModelVerdict):
+        VERDICT_PARSES.labels(outcome="ok").inc()
+        return InspectionVerdict(**parsed.model_dump(), stage=stage)
+
+    text = response.text
+    if not text:
+        raise VerdictParseError("Gemini returned empty response")
+    verdict, repaired = parse_verdict(text, stage)
+    VERDICT_PARSES.labels(outcome="repaired" if repaired else "ok").inc()
+    return verdict
+
+
+async def run_gemini_call(
+    system_prompt: str,
+    contents: list,
+    request: Request | None = None,
+    stage: str = "inspection",
+    model: str | None = None,
+    context: SharedContext | None = None
+) -> InspectionVerdict:
+    """
+    Sends a prompt (with text and image bytes) to the Gemini API
+    using the official Python SDK's async client and returns its verdict.
+
+    The model answers in JSON mode against the ModelVerdict schema. Output
+    that still does not parse is repaired locally first and only re-queried
+    (up to VERDICT_REQUERY_ATTEMPTS times) if that fails.
+
+    If `request` is given, the call is cancelled as soon as that client
+    disconnects. Calls go through the model's circuit breaker and retry
+    budget (see _call_model). Verdicts are cached by content address, so
+    an identical comparison within the TTL is answered without calling
+    the model.
+    `stage` labels the call's latency, token usage and outcome metrics;
+    `model` defaults to GEMINI_MODEL. With a `context`, the system prompt
+    and the shared prefix of `contents` come from the model-side context
+    cache once it holds them (see ContextCache).
+    """
+    model = model or GEMINI_MODEL
+    cache_key = None
+    if verdict_cache.enabled:
+        # Hashing multi-megabyte images releases the GIL, so do it off the loop
+        cache_key = await asyncio.to_thread(verdict_cache_key, system_prompt, model, contents)
+        cached_verdict = await verdict_cache.get(cache_key)
+        if cached_verdict is not None:
+            GEMINI_CALLS.labels(stage=stage, model=model, outcome="cache_hit").inc()
+            record_model_output(model, stage, cached_verdict, cached=True)
+            return InspectionVerdict.model_validate({**cached_verdict, "stage": stage})
+
+    for attempt in range(VERDICT_REQUERY_ATTEMPTS + 1):
+        response = await _call_with_context(model, system_prompt, contents, request, stage, context)
+        record_token_usage(model, stage, response)
+        if should_log_payload():
+            # Full responses are large; only a sample is logged
+            logger.info("Gemini response", extra={"stage": stage, "model": model, "payload": response})
+
+        try:
+            verdict = _verdict_from_response(response, stage)
+            break
+        except VerdictParseError as e:
+            VERDICT_PARSES.labels(outcome="failed").inc()
+            logger.warning("Unreadable verdict: %s", e, extra={"stage": stage, "model": model, "attempt": attempt + 1})
+    else:
+        GEMINI_CALLS.labels(stage=stage, model=model, outcome="error").inc()
+        raise HTTPException(status_code=502, detail="Gemini returned an unreadable verdict")
+
+    GEMINI_CALLS.labels(stage=stage, model=model, outcome="ok").inc()
+    record_model_output(model, stage, verdict.model_dump(exclude_none=True, exclude={"stage"}))
+    if cache_key is not None:
+        await verdict_cache.set(cache_key, verdict.model_dump(exclude_none=True, exclude={"stage"}))
+    return verdict
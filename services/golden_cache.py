@@ -0,0 +1,147 @@
+# internal imports
+import logging
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from google.genai import types
+from sqlmodel import Session, select
+
+# external imports
+from config.settings import GOLDEN_CACHE_MAX_BYTES
+from db.models import CreateMedicine
+from services.images import detect_mime_type, prepare_stored_image
+from services.image_store import read_image
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GoldenImages:
+    """Golden-standard images of one CreateMedicine, ready to send to Gemini."""
+    box_path: str
+    blister_path: str | None
+    box_bytes: bytes
+    box_part: types.Part
+    blister_bytes: bytes | None = None
+    blister_part: types.Part | None = None
+
+    @property
+    def size(self) -> int:
+        return len(self.box_bytes) + len(self.blister_bytes or b"")
+
+
+def build_golden_images(medicine: CreateMedicine, box_bytes: bytes, blister_bytes: bytes | None) -> GoldenImages:
+    """Wraps already-read golden image bytes for `medicine` into a GoldenImages entry."""
+    return GoldenImages(
+        box_path=medicine.golden_box_image_path,
+        blister_path=medicine.golden_blister_image_path,
+        box_bytes=box_bytes,
+        box_part=types.Part.from_bytes(data=box_bytes, mime_type=detect_mime_type(box_bytes) or "image/jpeg"),
+        blister_bytes=blister_bytes,
+        blister_part=(
+            types.Part.from_bytes(data=blister_bytes, mime_type=detect_mime_type(blister_bytes) or "image/jpeg")
+            if blister_bytes is not None else None
+        ),
+    )
+
+
+def read_golden_images(medicine: CreateMedicine) -> GoldenImages:
+    """Reads the normalized golden images of `medicine` from the image store (blocking)."""
+    box_bytes = prepare_stored_image(read_image(medicine.golden_box_image_path))
+
+    blister_bytes = None
+    if medicine.golden_blister_image_path:
+        blister_bytes = prepare_stored_image(read_image(medicine.golden_blister_image_path))
+
+    return build_golden_images(medicine, box_bytes, blister_bytes)
+
+
+class GoldenImageCache:
+    """
+    LRU cache of golden-standard images keyed by CreateMedicine id and
+    bounded by a total byte budget. The image store remains the source
+    of truth; a miss reads them once (off the event loop) and keeps
+    the bytes and prebuilt `types.Part` objects for subsequent requests.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[int, GoldenImages] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._size
+
+    def get(self, medicine: CreateMedicine) -> GoldenImages | None:
+        """Returns the cached entry for `medicine`, or None on a miss or stale paths."""
+        with self._lock:
+            entry = self._entries.get(medicine.id)
+            if entry is None:
+                return None
+            if (entry.box_path, entry.blister_path) != (medicine.golden_box_image_path, medicine.golden_blister_image_path):
+                self._pop(medicine.id)
+                return None
+            self._entries.move_to_end(medicine.id)
+            return entry
+
+    def put(self, medicine_id: int, entry: GoldenImages) -> None:
+        """Stores `entry`, evicting least recently used drugs to stay within budget."""
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(medicine_id)
+            self._entries[medicine_id] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                oldest_id = next(iter(self._entries))
+                self._pop(oldest_id)
+
+    def invalidate(self, medicine_id: int) -> None:
+        with self._lock:
+            self._pop(medicine_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _pop(self, medicine_id: int) -> None:
+        entry = self._entries.pop(medicine_id, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    async def get_or_load(self, medicine: CreateMedicine) -> GoldenImages:
+        """Returns the golden images for `medicine`, reading them from the store on a miss."""
+        entry = self.get(medicine)
+        if entry is None:
+            entry = await asyncio.to_thread(read_golden_images, medicine)
+            self.put(medicine.id, entry)
+        return entry
+
+    def warm(self, session: Session) -> int:
+        """Preloads golden images for registered drugs until the budget is full."""
+        loaded = 0
+        for medicine in session.exec(select(CreateMedicine).order_by(CreateMedicine.id)).all():
+            try:
+                entry = read_golden_images(medicine)
+            except Exception as e:
+                logger.warning("Skipping golden images: %s", e, extra={"drug_name": medicine.drug_name})
+                continue
+            if self._size + entry.size > self.max_bytes:
+                break
+            self.put(medicine.id, entry)
+            loaded += 1
+        return loaded
+
+
+golden_images = GoldenImageCache(GOLDEN_CACHE_MAX_BYTES)
+
+
+def warm_golden_cache(engine) -> None:
+    """Fills the golden image cache from the CreateMedicine table at startup."""
+    with Session(engine) as session:
+        loaded = golden_images.warm(session)
+    logger.info("Golden image cache warmed", extra={"drugs": loaded, "bytes": golden_images.total_bytes})
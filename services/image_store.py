@@ -0,0 +1,355 @@
+# internal imports
+import os
+import re
+import shutil
+import hashlib
+import asyncio
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import closing
+from typing import Iterator
+from dataclasses import dataclass
+
+# external imports
+from config.settings import (
+    IMAGE_STORE_BACKEND,
+    IMAGE_STORE_DIR,
+    S3_BUCKET,
+    S3_PREFIX,
+    S3_ENDPOINT_URL,
+    S3_REGION,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_BYTES,
+    UPLOAD_CHUNK_BYTES,
+)
+from services.images import detect_mime_type, normalize_upload, make_thumbnail
+from services.uploads import SpooledUpload, discard
+
+logger = logging.getLogger(__name__)
+
+
+RENDITIONS = ("original", "normalized", "thumbnail")
+# Stored in CreateMedicine.golden_*_image_path in place of a file path
+CONTENT_ADDRESS_PREFIX = "sha256:"
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def content_address(digest: str) -> str:
+    return CONTENT_ADDRESS_PREFIX + digest
+
+
+def digest_of(reference: str | None) -> str | None:
+    """The sha256 of a content-addressed image reference, or None for a plain file path."""
+    if reference and reference.startswith(CONTENT_ADDRESS_PREFIX):
+        return reference[len(CONTENT_ADDRESS_PREFIX):]
+    return None
+
+
+def validate_object(digest: str, rendition: str) -> None:
+    """Rejects anything that is not a sha256 hex digest and known rendition (they become paths and keys)."""
+    if not _DIGEST.match(digest):
+        raise ValueError(f"Invalid image digest '{digest}'")
+    if rendition not in RENDITIONS:
+        raise ValueError(f"Invalid rendition '{rendition}'. Must be one of {', '.join(RENDITIONS)}.")
+
+
+# --- Backends (blocking, run in worker threads) ---
+class LocalImageStore:
+    """Objects as files under `root`/<digest[:2]>/<digest>/<rendition>."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, digest: str, rendition: str) -> Path:
+        validate_object(digest, rendition)
+        return self.root / digest[:2] / digest / rendition
+
+    def exists(self, digest: str, rendition: str) -> bool:
+        return self.path(digest, rendition).is_file()
+
+    def size(self, digest: str, rendition: str) -> int:
+        return self.path(digest, rendition).stat().st_size
+
+    def _write(self, digest: str, rendition: str, write) -> None:
+        # Write next to the target and rename, so readers never see a partial object
+        target = self.path(digest, rendition)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        handle = tempfile.NamedTemporaryFile(delete=False, dir=target.parent, prefix=f".{rendition}-")
+        try:
+            with handle:
+                write(handle)
+            os.replace(handle.name, target)
+        except BaseException:
+            discard(handle.name)
+            raise
+
+    def put_file(self, digest: str, rendition: str, source: str) -> None:
+        def copy(handle):
+            with open(source, "rb") as f:
+                shutil.copyfileobj(f, handle, UPLOAD_CHUNK_BYTES)
+        self._write(digest, rendition, copy)
+
+    def put_bytes(self, digest: str, rendition: str, data: bytes) -> None:
+        self._write(digest, rendition, lambda handle: handle.write(data))
+
+    def read_range(self, digest: str, rendition: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """Yields the bytes from `start` to `end` (inclusive; None for the end of the object)."""
+        with open(self.path(digest, rendition), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(UPLOAD_CHUNK_BYTES if remaining is None else min(UPLOAD_CHUNK_BYTES, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, digest: str, rendition: str) -> None:
+        discard(str(self.path(digest, rendition)))
+
+
+class S3ImageStore:
+    """
+    Objects in an S3-compatible bucket under `prefix`<digest>/<rendition>.
+    Set S3_ENDPOINT_URL to use MinIO or another S3-compatible server.
+    """
+
+    def __init__(self, bucket: str, prefix: str, endpoint_url: str | None, region: str | None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise ImportError("IMAGE_STORE_BACKEND=s3 needs boto3: pip install 'checkmed-backend[s3]'")
+        if not bucket:
+            raise ValueError("IMAGE_STORE_BACKEND=s3 needs S3_BUCKET.")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._client_error = ClientError
+
+    def key(self, digest: str, rendition: str) -> str:
+        validate_object(digest, rendition)
+        return f"{self.prefix}{digest}/{rendition}"
+
+    def _not_found(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _head(self, digest: str, rendition: str) -> dict:
+        key = self.key(digest, rendition)
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def exists(self, digest: str, rendition: str) -> bool:
+        try:
+            self._head(digest, rendition)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def size(self, digest: str, rendition: str) -> int:
+        return self._head(digest, rendition)["ContentLength"]
+
+    def put_file(self, digest: str, rendition: str, source: str) -> None:
+        # upload_file switches to a multipart upload for large files
+        self.client.upload_file(source, self.bucket, self.key(digest, rendition))
+
+    def put_bytes(self, digest: str, rendition: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.key(digest, rendition), Body=data)
+
+    def read_range(self, digest: str, rendition: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        key = self.key(digest, rendition)
+        options = {}
+        if start or end is not None:
+            options["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, **options)
+        except self._client_error as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+        body = response["Body"]
+        try:
+            yield from body.iter_chunks(UPLOAD_CHUNK_BYTES)
+        finally:
+            body.close()
+
+    def delete(self, digest: str, rendition: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(digest, rendition))
+
+
+class ReadThroughCache:
+    """
+    Puts a local disk cache in front of a remote store. Reads are served
+    from IMAGE_CACHE_DIR, downloading the whole object on a miss; writes go
+    to the remote store and the cache. Objects are content-addressed and
+    never change, so cached copies never go stale. The least recently read
+    objects are removed once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, remote, cache_dir: str, max_bytes: int):
+        self.remote = remote
+        self.cache = LocalImageStore(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(p.stat().st_size for p in self.cache.root.glob("*/*/*") if p.is_file())
+
+    def exists(self, digest: str, rendition: str) -> bool:
+        return self.cache.exists(digest, rendition) or self.remote.exists(digest, rendition)
+
+    def size(self, digest: str, rendition: str) -> int:
+        if self.cache.exists(digest, rendition):
+            return self.cache.size(digest, rendition)
+        return self.remote.size(digest, rendition)
+
+    def _cached(self, digest: str, rendition: str, size: int) -> None:
+        """Accounts for a newly cached object and evicts others until the cache fits its budget."""
+        keep = self.cache.path(digest, rendition)
+        with self._lock:
+            self._size += size
+            if self._size <= self.max_bytes:
+                return
+            files = sorted(
+                (p for p in self.cache.root.glob("*/*/*") if p.is_file() and not p.name.startswith(".") and p != keep),
+                key=lambda p: p.stat().st_mtime
+            )
+            for path in files:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                    self._size -= size
+                except FileNotFoundError:
+                    pass
+
+    def put_file(self, digest: str, rendition: str, source: str) -> None:
+        self.remote.put_file(digest, rendition, source)
+        self.cache.put_file(digest, rendition, source)
+        self._cached(digest, rendition, os.path.getsize(source))
+
+    def put_bytes(self, digest: str, rendition: str, data: bytes) -> None:
+        self.remote.put_bytes(digest, rendition, data)
+        self.cache.put_bytes(digest, rendition, data)
+        self._cached(digest, rendition, len(data))
+
+    def _fill(self, digest: str, rendition: str) -> None:
+        size = 0
+
+        def download(handle):
+            nonlocal size
+            for chunk in self.remote.read_range(digest, rendition):
+                handle.write(chunk)
+                size += len(chunk)
+        self.cache._write(digest, rendition, download)
+        self._cached(digest, rendition, size)
+
+    def read_range(self, digest: str, rendition: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        path = self.cache.path(digest, rendition)
+        if not path.is_file():
+            if self.remote.size(digest, rendition) > self.max_bytes:
+                # Too big to ever fit the cache
+                yield from self.remote.read_range(digest, rendition, start, end)
+                return
+            self._fill(digest, rendition)
+        else:
+            # mtime doubles as the last-read time for eviction
+            os.utime(path)
+        yield from self.cache.read_range(digest, rendition, start, end)
+
+    def delete(self, digest: str, rendition: str) -> None:
+        self.remote.delete(digest, rendition)
+        self.cache.delete(digest, rendition)
+
+
+def _make_backend():
+    if IMAGE_STORE_BACKEND == "local":
+        return LocalImageStore(IMAGE_STORE_DIR)
+    if IMAGE_STORE_BACKEND == "s3":
+        return ReadThroughCache(
+            S3ImageStore(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION), IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES
+        )
+    raise ValueError(f"Invalid IMAGE_STORE_BACKEND '{IMAGE_STORE_BACKEND}'. Must be 'local' or 's3'.")
+
+
+image_store = _make_backend()
+
+
+# --- Golden Images ---
+def read_image(reference: str, rendition: str = "normalized") -> bytes:
+    """
+    Reads a golden image (blocking). `reference` is what register_drug stored:
+    a content address, or a file path for drugs registered before the store.
+    """
+    digest = digest_of(reference)
+    if digest is None:
+        with open(reference, "rb") as f:
+            return f.read()
+    return b"".join(image_store.read_range(digest, rendition))
+
+
+def image_mime_type(digest: str, rendition: str) -> str:
+    """Sniffs an object's type from its first bytes."""
+    with closing(image_store.read_range(digest, rendition, 0, 15)) as chunks:
+        head = next(chunks, b"")
+    return detect_mime_type(head) or "application/octet-stream"
+
+
+@dataclass
+class StoredImage:
+    reference: str  # content address to keep on the medicine row
+    normalized: bytes
+    deduplicated: bool  # the same file was already stored
+
+
+async def _store_renditions(digest: str, original: bytes | str) -> StoredImage:
+    """
+    Stores `original` (bytes, or a file path that is streamed to the store
+    and only read by the decoder) under `digest` with its renditions. An
+    image already in the store is not written again. The normalized
+    rendition is written last, so its presence means the set is complete.
+    """
+    if await asyncio.to_thread(image_store.exists, digest, "normalized"):
+        normalized = await asyncio.to_thread(b"".join, image_store.read_range(digest, "normalized"))
+        return StoredImage(content_address(digest), normalized, deduplicated=True)
+
+    # Only an upload that decodes as an image is stored at all
+    normalized = (await normalize_upload(original)).data
+    thumbnail = await make_thumbnail(original)
+    if isinstance(original, str):
+        await asyncio.to_thread(image_store.put_file, digest, "original", original)
+    else:
+        await asyncio.to_thread(image_store.put_bytes, digest, "original", original)
+    if thumbnail is not None:
+        await asyncio.to_thread(image_store.put_bytes, digest, "thumbnail", thumbnail)
+    await asyncio.to_thread(image_store.put_bytes, digest, "normalized", normalized)
+    return StoredImage(content_address(digest), normalized, deduplicated=False)
+
+
+async def store_golden_bytes(original: bytes, digest: str | None = None) -> StoredImage:
+    """
+    Stores a golden image under its sha256 with its original, normalized
+    and thumbnail renditions.
+
+    Raises PIL.UnidentifiedImageError if `original` is not an image.
+    """
+    digest = digest or await asyncio.to_thread(lambda: hashlib.sha256(original).hexdigest())
+    return await _store_renditions(digest, original)
+
+
+async def store_golden_image(spool: SpooledUpload) -> StoredImage:
+    """
+    Stores a spooled golden image upload like store_golden_bytes, streaming
+    the original from the spool file instead of holding it in memory, then
+    deletes the spool file.
+    """
+    try:
+        return await _store_renditions(spool.sha256, spool.path)
+    finally:
+        await asyncio.to_thread(discard, spool.path)
@@ -0,0 +1,183 @@
+# internal imports
+import io
+import asyncio
+import mimetypes
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# external imports
+from config.settings import (
+    IMAGE_NORMALIZATION_ENABLED,
+    IMAGE_MAX_DIMENSION,
+    IMAGE_JPEG_QUALITY,
+    IMAGE_POOL,
+    IMAGE_POOL_WORKERS,
+    THUMBNAIL_MAX_DIMENSION,
+)
+
+# HEIC/HEIF support is optional: phones upload it, but Pillow needs a plugin
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+
+# --- MIME detection ---
+_MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"mif1", b"msf1"}
+
+
+def detect_mime_type(data: bytes) -> str | None:
+    """Sniffs the real image type from its leading bytes, ignoring what the client claimed."""
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in _HEIF_BRANDS:
+        return "image/heic"
+    return None
+
+
+def extension_for(mime_type: str) -> str:
+    if mime_type == "image/jpeg":
+        return ".jpg"
+    return mimetypes.guess_extension(mime_type) or ".bin"
+
+
+# --- Normalization ---
+@dataclass
+class NormalizedImage:
+    data: bytes
+    mime_type: str
+    width: int | None = None
+    height: int | None = None
+
+
+def normalize_image(data: bytes | str) -> NormalizedImage:
+    """
+    Decodes `data` (image bytes or a file path), applies its EXIF orientation, shrinks it to fit within
+    IMAGE_MAX_DIMENSION and re-encodes it as a metadata-free JPEG.
+
+    Raises PIL.UnidentifiedImageError if the bytes are not a readable image,
+    unless they are sniffed as HEIC, which Gemini accepts as-is when no
+    HEIF decoder is installed.
+    """
+    source = data if isinstance(data, str) else io.BytesIO(data)
+    try:
+        with Image.open(source) as img:
+            # JPEG decoder can downscale by powers of two while decoding
+            img.draft("RGB", (IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                rgba = img.convert("RGBA")
+                background.paste(rgba, mask=rgba.getchannel("A"))
+                img = background
+            else:
+                img = img.convert("RGB")
+    except UnidentifiedImageError:
+        if isinstance(data, str):
+            with open(data, "rb") as f:
+                data = f.read()
+        mime_type = detect_mime_type(data)
+        if mime_type == "image/heic":
+            return NormalizedImage(data=data, mime_type=mime_type)
+        raise
+
+    img.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return NormalizedImage(data=output.getvalue(), mime_type="image/jpeg", width=img.width, height=img.height)
+
+
+def normalize_file_in_place(path: str) -> NormalizedImage:
+    """
+    Normalizes the image file at `path` and overwrites it with the result,
+    so a spooled upload can be used directly without another copy.
+    """
+    if not IMAGE_NORMALIZATION_ENABLED:
+        with open(path, "rb") as f:
+            data = f.read()
+        return NormalizedImage(data=data, mime_type=detect_mime_type(data) or "image/jpeg")
+    normalized = normalize_image(path)
+    with open(path, "wb") as f:
+        f.write(normalized.data)
+    return normalized
+
+
+def prepare_stored_image(data: bytes) -> bytes:
+    """
+    Returns golden image bytes ready to send to the model. Images written by
+    register_drug are already normalized and kept as-is; older, oversized or
+    non-JPEG files are normalized in memory (the file on disk is untouched).
+    """
+    if not IMAGE_NORMALIZATION_ENABLED:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format == "JPEG" and max(img.size) <= IMAGE_MAX_DIMENSION and "exif" not in img.info:
+                return data
+    except UnidentifiedImageError:
+        return data
+    return normalize_image(data).data
+
+
+def thumbnail_image(data: bytes | str) -> bytes | None:
+    """Small JPEG preview of `data` (image bytes or a file path), or None if Pillow cannot decode it (e.g. HEIC without a plugin)."""
+    source = data if isinstance(data, str) else io.BytesIO(data)
+    try:
+        with Image.open(source) as img:
+            img.draft("RGB", (THUMBNAIL_MAX_DIMENSION, THUMBNAIL_MAX_DIMENSION))
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except UnidentifiedImageError:
+        return None
+    img.thumbnail((THUMBNAIL_MAX_DIMENSION, THUMBNAIL_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def _make_pool() -> Executor:
+    if IMAGE_POOL == "process":
+        return ProcessPoolExecutor(max_workers=IMAGE_POOL_WORKERS)
+    if IMAGE_POOL == "thread":
+        return ThreadPoolExecutor(max_workers=IMAGE_POOL_WORKERS, thread_name_prefix="image-normalize")
+    raise ValueError(f"Invalid IMAGE_POOL '{IMAGE_POOL}'. Must be 'thread' or 'process'.")
+
+
+_pool = _make_pool()
+
+
+async def normalize_upload(data: bytes | str) -> NormalizedImage:
+    """
+    Normalizes an uploaded image (bytes or a file path, which is only read
+    by the decoder) on the image pool. When normalization is disabled the
+    bytes are passed through with their sniffed MIME type.
+    """
+    if not IMAGE_NORMALIZATION_ENABLED:
+        if isinstance(data, str):
+            data = await asyncio.to_thread(Path(data).read_bytes)
+        return NormalizedImage(data=data, mime_type=detect_mime_type(data) or "image/jpeg")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, normalize_image, data)
+
+
+async def normalize_spooled(path: str) -> NormalizedImage:
+    """Normalizes a spooled upload file in place on the image pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, normalize_file_in_place, path)
+
+
+async def make_thumbnail(data: bytes | str) -> bytes | None:
+    """Builds the thumbnail rendition of an image on the image pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, thumbnail_image, data)
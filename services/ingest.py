@@ -0,0 +1,517 @@
+# internal imports
+import csv
+import json
+import uuid
+import shutil
+import asyncio
+import logging
+import zipfile
+import argparse
+from pathlib import Path
+from itertools import islice
+from typing import Iterator
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from PIL import UnidentifiedImageError
+import numpy as np
+from sqlmodel import Session, select, update, or_, and_
+
+# external imports
+from config.settings import (
+    INGEST_DIR,
+    INGEST_CHUNK_SIZE,
+    INGEST_PARALLEL,
+    INGEST_STALE_SECONDS,
+)
+from db.database import engine, async_engine, upsert, has_unique_index
+from db.models import CreateMedicine, MedicineDescriptor, CatalogVersion, IngestRun, IngestRowError, ReferenceImage
+from services.catalog import catalog
+from services.embeddings import compute_embedding
+from services.golden_cache import golden_images
+from services.image_store import store_golden_bytes
+from services.prescreen import ImageDescriptor, compute_descriptor, descriptor_to_row, forget_golden_descriptor
+from services.references import new_reference
+
+logger = logging.getLogger(__name__)
+
+
+VALID_DRUG_TYPES = ("syrup", "tablet")
+REQUIRED_FIELDS = ("drug_name", "drug_type", "nafdac_number", "manufacturer", "box_image")
+
+# Runs waiting for the ingest worker on this process; the IngestRun row is the source of truth
+_queue: asyncio.Queue[str] = asyncio.Queue()
+_worker_task: asyncio.Task | None = None
+
+
+class RowError(ValueError):
+    """A manifest row that cannot be ingested. It is recorded against the row and the run goes on."""
+
+
+@dataclass
+class IngestedRow:
+    row: int
+    drug_name: str
+    drug_type: str
+    nafdac_number: str
+    manufacturer: str
+    box_reference: str
+    blister_reference: str | None
+    box_descriptor: ImageDescriptor
+    box_embedding: np.ndarray
+    blister_embedding: np.ndarray | None = None
+
+
+@dataclass
+class RowFailure:
+    row: int
+    drug_name: str | None
+    error: str
+
+
+# --- Manifest and images ---
+def read_manifest(path: str) -> Iterator[tuple[int, dict | str]]:
+    """
+    Yields (row number, row) one at a time from a CSV manifest with a header
+    line, or a JSON Lines manifest (rows are then the raw lines, parsed by
+    validate_row). Row numbers count data rows from 1.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == "{":
+            number = 0
+            for line in f:
+                if line.strip():
+                    number += 1
+                    yield number, line
+        else:
+            for number, row in enumerate(csv.DictReader(f), 1):
+                yield number, row
+
+
+def validate_row(raw: dict | str) -> dict:
+    """Checks one manifest row and normalizes it the way register_drug does."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise RowError(f"Invalid JSON: {str(e)}")
+        if not isinstance(raw, dict):
+            raise RowError("Row is not a JSON object.")
+    fields = {key: str(value).strip() if value is not None else "" for key, value in raw.items() if key}
+    missing = [name for name in REQUIRED_FIELDS if not fields.get(name)]
+    if missing:
+        raise RowError(f"Missing {', '.join(missing)}.")
+    drug_type = fields["drug_type"].lower()
+    if drug_type not in VALID_DRUG_TYPES:
+        raise RowError(f"Invalid drug type '{fields['drug_type']}'. Must be either 'syrup' or 'tablet'.")
+    return {
+        "drug_name": fields["drug_name"].lower(),
+        "drug_type": drug_type,
+        "nafdac_number": fields["nafdac_number"],
+        "manufacturer": fields["manufacturer"],
+        "box_image": fields["box_image"],
+        "blister_pack_image": fields.get("blister_pack_image") or None,
+    }
+
+
+class ImageSource:
+    """
+    Reads the images a manifest names from a zip archive or a directory
+    (blocking). Names are matched exactly, or by file name when the archive
+    keeps its images in a folder.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.archive = None
+        self._names: set[str] = set()
+        self._by_basename: dict[str, str] = {}
+        if self.path.is_file():
+            # ZipFile serializes member reads itself, so worker threads can share it
+            self.archive = zipfile.ZipFile(self.path)
+            self._names = set(self.archive.namelist())
+            for name in self._names:
+                self._by_basename.setdefault(Path(name).name, name)
+
+    def read(self, name: str) -> bytes:
+        if self.archive is not None:
+            member = name if name in self._names else self._by_basename.get(Path(name).name)
+            if member is None:
+                raise RowError(f"Image '{name}' is not in the archive.")
+            return self.archive.read(member)
+
+        root = self.path.resolve()
+        path = (root / name).resolve()
+        if not path.is_relative_to(root) or not path.is_file():
+            raise RowError(f"Image '{name}' is not in the image directory.")
+        return path.read_bytes()
+
+    def close(self) -> None:
+        if self.archive is not None:
+            self.archive.close()
+
+
+async def prepare_row(number: int, raw: dict | str, source: ImageSource) -> IngestedRow:
+    """Validates a row, then stores its images (normalized on the image pool) and describes and embeds them."""
+    fields = validate_row(raw)
+
+    box_bytes = await asyncio.to_thread(source.read, fields["box_image"])
+    try:
+        stored_box = await store_golden_bytes(box_bytes)
+        box_descriptor = await asyncio.to_thread(compute_descriptor, stored_box.normalized)
+        box_embedding = await asyncio.to_thread(compute_embedding, stored_box.normalized)
+    except UnidentifiedImageError:
+        raise RowError("Box image is not a valid image.")
+
+    blister_reference = blister_embedding = None
+    if fields["blister_pack_image"]:
+        blister_bytes = await asyncio.to_thread(source.read, fields["blister_pack_image"])
+        try:
+            stored_blister = await store_golden_bytes(blister_bytes)
+            blister_embedding = await asyncio.to_thread(compute_embedding, stored_blister.normalized)
+            blister_reference = stored_blister.reference
+        except UnidentifiedImageError:
+            raise RowError("Blister pack image is not a valid image.")
+
+    return IngestedRow(
+        row=number,
+        drug_name=fields["drug_name"],
+        drug_type=fields["drug_type"],
+        nafdac_number=fields["nafdac_number"],
+        manufacturer=fields["manufacturer"],
+        box_reference=stored_box.reference,
+        blister_reference=blister_reference,
+        box_descriptor=box_descriptor,
+        box_embedding=box_embedding,
+        blister_embedding=blister_embedding,
+    )
+
+
+# --- Persistence (blocking, run in worker threads) ---
+def _commit_chunk(run_id: str, rows: list[IngestedRow], failures: list[RowFailure], rows_done: int) -> list[int]:
+    """
+    Upserts a chunk of drugs, their pre-screen descriptors and reference
+    images, records the chunk's row errors and advances the run's
+    checkpoint, all in one transaction. Returns the ids of the upserted drugs.
+    """
+    now = datetime.utcnow()
+    # A drug listed twice in the chunk: the later row wins, as it would across chunks
+    latest = {(row.drug_name, row.drug_type): row for row in rows}
+    medicine_ids = []
+    with Session(engine) as session:
+        if latest:
+            statement = upsert(
+                CreateMedicine,
+                [{
+                    "drug_name": row.drug_name,
+                    "drug_type": row.drug_type,
+                    "nafdac_number": row.nafdac_number,
+                    "manufacturer": row.manufacturer,
+                    "golden_box_image_path": row.box_reference,
+                    "golden_blister_image_path": row.blister_reference,
+                    "created_at": now,
+                } for row in latest.values()],
+                conflict=["drug_name", "drug_type"],
+                update_columns=["nafdac_number", "manufacturer", "golden_box_image_path", "golden_blister_image_path"],
+            ).returning(CreateMedicine.id, CreateMedicine.drug_name, CreateMedicine.drug_type)
+            ids = {(name, drug_type): medicine_id for medicine_id, name, drug_type in session.execute(statement)}
+
+            session.execute(upsert(
+                MedicineDescriptor,
+                [descriptor_to_row(ids[key], row.box_descriptor).model_dump() for key, row in latest.items()],
+                conflict=["medicine_id"],
+                update_columns=["box_dhash", "box_histogram", "box_stddev", "created_at"],
+            ))
+            # A re-ingested drug with new images keeps its old ones as additional references
+            references = []
+            for key, row in latest.items():
+                references.append(new_reference(ids[key], "box", row.box_reference, row.box_embedding))
+                if row.blister_reference is not None:
+                    references.append(new_reference(ids[key], "blister", row.blister_reference, row.blister_embedding))
+            session.execute(upsert(
+                ReferenceImage,
+                [reference.model_dump(exclude={"id"}) for reference in references],
+                conflict=["medicine_id", "role", "image_ref"],
+                update_columns=[],
+            ))
+            # One catalog version bump per chunk: server workers reload the catalog
+            # on their next version check and, seeing the new golden image paths,
+            # drop their golden image and pre-screen entries built from the old ones
+            session.execute(
+                update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+            )
+            medicine_ids = list(ids.values())
+
+        session.add_all(
+            IngestRowError(run_id=run_id, row=failure.row, drug_name=failure.drug_name, error=failure.error)
+            for failure in failures
+        )
+        session.execute(
+            update(IngestRun)
+            .where(IngestRun.id == run_id)
+            .values(
+                rows_done=rows_done,
+                rows_ok=IngestRun.rows_ok + len(rows),
+                rows_failed=IngestRun.rows_failed + len(failures),
+                updated_at=now,
+            )
+        )
+        session.commit()
+    return medicine_ids
+
+
+def create_run(source: str, manifest_path: str, images_path: str, run_id: str | None = None) -> IngestRun:
+    run = IngestRun(id=run_id or uuid.uuid4().hex, source=source, manifest_path=manifest_path, images_path=images_path)
+    with Session(engine) as session:
+        session.add(run)
+        session.commit()
+        session.refresh(run)
+    return run
+
+
+def get_run(run_id: str) -> IngestRun | None:
+    with Session(engine) as session:
+        return session.get(IngestRun, run_id)
+
+
+def get_row_errors(run_id: str, offset: int = 0, limit: int = 100) -> list[IngestRowError]:
+    with Session(engine) as session:
+        return list(session.exec(
+            select(IngestRowError)
+            .where(IngestRowError.run_id == run_id)
+            .order_by(IngestRowError.row)
+            .offset(offset)
+            .limit(limit)
+        ).all())
+
+
+def _claim_run(run_id: str) -> IngestRun | None:
+    """Atomically moves a run to "running"; None if another worker owns it or it has finished."""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=INGEST_STALE_SECONDS)
+    with Session(engine) as session:
+        claimed = session.execute(
+            update(IngestRun)
+            .where(IngestRun.id == run_id)
+            .where(or_(
+                IngestRun.status == "queued",
+                and_(IngestRun.status == "running", IngestRun.updated_at < stale_before)
+            ))
+            .values(status="running", error=None, updated_at=now)
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return None
+        return session.get(IngestRun, run_id)
+
+
+def _set_status(run_id: str, status: str, error: str | None = None, only_from: str | None = None) -> bool:
+    with Session(engine) as session:
+        statement = update(IngestRun).where(IngestRun.id == run_id)
+        if only_from is not None:
+            statement = statement.where(IngestRun.status == only_from)
+        changed = session.execute(
+            statement.values(status=status, error=error, updated_at=datetime.utcnow())
+        ).rowcount
+        session.commit()
+        return bool(changed)
+
+
+def _pending_run_ids() -> list[str]:
+    """Runs left queued, or running but orphaned, e.g. by a worker restart."""
+    stale_before = datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+    with Session(engine) as session:
+        return list(session.exec(
+            select(IngestRun.id)
+            .where(or_(
+                IngestRun.status == "queued",
+                and_(IngestRun.status == "running", IngestRun.updated_at < stale_before)
+            ))
+            .order_by(IngestRun.created_at)
+        ).all())
+
+
+def run_to_dict(run: IngestRun) -> dict:
+    return {
+        "run_id": run.id,
+        "status": run.status,
+        "source": run.source,
+        "rows_done": run.rows_done,
+        "rows_ok": run.rows_ok,
+        "rows_failed": run.rows_failed,
+        "error": run.error,
+        "created_at": run.created_at.isoformat(),
+        "updated_at": run.updated_at.isoformat(),
+    }
+
+
+# --- Processing ---
+async def process_run(run: IngestRun) -> None:
+    """
+    Streams the manifest of a claimed run in chunks of INGEST_CHUNK_SIZE
+    rows, skipping rows an earlier attempt already committed. Each chunk's
+    rows are validated and their images stored INGEST_PARALLEL at a time,
+    then the chunk is upserted in one transaction that also checkpoints
+    progress, so an interrupted run resumes where it stopped.
+    """
+    # Drugs are upserted on (drug_name, drug_type); init_db cannot add the
+    # unique index while a database from before it holds duplicate drugs
+    if not await asyncio.to_thread(has_unique_index, CreateMedicine, ["drug_name", "drug_type"]):
+        raise RuntimeError(
+            "The drug table has no unique index on (drug_name, drug_type), so ingested drugs cannot be "
+            "matched to existing ones. Remove duplicate drugs and restart the server to create "
+            "ix_createmedicine_drug_name_drug_type, then resume this run."
+        )
+
+    slots = asyncio.Semaphore(INGEST_PARALLEL)
+
+    async def bounded(number: int, raw: dict | str, source: ImageSource) -> IngestedRow | RowFailure:
+        drug_name = raw.get("drug_name") if isinstance(raw, dict) else None
+        async with slots:
+            try:
+                return await prepare_row(number, raw, source)
+            except RowError as e:
+                return RowFailure(number, drug_name, str(e))
+            except Exception as e:
+                logger.exception("Ingest row failed", extra={"run_id": run.id, "row": number})
+                return RowFailure(number, drug_name, f"An internal error occurred: {str(e)}")
+
+    source = await asyncio.to_thread(ImageSource, run.images_path)
+    try:
+        rows = (item for item in read_manifest(run.manifest_path) if item[0] > run.rows_done)
+        while chunk := await asyncio.to_thread(lambda: list(islice(rows, INGEST_CHUNK_SIZE))):
+            results = await asyncio.gather(*(bounded(number, raw, source) for number, raw in chunk))
+            ingested = [result for result in results if isinstance(result, IngestedRow)]
+            failures = [result for result in results if isinstance(result, RowFailure)]
+            medicine_ids = await asyncio.to_thread(_commit_chunk, run.id, ingested, failures, chunk[-1][0])
+
+            # Only reaches this process (a server worker when ingesting through
+            # the API, nothing else when run from the CLI); other workers catch up
+            # through the version bump
+            for medicine_id in medicine_ids:
+                golden_images.invalidate(medicine_id)
+                forget_golden_descriptor(medicine_id)
+            await catalog.refresh_if_stale(force=True)
+            logger.info("Ingest chunk committed", extra={
+                "run_id": run.id, "rows_done": chunk[-1][0], "rows_ok": len(ingested), "rows_failed": len(failures)
+            })
+    finally:
+        await asyncio.to_thread(source.close)
+
+
+async def _run(run_id: str) -> None:
+    run = await asyncio.to_thread(_claim_run, run_id)
+    if run is None:
+        return
+    try:
+        await process_run(run)
+    except asyncio.CancelledError:
+        # Shutting down: hand the run back so the next start resumes it at once
+        # (shielded, so a second cancellation cannot interrupt the write)
+        await asyncio.shield(asyncio.to_thread(_set_status, run_id, "queued"))
+        raise
+    except Exception as e:
+        logger.exception("Ingest run failed", extra={"run_id": run_id})
+        await asyncio.to_thread(_set_status, run_id, "failed", str(e))
+        return
+    await asyncio.to_thread(_set_status, run_id, "completed")
+
+    # Uploaded manifests and archives are only kept while a run can be resumed
+    run_dir = Path(INGEST_DIR) / run_id
+    if Path(run.manifest_path).parent == run_dir:
+        await asyncio.to_thread(shutil.rmtree, run_dir, True)
+
+
+def submit_run(run_id: str) -> None:
+    _queue.put_nowait(run_id)
+
+
+async def resume_run(run_id: str) -> bool:
+    """Re-queues a failed run; it continues after its last committed chunk."""
+    if not await asyncio.to_thread(_set_status, run_id, "queued", None, "failed"):
+        return False
+    submit_run(run_id)
+    return True
+
+
+async def _worker() -> None:
+    while True:
+        run_id = await _queue.get()
+        try:
+            await _run(run_id)
+        except Exception:
+            logger.exception("Ingest worker error", extra={"run_id": run_id})
+        finally:
+            _queue.task_done()
+
+
+async def start_ingest_worker() -> None:
+    """Starts the ingest worker and re-queues runs left unfinished by a previous run."""
+    global _worker_task
+    for run_id in await asyncio.to_thread(_pending_run_ids):
+        _queue.put_nowait(run_id)
+    _worker_task = asyncio.create_task(_worker())
+
+
+async def stop_ingest_worker() -> None:
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        await asyncio.gather(_worker_task, return_exceptions=True)
+        _worker_task = None
+
+
+# --- Command line ---
+async def _ingest_from_cli(args) -> IngestRun:
+    if args.resume:
+        run = await asyncio.to_thread(get_run, args.resume)
+        if run is None:
+            raise SystemExit(f"No ingest run '{args.resume}'.")
+        if run.status == "completed":
+            raise SystemExit(f"Ingest run '{run.id}' has already completed.")
+        # Also takes over a run whose process died before it went stale
+        await asyncio.to_thread(_set_status, run.id, "queued")
+    else:
+        if not args.manifest or not args.images:
+            raise SystemExit("MANIFEST and IMAGES are required unless --resume is given.")
+        run = await asyncio.to_thread(
+            create_run, Path(args.manifest).name, str(Path(args.manifest).resolve()), str(Path(args.images).resolve())
+        )
+        print(f"Ingest run {run.id}")
+    try:
+        await _run(run.id)
+    finally:
+        # Pooled aiosqlite connections keep their threads (and the process) alive
+        await async_engine.dispose()
+    return await asyncio.to_thread(get_run, run.id)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Bulk-load drugs into the catalog from a CSV/JSONL manifest and an image archive or directory.",
+        epilog="Example: python -m services.ingest register.csv images.zip",
+    )
+    parser.add_argument("manifest", nargs="?", help="CSV (with header) or JSON Lines manifest")
+    parser.add_argument("images", nargs="?", help="Zip archive or directory holding the images the manifest names")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue an interrupted or failed run")
+    parser.add_argument("--errors", type=int, default=50, help="Row errors to print at the end")
+    args = parser.parse_args(argv)
+
+    from db.database import init_db
+    from services.log import configure_logging
+
+    configure_logging()
+    init_db()
+    catalog.load()
+    run = asyncio.run(_ingest_from_cli(args))
+
+    print(json.dumps(run_to_dict(run), indent=2))
+    for error in get_row_errors(run.id, limit=args.errors):
+        print(f"row {error.row} ({error.drug_name or '?'}): {error.error}")
+    if run.status != "completed":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# internal imports
+import logging
+import json
+import uuid
+import shutil
+import socket
+import asyncio
+import ipaddress
+from pathlib import Path
+from urllib.parse import urlsplit
+from datetime import datetime, timedelta
+import httpx
+from fastapi import HTTPException
+from sqlmodel import Session, select, update, or_, and_
+
+# external imports
+from config.settings import (
+    JOB_WORKERS,
+    JOB_QUEUE_MAX,
+    JOB_STALE_SECONDS,
+    JOBS_DIR,
+    JOB_CALLBACK_ATTEMPTS,
+    JOB_CALLBACK_TIMEOUT_SECONDS,
+    JOB_CALLBACK_ALLOWED_HOSTS,
+)
+from db.database import engine
+from db.models import VerificationJob
+from services.audit import audit_verification
+from services.log import request_id_var
+from services.resilience import ModelUnavailable
+from services.verification import normalize_drug_type, lookup_golden_drug, load_golden_images, run_verification
+
+logger = logging.getLogger(__name__)
+
+
+# Job ids waiting for a worker on this process. The database row is the
+# source of truth; the queue only tells local workers what to pick up.
+_queue: asyncio.Queue[str] = asyncio.Queue()
+_workers: list[asyncio.Task] = []
+
+
+# --- Persistence (blocking, run in worker threads) ---
+def _insert_job(job: VerificationJob) -> None:
+    with Session(engine) as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+
+
+def get_job(job_id: str) -> VerificationJob | None:
+    with Session(engine) as session:
+        return session.get(VerificationJob, job_id)
+
+
+def _claim_job(job_id: str) -> VerificationJob | None:
+    """
+    Atomically moves a job to "running". Returns None if another worker
+    already owns it (or it has finished), so each job runs once.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=JOB_STALE_SECONDS)
+    with Session(engine) as session:
+        claimed = session.execute(
+            update(VerificationJob)
+            .where(VerificationJob.id == job_id)
+            .where(or_(
+                VerificationJob.status == "queued",
+                and_(VerificationJob.status == "running", VerificationJob.updated_at < stale_before)
+            ))
+            .values(status="running", updated_at=now, attempts=VerificationJob.attempts + 1)
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return None
+        return session.get(VerificationJob, job_id)
+
+
+def _finish_job(job_id: str, status: str, status_code: int, result) -> None:
+    with Session(engine) as session:
+        job = session.get(VerificationJob, job_id)
+        job.status = status
+        job.status_code = status_code
+        job.result = json.dumps(result)
+        job.updated_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+
+
+def _requeue_job(job_id: str) -> None:
+    with Session(engine) as session:
+        session.execute(
+            update(VerificationJob)
+            .where(VerificationJob.id == job_id)
+            .values(status="queued", updated_at=datetime.utcnow())
+        )
+        session.commit()
+
+
+def _pending_job_ids() -> list[str]:
+    """Jobs left queued, or running but orphaned, e.g. by a worker restart."""
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    with Session(engine) as session:
+        return list(session.exec(
+            select(VerificationJob.id)
+            .where(or_(
+                VerificationJob.status == "queued",
+                and_(VerificationJob.status == "running", VerificationJob.updated_at < stale_before)
+            ))
+            .order_by(VerificationJob.created_at)
+        ).all())
+
+
+def _write_job_files(job_dir: Path, box_bytes: bytes, blister_bytes: bytes | None) -> tuple[str, str | None]:
+    job_dir.mkdir(parents=True, exist_ok=True)
+    box_path = job_dir / "box"
+    box_path.write_bytes(box_bytes)
+    blister_path = None
+    if blister_bytes is not None:
+        blister_path = job_dir / "blister"
+        blister_path.write_bytes(blister_bytes)
+    return str(box_path), (str(blister_path) if blister_path else None)
+
+
+def _read_job_files(job: VerificationJob) -> tuple[bytes, bytes | None]:
+    box_bytes = Path(job.box_image_path).read_bytes()
+    blister_bytes = Path(job.blister_image_path).read_bytes() if job.blister_image_path else None
+    return box_bytes, blister_bytes
+
+
+def job_to_dict(job: VerificationJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_code": job.status_code,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+# --- Callback URLs ---
+def _allow_listed(host: str) -> bool:
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in JOB_CALLBACK_ALLOWED_HOSTS)
+
+
+async def check_callback_url(url: str) -> None:
+    """
+    Raises ValueError unless `url` is an http(s) URL the server may POST to:
+    a host on JOB_CALLBACK_ALLOWED_HOSTS when that is set, else one that
+    resolves only to public addresses (no loopback, private, link-local or
+    cloud metadata addresses). Checked again before every delivery, since
+    DNS can change between submission and callback.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise ValueError("callback_url is not a valid URL.")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http(s) URL.")
+    host = parts.hostname.lower()
+    if JOB_CALLBACK_ALLOWED_HOSTS:
+        if not _allow_listed(host):
+            raise ValueError("callback_url host is not allowed.")
+        return
+
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ValueError("callback_url host cannot be resolved.")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError("callback_url must point to a public address.")
+
+
+# --- Submission ---
+async def submit_job(
+    drug_name: str,
+    drug_type: str,
+    nafdac_number: str,
+    box_bytes: bytes,
+    blister_bytes: bytes | None = None,
+    callback_url: str | None = None
+) -> VerificationJob:
+    """Persists a verification job with its images and queues it for a local worker."""
+    if _queue.qsize() >= JOB_QUEUE_MAX:
+        raise HTTPException(status_code=503, detail="Verification queue is full. Try again later.")
+    if callback_url:
+        try:
+            await check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    job_id = uuid.uuid4().hex
+    box_path, blister_path = await asyncio.to_thread(
+        _write_job_files, Path(JOBS_DIR) / job_id, box_bytes, blister_bytes
+    )
+    job = VerificationJob(
+        id=job_id,
+        drug_name=drug_name,
+        drug_type=drug_type,
+        nafdac_number=nafdac_number,
+        box_image_path=box_path,
+        blister_image_path=blister_path,
+        callback_url=callback_url,
+    )
+    await asyncio.to_thread(_insert_job, job)
+    _queue.put_nowait(job_id)
+    logger.info("Verification job queued", extra={"job_id": job_id, "drug_name": drug_name})
+    return job
+
+
+# --- Processing ---
+async def _verify_job(job: VerificationJob) -> tuple[int, object]:
+    """Runs the same stages as verify_drug; returns (status_code, verdict or error detail)."""
+    try:
+        with audit_verification("job", job.drug_name, job.drug_type, job.nafdac_number) as audit:
+            drug_type_lower = normalize_drug_type(job.drug_type)
+
+            golden_drug = await lookup_golden_drug(job.drug_name, drug_type_lower)
+            audit.set_drug(golden_drug)
+            golden = await load_golden_images(golden_drug)
+            box_bytes, blister_bytes = await asyncio.to_thread(_read_job_files, job)
+            return 200, audit.complete(await run_verification(golden_drug, golden, job.nafdac_number, box_bytes, blister_bytes))
+    except ModelUnavailable:
+        raise
+    except HTTPException as e:
+        return e.status_code, e.detail
+
+
+async def _send_callback(job: VerificationJob) -> None:
+    payload = job_to_dict(job)
+    # Redirects are not followed: they could lead to an address the check rejects
+    async with httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT_SECONDS, follow_redirects=False) as http:
+        for attempt in range(1, JOB_CALLBACK_ATTEMPTS + 1):
+            try:
+                await check_callback_url(job.callback_url)
+            except ValueError as e:
+                logger.warning("Job callback not sent: %s", e, extra={"job_id": job.id})
+                return
+            try:
+                response = await http.post(job.callback_url, json=payload)
+                if response.status_code < 500:
+                    return
+                logger.warning("Job callback failed", extra={"job_id": job.id, "status_code": response.status_code, "attempt": attempt})
+            except httpx.HTTPError as e:
+                logger.warning("Job callback error: %s", e, extra={"job_id": job.id, "attempt": attempt})
+            await asyncio.sleep(2 ** attempt)
+
+
+async def process_job(job_id: str) -> None:
+    job = await asyncio.to_thread(_claim_job, job_id)
+    if job is None:
+        return
+    # Log lines emitted while the job runs carry its id as their request id
+    request_id_var.set(f"job-{job_id}")
+
+    try:
+        status_code, result = await _verify_job(job)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back so the next start picks it up at once
+        # (shielded, so a second cancellation cannot interrupt the write)
+        await asyncio.shield(asyncio.to_thread(_requeue_job, job_id))
+        raise
+    except ModelUnavailable as e:
+        # The model's circuit breaker is open: park the job instead of failing it
+        await asyncio.to_thread(_requeue_job, job_id)
+        asyncio.get_running_loop().call_later(e.retry_after, _queue.put_nowait, job_id)
+        logger.info("Job deferred, model unavailable", extra={"job_id": job_id, "retry_after_seconds": e.retry_after})
+        return
+    except Exception as e:
+        logger.exception("Job crashed", extra={"job_id": job_id})
+        status_code, result = 500, f"An internal error occurred: {str(e)}"
+    status = "completed" if status_code < 500 else "failed"
+    await asyncio.to_thread(_finish_job, job_id, status, status_code, result)
+
+    # Uploaded images are only needed while the job runs
+    await asyncio.to_thread(shutil.rmtree, Path(JOBS_DIR) / job_id, True)
+
+    if job.callback_url:
+        finished = await asyncio.to_thread(get_job, job_id)
+        await _send_callback(finished)
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await process_job(job_id)
+        except Exception:
+            logger.exception("Job worker error", extra={"job_id": job_id})
+        finally:
+            _queue.task_done()
+
+
+async def start_job_workers() -> None:
+    """Starts the worker pool and re-queues jobs left unfinished by a previous run."""
+    for job_id in await asyncio.to_thread(_pending_job_ids):
+        _queue.put_nowait(job_id)
+    for _ in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop_job_workers() -> None:
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
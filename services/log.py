@@ -0,0 +1,125 @@
+# internal imports
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from fastapi import Request
+
+# external imports
+from config.settings import LOG_LEVEL, LOG_MODEL_PAYLOAD_SAMPLE_RATE, LOG_REDACT_FIELDS
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REDACTED = "[REDACTED]"
+
+# Id of the request (or job / outbox report) being handled. Context variables
+# follow asyncio tasks and asyncio.to_thread, so every log line emitted while
+# serving a request carries its id.
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def redact(value, key: str | None = None):
+    """Replaces the values of LOG_REDACT_FIELDS keys, recursing into dicts and lists."""
+    if key in LOG_REDACT_FIELDS and value is not None:
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, request id and extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = redact(value, key)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records for the listener thread instead of writing to stdout on
+    the event loop. The request id is captured here, on the caller's context,
+    and the traceback rendered, so the record can be formatted anywhere.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> None:
+    """Routes all logging through a queue to a JSON stdout handler on a background thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [_ContextQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flushes queued records; registered to run at interpreter exit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def should_log_payload() -> bool:
+    """Samples verbose model payloads at LOG_MODEL_PAYLOAD_SAMPLE_RATE."""
+    return random.random() < LOG_MODEL_PAYLOAD_SAMPLE_RATE
+
+
+async def bind_request_id(request: Request, call_next):
+    """
+    HTTP middleware giving each request an id (the caller's X-Request-ID
+    if sent) that is attached to its log lines and echoed in the response.
+    """
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        request_id_var.reset(token)
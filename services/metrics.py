@@ -0,0 +1,209 @@
+# internal imports
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+
+# Verification stages are sub-second locally and tens of seconds at the model
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+# --- HTTP ---
+REQUEST_LATENCY = Histogram(
+    "checkmed_http_request_duration_seconds",
+    "Time to produce a response, by route and status code.",
+    ["method", "route", "status_code"],
+    buckets=STAGE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "checkmed_http_requests_in_flight",
+    "Requests currently being handled, by route.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+# --- Verification pipeline ---
+STAGE_LATENCY = Histogram(
+    "checkmed_verification_stage_duration_seconds",
+    "Time spent in each verification stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+VERDICTS = Counter(
+    "checkmed_verdicts_total",
+    "Verdicts reached, by status and the stage that produced them.",
+    ["status", "stage"],
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "checkmed_admission_rejections_total",
+    "Verify requests rejected with 429, by reason (rate_limited, over_capacity).",
+    ["reason"],
+)
+
+# --- Gemini ---
+GEMINI_CALLS = Counter(
+    "checkmed_gemini_calls_total",
+    "Gemini calls by stage, model and outcome (ok, cache_hit, cancelled, timeout, error, circuit_open).",
+    ["stage", "model", "outcome"],
+)
+GEMINI_LATENCY = Histogram(
+    "checkmed_gemini_call_duration_seconds",
+    "Latency of generate_content calls, including the wait for a concurrency slot.",
+    ["stage", "model"],
+    buckets=STAGE_BUCKETS,
+)
+GEMINI_IN_FLIGHT = Gauge(
+    "checkmed_gemini_calls_in_flight",
+    "Gemini calls currently awaiting a response.",
+    multiprocess_mode="livesum",
+)
+VERDICT_PARSES = Counter(
+    "checkmed_verdict_parses_total",
+    "Model outputs parsed as verdicts: ok, repaired locally, or failed (re-queried).",
+    ["outcome"],
+)
+MODEL_ESCALATIONS = Counter(
+    "checkmed_model_escalations_total",
+    "First-pass inspections re-run on the escalation model, by stage and reason.",
+    ["stage", "reason"],
+)
+GEMINI_RETRIES = Counter(
+    "checkmed_gemini_retries_total",
+    "Failed Gemini calls retried after a backoff, by stage and model.",
+    ["stage", "model"],
+)
+RETRIES_DENIED = Counter(
+    "checkmed_gemini_retries_denied_total",
+    "Retryable Gemini failures not retried because the global retry budget was spent.",
+)
+CIRCUIT_STATE = Gauge(
+    "checkmed_gemini_circuit_state",
+    "Circuit breaker state per model: 0 closed, 1 half-open, 2 open.",
+    ["model"],
+    multiprocess_mode="max",
+)
+CONTEXT_CACHE_EVENTS = Counter(
+    "checkmed_context_cache_events_total",
+    "Model-side cached contexts: hit, miss, created, create_failed, too_small, "
+    "refreshed, refresh_failed, stale, evicted and invalidated.",
+    ["event"],
+)
+DEGRADED_RESPONSES = Counter(
+    "checkmed_degraded_responses_total",
+    "Verifications answered in degraded mode while the model was unavailable, by mode.",
+    ["mode"],
+)
+REFERENCE_MATCHES = Counter(
+    "checkmed_reference_matches_total",
+    "Golden views chosen for inspections, by role and whether the primary image or an additional reference was closest.",
+    ["role", "view"],
+)
+IDENTIFICATIONS = Counter(
+    "checkmed_identifications_total",
+    "Products looked up from a box photo, by outcome (identified, ambiguous).",
+    ["outcome"],
+)
+GEMINI_TOKENS = Counter(
+    "checkmed_gemini_tokens_total",
+    "Tokens reported in the response usage metadata, by model, stage and kind.",
+    ["model", "stage", "kind"],
+)
+
+# --- Audit log ---
+AUDIT_EVENTS = Counter(
+    "checkmed_audit_events_total",
+    "Verification audit events by outcome (written, dropped when the buffer was full, retried after a failed flush).",
+    ["outcome"],
+)
+AUDIT_BUFFERED = Gauge(
+    "checkmed_audit_events_buffered",
+    "Verification audit events waiting in memory to be written.",
+    multiprocess_mode="livesum",
+)
+
+
+@dataclass
+class StageTrail:
+    """Durations, verdicts and model outputs of the stages run for one verification."""
+    stages: dict[str, dict] = field(default_factory=dict)  # stage -> {"ms": ..., "status": ...}
+    model_outputs: list[dict] = field(default_factory=list)
+
+
+# Trail of the verification being handled, bound by services.audit. Like the
+# request id it follows asyncio tasks, so concurrent inspections add to it too.
+stage_trail_var: ContextVar[StageTrail | None] = ContextVar("stage_trail", default=None)
+
+# usage_metadata attribute -> "kind" label
+_TOKEN_FIELDS = {
+    "prompt_token_count": "prompt",
+    "candidates_token_count": "candidates",
+    "cached_content_token_count": "cached",
+    "thoughts_token_count": "thoughts",
+    "total_token_count": "total",
+}
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Observes the duration of the enclosed block in the stage latency histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed)
+        trail = stage_trail_var.get()
+        if trail is not None:
+            entry = trail.stages.setdefault(stage, {})
+            entry["ms"] = round(entry.get("ms", 0) + elapsed * 1000, 1)
+
+
+def record_verdict(status: str, stage: str) -> None:
+    VERDICTS.labels(status=status or "UNKNOWN", stage=stage).inc()
+    trail = stage_trail_var.get()
+    if trail is not None:
+        trail.stages.setdefault(stage, {})["status"] = status
+
+
+def record_model_output(model: str, stage: str, verdict: dict, cached: bool = False) -> None:
+    """Adds a model verdict to the trail of the verification being handled, if any."""
+    trail = stage_trail_var.get()
+    if trail is not None:
+        trail.model_outputs.append({"stage": stage, "model": model, "cached": cached, **verdict})
+
+
+def record_token_usage(model: str, stage: str, response) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for attr, kind in _TOKEN_FIELDS.items():
+        count = getattr(usage, attr, None)
+        if count:
+            GEMINI_TOKENS.labels(model=model, stage=stage, kind=kind).inc(count)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Text exposition of all metrics. When PROMETHEUS_MULTIPROC_DIR is set
+    (several uvicorn/gunicorn workers), the values of every worker are
+    aggregated instead of only this process's.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,425 @@
+# internal imports
+import logging
+import os
+import json
+import html
+import uuid
+import random
+import shutil
+import asyncio
+import mimetypes
+from pathlib import Path
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+import aiosmtplib
+from sqlmodel import Session, select, update, or_, and_
+
+# external imports
+from config.report_html import HTML
+from config.settings import (
+    NAFDAC_EMAIL,
+    DEV_MODE,
+    MAIL_USERNAME,
+    MAIL_PASSWORD,
+    MAIL_FROM,
+    MAIL_FROM_NAME,
+    MAIL_SERVER,
+    MAIL_PORT,
+    MAIL_SSL_TLS,
+    MAIL_STARTTLS,
+    MAIL_USE_CREDENTIALS,
+    MAIL_VALIDATE_CERTS,
+    REPORT_OUTBOX_DIR,
+    REPORT_BATCH_SIZE,
+    REPORT_MAX_ATTEMPTS,
+    REPORT_RETRY_BASE_SECONDS,
+    REPORT_POLL_SECONDS,
+    REPORT_SMTP_IDLE_SECONDS,
+    REPORT_STALE_SECONDS,
+    REPORT_DIGEST_SECONDS,
+)
+from db.database import engine
+from db.models import ReportOutbox
+from services.report_stats import record_report
+
+logger = logging.getLogger(__name__)
+
+
+REPORT_SUBJECT = "CRITICAL: Counterfeit Drug Report (ChecMed)"
+DIGEST_SUBJECT = "CRITICAL: Counterfeit Drug Reports digest (ChecMed)"
+# Upper bound on the delay between two delivery attempts
+MAX_RETRY_DELAY_SECONDS = 3600
+
+_sender: asyncio.Task | None = None
+_wake: asyncio.Event | None = None
+
+
+# --- Persistence (blocking, run in worker threads) ---
+def _store_report(report: ReportOutbox, attachments: list[str]) -> ReportOutbox:
+    """
+    Moves the attachments into the outbox directory and inserts the row,
+    stored for analytics and counted in the same transaction.
+    """
+    report_dir = Path(REPORT_OUTBOX_DIR) / uuid.uuid4().hex
+    report_dir.mkdir(parents=True, exist_ok=True)
+    stored = []
+    for path in attachments:
+        target = report_dir / os.path.basename(path)
+        shutil.move(path, target)
+        stored.append(str(target))
+    report.attachment_paths = json.dumps(stored)
+
+    try:
+        with Session(engine) as session:
+            session.add(report)
+            session.flush()
+            record_report(session, report)
+            session.commit()
+            session.refresh(report)
+    except Exception:
+        shutil.rmtree(report_dir, ignore_errors=True)
+        raise
+    return report
+
+
+def _claim_due_reports(limit: int) -> list[ReportOutbox]:
+    """
+    Atomically moves up to `limit` due reports to "sending". Reports another
+    worker claimed first are skipped, so each email goes out once; reports
+    left in "sending" by a crashed worker are picked up again once stale.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=REPORT_STALE_SECONDS)
+    due = or_(
+        and_(ReportOutbox.status == "pending", ReportOutbox.next_attempt_at <= now),
+        and_(ReportOutbox.status == "sending", ReportOutbox.updated_at < stale_before),
+    )
+    claimed_ids = []
+    with Session(engine) as session:
+        candidate_ids = session.exec(
+            select(ReportOutbox.id).where(due).order_by(ReportOutbox.id).limit(limit)
+        ).all()
+        for report_id in candidate_ids:
+            rowcount = session.execute(
+                update(ReportOutbox)
+                .where(ReportOutbox.id == report_id)
+                .where(due)
+                .values(status="sending", updated_at=now, attempts=ReportOutbox.attempts + 1)
+            ).rowcount
+            session.commit()
+            if rowcount:
+                claimed_ids.append(report_id)
+        if not claimed_ids:
+            return []
+        return list(session.exec(
+            select(ReportOutbox).where(ReportOutbox.id.in_(claimed_ids)).order_by(ReportOutbox.id)
+        ).all())
+
+
+def _mark_sent(report_ids: list[int]) -> None:
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        session.execute(
+            update(ReportOutbox)
+            .where(ReportOutbox.id.in_(report_ids))
+            .values(status="sent", sent_at=now, updated_at=now, last_error=None, attachment_paths="[]")
+        )
+        session.commit()
+
+
+def _mark_failed_attempt(reports: list[ReportOutbox], error: str) -> None:
+    """Schedules a retry with exponential backoff, or gives up after REPORT_MAX_ATTEMPTS."""
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        for report in reports:
+            if report.attempts >= REPORT_MAX_ATTEMPTS:
+                values = {"status": "failed"}
+            else:
+                delay = REPORT_RETRY_BASE_SECONDS * 2 ** (report.attempts - 1)
+                delay = min(delay, MAX_RETRY_DELAY_SECONDS) * random.uniform(0.5, 1.5)
+                values = {"status": "pending", "next_attempt_at": now + timedelta(seconds=delay)}
+            session.execute(
+                update(ReportOutbox)
+                .where(ReportOutbox.id == report.id)
+                .values(updated_at=now, last_error=error[:1000], **values)
+            )
+        session.commit()
+
+
+def _remove_attachments(reports: list[ReportOutbox]) -> None:
+    for report in reports:
+        paths = json.loads(report.attachment_paths)
+        if paths:
+            shutil.rmtree(Path(paths[0]).parent, ignore_errors=True)
+
+
+# --- Message building ---
+def _read_attachments(paths: list[str], prefix: str = "") -> list[tuple[bytes, str, str, str]]:
+    """(data, maintype, subtype, filename) of each attachment file."""
+    attachments = []
+    for path in paths:
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        maintype, subtype = mime_type.split("/", 1)
+        with open(path, "rb") as f:
+            attachments.append((f.read(), maintype, subtype, prefix + os.path.basename(path)))
+    return attachments
+
+
+def _attach(message: EmailMessage, attachments: list[tuple[bytes, str, str, str]]) -> None:
+    for data, maintype, subtype, filename in attachments:
+        message.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+
+
+def _new_message(subject: str) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr((MAIL_FROM_NAME, MAIL_FROM))
+    message["To"] = NAFDAC_EMAIL
+    return message
+
+
+def _report_html(report: ReportOutbox) -> str:
+    return HTML.format(
+        drug_name=report.drug_name or "N/A",
+        nafdac_number=report.nafdac_number or "N/A",
+        reason=report.reason or "N/A",
+        location=report.location or "N/A"
+    )
+
+
+def build_report_message(report: ReportOutbox) -> EmailMessage:
+    message = _new_message(REPORT_SUBJECT)
+    message.set_content(_report_html(report), subtype="html")
+    _attach(message, _read_attachments(json.loads(report.attachment_paths)))
+    return message
+
+
+def build_digest_message(reports: list[ReportOutbox], attachments: dict[int, list]) -> EmailMessage:
+    """
+    One email listing several reports, with the attachments read for each
+    (by report id); attachment names are prefixed with their report id.
+    """
+    rows = "".join(
+        "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>".format(
+            report.id,
+            html.escape(report.drug_name),
+            html.escape(report.nafdac_number),
+            html.escape(report.reason),
+            html.escape(report.location),
+            report.created_at.strftime("%Y-%m-%d %H:%M UTC"),
+        )
+        for report in reports
+    )
+    body = (
+        "<html><body>"
+        f"<h2>{len(reports)} counterfeit drug report(s) submitted through ChecMed</h2>"
+        "<table border='1' cellpadding='6' cellspacing='0'>"
+        "<tr><th>Report</th><th>Drug Name</th><th>NAFDAC Number</th><th>Reason</th>"
+        "<th>Location</th><th>Submitted</th></tr>"
+        f"{rows}</table>"
+        "<p>Images for each report are attached as report-&lt;id&gt;-*.</p>"
+        "</body></html>"
+    )
+    message = _new_message(DIGEST_SUBJECT)
+    message.set_content(body, subtype="html")
+    for report in reports:
+        _attach(message, attachments[report.id])
+    return message
+
+
+# --- SMTP connection ---
+class SmtpMailer:
+    """
+    Keeps one SMTP connection open across messages instead of paying the
+    TCP + TLS handshake and login for every report. The connection is
+    re-opened if the server dropped it and closed after sitting idle.
+    """
+
+    def __init__(self):
+        self._smtp: aiosmtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS,
+            validate_certs=MAIL_VALIDATE_CERTS,
+        )
+        await smtp.connect()
+        if MAIL_USE_CREDENTIALS:
+            await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+        logger.info("SMTP connection opened", extra={"server": MAIL_SERVER, "port": MAIL_PORT})
+        return smtp
+
+    async def send(self, message: EmailMessage) -> None:
+        loop = asyncio.get_running_loop()
+        for attempt in (1, 2):
+            if self._smtp is None or not self._smtp.is_connected:
+                self._smtp = await self._connect()
+            try:
+                await self._smtp.send_message(message)
+                self._last_used = loop.time()
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                # Servers drop idle connections; reconnect once before failing the send
+                self._smtp = None
+                if attempt == 2:
+                    raise
+
+    async def close_if_idle(self) -> None:
+        if self._smtp is not None and asyncio.get_running_loop().time() - self._last_used > REPORT_SMTP_IDLE_SECONDS:
+            await self.close()
+
+    async def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+
+# --- Submission ---
+async def enqueue_report(
+    drug_name: str,
+    nafdac_number: str,
+    reason: str,
+    location: str,
+    attachments: list[str]
+) -> ReportOutbox:
+    """
+    Persists a report and its attachment files so the email survives a
+    restart, then wakes the sender. The attachment files are moved into
+    REPORT_OUTBOX_DIR and removed once the email has gone out.
+    """
+    report = ReportOutbox(
+        drug_name=drug_name,
+        nafdac_number=nafdac_number,
+        reason=reason,
+        location=location,
+    )
+    report = await asyncio.to_thread(_store_report, report, attachments)
+    logger.info("Report queued", extra={"report_id": report.id, "drug_name": drug_name})
+    if _wake is not None:
+        _wake.set()
+    return report
+
+
+# --- Sending ---
+def _log_dev_report(report: ReportOutbox) -> None:
+    logger.info("DEV MODE: report email not sent", extra={
+        "report_id": report.id,
+        "subject": REPORT_SUBJECT,
+        "drug_name": report.drug_name,
+        "nafdac_number": report.nafdac_number,
+        "report_reason": report.reason,
+        "report_location": report.location,
+        "attachments": len(json.loads(report.attachment_paths)),
+    })
+
+
+async def _deliver(mailer: SmtpMailer, reports: list[ReportOutbox], message: EmailMessage | None) -> None:
+    ids = [report.id for report in reports]
+    try:
+        if DEV_MODE:
+            for report in reports:
+                _log_dev_report(report)
+        else:
+            await mailer.send(message)
+            logger.info("Report email sent", extra={"report_ids": ids})
+    except Exception as e:
+        logger.warning("Report email failed: %s: %s", type(e).__name__, e, extra={"report_ids": ids})
+        await asyncio.to_thread(_mark_failed_attempt, reports, f"{type(e).__name__}: {e}")
+        return
+    await asyncio.to_thread(_mark_sent, ids)
+    await asyncio.to_thread(_remove_attachments, reports)
+
+
+async def _fail_unbuildable(report: ReportOutbox, error: Exception) -> None:
+    # e.g. an attachment went missing; retrying will not help
+    logger.exception("Could not build report email", extra={"report_id": report.id})
+    report.attempts = REPORT_MAX_ATTEMPTS
+    await asyncio.to_thread(_mark_failed_attempt, [report], f"{type(error).__name__}: {error}")
+
+
+async def _send_digest(mailer: SmtpMailer, reports: list[ReportOutbox]) -> None:
+    """Sends the reports as one email, leaving out (and failing) any whose attachments cannot be read."""
+    if DEV_MODE:
+        await _deliver(mailer, reports, None)
+        return
+    included, attachments = [], {}
+    for report in reports:
+        try:
+            attachments[report.id] = await asyncio.to_thread(
+                _read_attachments, json.loads(report.attachment_paths), f"report-{report.id}-"
+            )
+        except Exception as e:
+            await _fail_unbuildable(report, e)
+            continue
+        included.append(report)
+    if included:
+        message = await asyncio.to_thread(build_digest_message, included, attachments)
+        await _deliver(mailer, included, message)
+
+
+async def send_due_reports(mailer: SmtpMailer) -> int:
+    """Sends one batch of due reports; returns how many were claimed."""
+    reports = await asyncio.to_thread(_claim_due_reports, REPORT_BATCH_SIZE)
+    if not reports:
+        return 0
+
+    if REPORT_DIGEST_SECONDS > 0:
+        await _send_digest(mailer, reports)
+        return len(reports)
+
+    for report in reports:
+        try:
+            message = None if DEV_MODE else await asyncio.to_thread(build_report_message, report)
+        except Exception as e:
+            await _fail_unbuildable(report, e)
+            continue
+        await _deliver(mailer, [report], message)
+    return len(reports)
+
+
+async def _run_sender() -> None:
+    mailer = SmtpMailer()
+    try:
+        while True:
+            _wake.clear()
+            try:
+                # Drain everything that is due, batch by batch, over one connection
+                while await send_due_reports(mailer) >= REPORT_BATCH_SIZE:
+                    pass
+                await mailer.close_if_idle()
+            except Exception:
+                logger.exception("Report sender error")
+
+            if REPORT_DIGEST_SECONDS > 0:
+                # Digest mode ignores wake-ups and sends once per interval
+                await asyncio.sleep(REPORT_DIGEST_SECONDS)
+                continue
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=REPORT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await mailer.close()
+
+
+async def start_report_sender() -> None:
+    """Starts the outbox sender; reports left pending by a previous run go out first."""
+    global _sender, _wake
+    _wake = asyncio.Event()
+    _sender = asyncio.create_task(_run_sender())
+
+
+async def stop_report_sender() -> None:
+    global _sender
+    if _sender is not None:
+        _sender.cancel()
+        await asyncio.gather(_sender, return_exceptions=True)
+        _sender = None
@@ -0,0 +1,199 @@
+# internal imports
+import io
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from PIL import Image, ImageOps, ImageStat
+from sqlmodel import Session
+
+# external imports
+from config.settings import (
+    PRESCREEN_BLANK_STDDEV,
+    PRESCREEN_MISMATCH_DHASH_BITS,
+    PRESCREEN_MISMATCH_HIST_SIMILARITY,
+    PRESCREEN_DUPLICATE_DHASH_BITS,
+    PRESCREEN_DUPLICATE_HIST_SIMILARITY,
+    PRESCREEN_KNOWN_GOOD_PER_DRUG,
+)
+from db.models import CreateMedicine, MedicineDescriptor
+from db.database import engine
+
+
+@dataclass
+class ImageDescriptor:
+    """Cheap perceptual summary of an image used to pre-screen uploads."""
+    dhash: int  # 64-bit difference hash
+    histogram: list[float]  # normalised 4x4x4 RGB histogram
+    stddev: float  # grayscale standard deviation (≈0 for blank photos)
+
+
+# --- Descriptor computation ---
+def compute_descriptor(image_bytes: bytes) -> ImageDescriptor:
+    """
+    Decodes `image_bytes` at low resolution and computes its descriptor.
+    Raises PIL.UnidentifiedImageError if the bytes are not an image.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Let the JPEG decoder downscale while decoding; we only need a thumbnail
+        img.draft("RGB", (64, 64))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+
+    gray = img.convert("L")
+    stddev = ImageStat.Stat(gray).stddev[0]
+
+    # dHash: compare horizontally adjacent pixels of a 9x8 grayscale thumbnail
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (1 if left > right else 0)
+
+    # 4 bins per channel -> 64-bin colour histogram
+    bins = [0] * 64
+    small = img.resize((32, 32), Image.Resampling.BILINEAR)
+    for r, g, b in small.getdata():
+        bins[(r >> 6) * 16 + (g >> 6) * 4 + (b >> 6)] += 1
+    total = float(sum(bins))
+    histogram = [count / total for count in bins]
+
+    return ImageDescriptor(dhash=dhash, histogram=histogram, stddev=stddev)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def histogram_similarity(a: list[float], b: list[float]) -> float:
+    """Histogram intersection: 1.0 for identical colour distributions, 0.0 for disjoint ones."""
+    return sum(min(x, y) for x, y in zip(a, b))
+
+
+def descriptor_to_row(medicine_id: int, descriptor: ImageDescriptor) -> MedicineDescriptor:
+    return MedicineDescriptor(
+        medicine_id=medicine_id,
+        box_dhash=f"{descriptor.dhash:016x}",
+        box_histogram=",".join(f"{value:.5f}" for value in descriptor.histogram),
+        box_stddev=descriptor.stddev,
+    )
+
+
+def descriptor_from_row(row: MedicineDescriptor) -> ImageDescriptor:
+    return ImageDescriptor(
+        dhash=int(row.box_dhash, 16),
+        histogram=[float(value) for value in row.box_histogram.split(",")],
+        stddev=row.box_stddev,
+    )
+
+
+# --- Golden descriptors and known-good submissions ---
+# Both are per drug and tagged with the golden box they belong to, so an
+# entry is dropped once the drug's golden box changes, on this worker or
+# another (register, ingest CLI), as soon as the catalog shows the new path
+@dataclass
+class _GoldenDescriptor:
+    box_path: str
+    descriptor: ImageDescriptor
+
+
+@dataclass
+class _KnownGood:
+    box_path: str
+    descriptors: deque[ImageDescriptor]
+
+
+_golden_descriptors: dict[int, _GoldenDescriptor] = {}
+_reference_descriptors: dict[str, ImageDescriptor] = {}  # additional reference images, by image_ref
+_known_good: dict[int, _KnownGood] = {}
+
+
+def _load_or_store_golden_descriptor(medicine_id: int, golden_box_bytes: bytes) -> ImageDescriptor:
+    with Session(engine) as session:
+        row = session.get(MedicineDescriptor, medicine_id)
+        if row is not None:
+            return descriptor_from_row(row)
+        descriptor = compute_descriptor(golden_box_bytes)
+        # merge: another request may have stored the same descriptor meanwhile
+        session.merge(descriptor_to_row(medicine_id, descriptor))
+        session.commit()
+        return descriptor
+
+
+async def get_golden_descriptor(medicine: CreateMedicine, golden_box_bytes: bytes) -> ImageDescriptor:
+    """
+    Returns the golden box descriptor of `medicine`: from memory, else from
+    the MedicineDescriptor row, else computed now (for drugs registered
+    before descriptors existed) and stored for next time. A remembered
+    descriptor of an earlier golden box is reloaded.
+    """
+    entry = _golden_descriptors.get(medicine.id)
+    if entry is None or entry.box_path != medicine.golden_box_image_path:
+        descriptor = await asyncio.to_thread(_load_or_store_golden_descriptor, medicine.id, golden_box_bytes)
+        entry = _GoldenDescriptor(medicine.golden_box_image_path, descriptor)
+        _golden_descriptors[medicine.id] = entry
+    return entry.descriptor
+
+
+async def get_reference_descriptor(image_ref: str, image_bytes: bytes) -> ImageDescriptor:
+    """
+    Descriptor of an additional reference image, computed on first use. Keyed
+    by its content address, so an entry never goes stale.
+    """
+    descriptor = _reference_descriptors.get(image_ref)
+    if descriptor is None:
+        descriptor = await asyncio.to_thread(compute_descriptor, image_bytes)
+        _reference_descriptors[image_ref] = descriptor
+    return descriptor
+
+
+def forget_golden_descriptor(medicine_id: int) -> None:
+    """Drops this worker's entries for `medicine_id` right away instead of on its next lookup."""
+    _golden_descriptors.pop(medicine_id, None)
+    _known_good.pop(medicine_id, None)
+
+
+def _known_good_boxes(medicine: CreateMedicine) -> deque[ImageDescriptor]:
+    entry = _known_good.get(medicine.id)
+    if entry is None or entry.box_path != medicine.golden_box_image_path:
+        entry = _KnownGood(medicine.golden_box_image_path, deque(maxlen=PRESCREEN_KNOWN_GOOD_PER_DRUG))
+        _known_good[medicine.id] = entry
+    return entry.descriptors
+
+
+def remember_verified_box(medicine: CreateMedicine, descriptor: ImageDescriptor) -> None:
+    """Records the descriptor of a box that passed full verification against the current golden box."""
+    _known_good_boxes(medicine).append(descriptor)
+
+
+# --- Pre-screen stage ---
+@dataclass
+class PrescreenResult:
+    status: str  # "HIGH-RISK", "VERIFIED" (fast path) or "INCONCLUSIVE" (ask the model)
+    reason: str
+    descriptor: ImageDescriptor
+
+
+def prescreen_box(medicine: CreateMedicine, user: ImageDescriptor, golden: ImageDescriptor) -> PrescreenResult:
+    """
+    Classifies the user's box against the golden box without a model call.
+    Only blatant cases are decided here; everything else is INCONCLUSIVE.
+    """
+    if user.stddev < PRESCREEN_BLANK_STDDEV:
+        return PrescreenResult("HIGH-RISK", "Pre-screen Check: the box image appears to be blank.", user)
+
+    dhash_distance = hamming_distance(user.dhash, golden.dhash)
+    colour_similarity = histogram_similarity(user.histogram, golden.histogram)
+    if dhash_distance >= PRESCREEN_MISMATCH_DHASH_BITS and colour_similarity <= PRESCREEN_MISMATCH_HIST_SIMILARITY:
+        return PrescreenResult(
+            "HIGH-RISK",
+            "Pre-screen Check: the box in the image does not resemble the registered product.",
+            user,
+        )
+
+    for known in _known_good_boxes(medicine):
+        if (hamming_distance(user.dhash, known.dhash) <= PRESCREEN_DUPLICATE_DHASH_BITS
+                and histogram_similarity(user.histogram, known.histogram) >= PRESCREEN_DUPLICATE_HIST_SIMILARITY):
+            return PrescreenResult("VERIFIED", "Pre-screen Check: matches a previously verified submission.", user)
+
+    return PrescreenResult("INCONCLUSIVE", "Pre-screen Check: no decision, model inspection required.", user)
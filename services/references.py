@@ -0,0 +1,400 @@
+# internal imports
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+import numpy as np
+from google.genai import types
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, update, and_
+
+# external imports
+from config.settings import (
+    VECTOR_INDEX_DIR,
+    IDENTIFY_MIN_SCORE,
+    IDENTIFY_MIN_MARGIN,
+    IDENTIFY_TOP_K,
+    REFERENCE_MISMATCH_MAX_SCORE,
+    REFERENCE_MISMATCH_MARGIN,
+    REFERENCE_IMAGE_CACHE_ENTRIES,
+)
+from db.database import engine
+from db.models import CreateMedicine, CatalogVersion, ReferenceImage
+from services.catalog import catalog
+from services.embeddings import (
+    EMBEDDING_DIM,
+    EMBEDDING_VERSION,
+    compute_embedding,
+    embedding_to_bytes,
+    embedding_from_bytes,
+)
+from services.golden_cache import GoldenImages
+from services.images import detect_mime_type, prepare_stored_image
+from services.image_store import read_image
+from services.metrics import REFERENCE_MATCHES
+from services.vector_index import VectorIndex, Match
+
+logger = logging.getLogger(__name__)
+
+
+ROLES = ("box", "blister")
+BOX, BLISTER = 0, 1
+# Rows fetched per query when syncing the index or backfilling references
+BATCH_SIZE = 500
+
+_backfill_task: asyncio.Task | None = None
+
+
+def role_code(role: str) -> int:
+    return ROLES.index(role)
+
+
+def new_reference(
+    medicine_id: int,
+    role: str,
+    image_ref: str,
+    embedding: np.ndarray,
+    label: str | None = None
+) -> ReferenceImage:
+    return ReferenceImage(
+        medicine_id=medicine_id,
+        role=role,
+        image_ref=image_ref,
+        label=label,
+        embedding=embedding_to_bytes(embedding),
+        embedding_version=EMBEDDING_VERSION,
+    )
+
+
+def reference_to_dict(reference: ReferenceImage, medicine: CreateMedicine) -> dict:
+    primary_ref = medicine.golden_box_image_path if reference.role == "box" else medicine.golden_blister_image_path
+    return {
+        "id": reference.id,
+        "medicine_id": reference.medicine_id,
+        "role": reference.role,
+        "image_ref": reference.image_ref,
+        "label": reference.label,
+        "primary": reference.image_ref == primary_ref,
+        "created_at": reference.created_at.isoformat(),
+    }
+
+
+# --- Vector Index ---
+class ReferenceIndex:
+    """
+    The ReferenceImage table as a VectorIndex on this worker. Adding or
+    removing references bumps the shared catalog version like registrations
+    do; on a newer version the index fetches only the rows it does not hold
+    yet, and thanks to the memory-mapped snapshot a restarted worker only
+    fetches what changed while it was down.
+    """
+
+    def __init__(self, index: VectorIndex):
+        self.index = index
+        self.version = -1
+        self.image_refs: dict[int, str] = {}  # reference id -> image_ref, for the indexed references
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Maps the snapshot and catches up with the database (blocking; used at startup)."""
+        self.index.load()
+        self._sync(catalog.version)
+        logger.info("Reference index loaded", extra={"references": len(self.index)})
+
+    def _sync(self, version: int) -> None:
+        with self._lock:
+            if version == self.version:
+                return
+            with Session(engine) as session:
+                current = dict(session.exec(
+                    select(ReferenceImage.id, ReferenceImage.image_ref)
+                    .where(ReferenceImage.embedding_version == EMBEDDING_VERSION)
+                ).all())
+                known = set(self.index.reference_ids().tolist())
+                missing = sorted(current.keys() - known)
+                rows = []
+                for start in range(0, len(missing), BATCH_SIZE):
+                    rows.extend(session.exec(
+                        select(ReferenceImage.id, ReferenceImage.medicine_id, ReferenceImage.role, ReferenceImage.embedding)
+                        .where(ReferenceImage.id.in_(missing[start:start + BATCH_SIZE]))
+                    ).all())
+            removed = known - current.keys()
+            if rows or removed:
+                added = self.index.new_records(len(rows))
+                if rows:
+                    added["reference_id"] = [row[0] for row in rows]
+                    added["medicine_id"] = [row[1] for row in rows]
+                    added["role"] = [role_code(row[2]) for row in rows]
+                    added["vector"] = np.stack([embedding_from_bytes(row[3]) for row in rows])
+                self.index.apply(added, removed)
+            self.image_refs = current
+            self.version = version
+
+    async def refresh(self, force: bool = False) -> None:
+        """Catches up with references added or removed on any worker."""
+        await catalog.refresh_if_stale(force)
+        if catalog.version != self.version:
+            await asyncio.to_thread(self._sync, catalog.version)
+
+
+reference_index = ReferenceIndex(
+    VectorIndex(Path(VECTOR_INDEX_DIR) / f"references-v{EMBEDDING_VERSION}.npy", EMBEDDING_DIM)
+)
+
+
+# --- Identification ("which product is this?") ---
+@dataclass
+class Candidate:
+    medicine: CreateMedicine
+    score: float
+    reference_id: int
+
+    def to_dict(self) -> dict:
+        return {
+            "medicine_id": self.medicine.id,
+            "drug_name": self.medicine.drug_name,
+            "drug_type": self.medicine.drug_type,
+            "nafdac_number": self.medicine.nafdac_number,
+            "manufacturer": self.medicine.manufacturer,
+            "score": round(self.score, 4),
+            "reference_id": self.reference_id,
+        }
+
+
+async def identify_product(
+    box_bytes: bytes,
+    drug_name: str | None = None,
+    drug_type: str | None = None,
+    k: int = IDENTIFY_TOP_K
+) -> list[Candidate]:
+    """
+    The `k` registered products whose box references look most like
+    `box_bytes`, best first, optionally limited to a drug name and/or type.
+    Raises PIL.UnidentifiedImageError if the bytes are not an image.
+    """
+    await reference_index.refresh()
+    medicine_ids = None
+    if drug_name or drug_type:
+        medicines = catalog.same_name(drug_name) if drug_name else catalog.by_id.values()
+        medicine_ids = [medicine.id for medicine in medicines if drug_type is None or medicine.drug_type == drug_type]
+        if not medicine_ids:
+            return []
+
+    def search() -> list[Match]:
+        embedding = compute_embedding(box_bytes)
+        return reference_index.index.search(embedding, k, role=BOX, medicine_ids=medicine_ids, per_medicine=True)
+
+    matches = await asyncio.to_thread(search)
+    return [
+        Candidate(catalog.by_id[match.medicine_id], match.score, match.reference_id)
+        for match in matches if match.medicine_id in catalog.by_id
+    ]
+
+
+def is_identified(candidates: list[Candidate]) -> bool:
+    """True when the best candidate is similar enough and clearly ahead of the next one."""
+    if not candidates or candidates[0].score < IDENTIFY_MIN_SCORE:
+        return False
+    return len(candidates) == 1 or candidates[0].score - candidates[1].score >= IDENTIFY_MIN_MARGIN
+
+
+# --- Golden View Selection ---
+_reference_images: OrderedDict[str, tuple[bytes, types.Part]] = OrderedDict()
+
+
+async def load_reference_image(image_ref: str) -> tuple[bytes, types.Part]:
+    """Normalized bytes and model part of a reference image, kept for the most recently used ones."""
+    entry = _reference_images.get(image_ref)
+    if entry is not None:
+        _reference_images.move_to_end(image_ref)
+        return entry
+    data = await asyncio.to_thread(lambda: prepare_stored_image(read_image(image_ref)))
+    entry = (data, types.Part.from_bytes(data=data, mime_type=detect_mime_type(data) or "image/jpeg"))
+    _reference_images[image_ref] = entry
+    while len(_reference_images) > REFERENCE_IMAGE_CACHE_ENTRIES:
+        _reference_images.popitem(last=False)
+    return entry
+
+
+@dataclass
+class GoldenViews:
+    golden: GoldenImages  # with the closest reference of each role swapped in
+    box_score: float | None  # similarity of the box to the chosen reference
+    other_product: Candidate | None  # another product the box clearly looks like instead
+
+
+def _match_views(
+    medicine_id: int,
+    box_bytes: bytes,
+    blister_bytes: bytes | None
+) -> tuple[Match | None, Match | None, Match | None]:
+    index = reference_index.index
+    box_embedding = compute_embedding(box_bytes)
+    box = next(iter(index.search(box_embedding, 1, role=BOX, medicine_ids=(medicine_id,))), None)
+    best_others = index.search(box_embedding, 2, role=BOX, per_medicine=True)
+    other = next((match for match in best_others if match.medicine_id != medicine_id), None)
+
+    blister = None
+    if blister_bytes is not None:
+        blister_embedding = compute_embedding(blister_bytes)
+        blister = next(iter(index.search(blister_embedding, 1, role=BLISTER, medicine_ids=(medicine_id,))), None)
+    return box, other, blister
+
+
+async def match_golden_views(
+    medicine: CreateMedicine,
+    golden: GoldenImages,
+    box_bytes: bytes,
+    blister_bytes: bytes | None = None
+) -> GoldenViews:
+    """
+    Picks the reference images of `medicine` closest to the uploads, so the
+    model compares like with like (same packaging revision and angle), and
+    flags a box that matches another registered product far better than any
+    reference of the claimed one. Falls back to the primary golden images
+    whenever the uploads cannot be embedded or a reference cannot be read.
+    """
+    await reference_index.refresh()
+    try:
+        box, other, blister = await asyncio.to_thread(_match_views, medicine.id, box_bytes, blister_bytes)
+    except Exception as e:
+        # E.g. HEIC without a decoder; the model still compares against the primary images
+        logger.warning("Reference match skipped: %s", e)
+        return GoldenViews(golden, None, None)
+
+    other_product = None
+    if (box is not None and other is not None and other.medicine_id in catalog.by_id
+            and box.score <= REFERENCE_MISMATCH_MAX_SCORE
+            and other.score - box.score >= REFERENCE_MISMATCH_MARGIN):
+        other_product = Candidate(catalog.by_id[other.medicine_id], other.score, other.reference_id)
+
+    for match, path_field, bytes_field, part_field in (
+        (box, "box_path", "box_bytes", "box_part"),
+        (blister, "blister_path", "blister_bytes", "blister_part"),
+    ):
+        image_ref = reference_index.image_refs.get(match.reference_id) if match is not None else None
+        if image_ref is None or getattr(golden, part_field) is None:
+            continue
+        view = "primary" if image_ref == getattr(golden, path_field) else "alternate"
+        if view == "alternate":
+            try:
+                data, part = await load_reference_image(image_ref)
+            except Exception as e:
+                logger.warning("Reference image unavailable: %s", e, extra={"drug_name": medicine.drug_name})
+                continue
+            golden = replace(golden, **{path_field: image_ref, bytes_field: data, part_field: part})
+        REFERENCE_MATCHES.labels(role=ROLES[match.role], view=view).inc()
+
+    return GoldenViews(golden, box.score if box is not None else None, other_product)
+
+
+# --- Backfill (drugs registered before references, new embedding versions) ---
+def _embed_stored(image_ref: str) -> np.ndarray | None:
+    try:
+        return compute_embedding(read_image(image_ref))
+    except Exception as e:
+        logger.warning("Cannot embed reference image %s: %s", image_ref, e)
+        return None
+
+
+def _save_references(references: list[ReferenceImage]) -> None:
+    """Inserts or updates references and bumps the catalog version, in one transaction."""
+    with Session(engine) as session:
+        for reference in references:
+            session.merge(reference)
+        session.execute(update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1))
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another worker is backfilling the same drugs; its rows stand
+            session.rollback()
+
+
+def _backfill_primary(role: str) -> int:
+    """Adds each drug's own golden image of `role` as a reference where it is missing."""
+    column = CreateMedicine.golden_box_image_path if role == "box" else CreateMedicine.golden_blister_image_path
+    added, after = 0, 0
+    while True:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(CreateMedicine.id, column)
+                .outerjoin(ReferenceImage, and_(
+                    ReferenceImage.medicine_id == CreateMedicine.id,
+                    ReferenceImage.role == role,
+                    ReferenceImage.image_ref == column,
+                ))
+                .where(column.is_not(None))
+                .where(ReferenceImage.id.is_(None))
+                .where(CreateMedicine.id > after)
+                .order_by(CreateMedicine.id)
+                .limit(BATCH_SIZE)
+            ).all()
+        if not rows:
+            return added
+        references = []
+        for medicine_id, image_ref in rows:
+            embedding = _embed_stored(image_ref)
+            if embedding is not None:
+                references.append(new_reference(medicine_id, role, image_ref, embedding))
+        if references:
+            _save_references(references)
+            added += len(references)
+        after = rows[-1][0]
+
+
+def _backfill_stale() -> int:
+    """Recomputes references embedded by an older EMBEDDING_VERSION."""
+    updated, after = 0, 0
+    while True:
+        with Session(engine) as session:
+            stale = list(session.exec(
+                select(ReferenceImage)
+                .where(ReferenceImage.embedding_version != EMBEDDING_VERSION)
+                .where(ReferenceImage.id > after)
+                .order_by(ReferenceImage.id)
+                .limit(BATCH_SIZE)
+            ).all())
+        if not stale:
+            return updated
+        references = []
+        for reference in stale:
+            embedding = _embed_stored(reference.image_ref)
+            if embedding is not None:
+                # Same id: the index picks the row up again once its version is current
+                reference.embedding = embedding_to_bytes(embedding)
+                reference.embedding_version = EMBEDDING_VERSION
+                references.append(reference)
+        if references:
+            _save_references(references)
+            updated += len(references)
+        after = stale[-1].id
+
+
+async def backfill_references() -> None:
+    """Gives every drug its golden images as references and re-embeds outdated ones."""
+    try:
+        added = 0
+        for role in ROLES:
+            added += await asyncio.to_thread(_backfill_primary, role)
+        updated = await asyncio.to_thread(_backfill_stale)
+    except Exception:
+        logger.exception("Reference backfill failed")
+        return
+    if added or updated:
+        logger.info("Reference images backfilled", extra={"added": added, "updated": updated})
+        await reference_index.refresh(force=True)
+
+
+async def start_reference_backfill() -> None:
+    global _backfill_task
+    _backfill_task = asyncio.create_task(backfill_references())
+
+
+async def stop_reference_backfill() -> None:
+    global _backfill_task
+    if _backfill_task is not None:
+        _backfill_task.cancel()
+        await asyncio.gather(_backfill_task, return_exceptions=True)
+        _backfill_task = None
@@ -0,0 +1,190 @@
+# internal imports
+import re
+import asyncio
+import logging
+import unicodedata
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# external imports
+from config.settings import REPORT_STATS_ZONE, REPORT_STATS_DEFAULT_DAYS
+from db.database import engine, async_engine, upsert
+from db.models import DrugReport, ReportDailyCount, ReportOutbox
+from services.catalog import normalize_name, normalize_nafdac
+
+logger = logging.getLogger(__name__)
+
+
+# Outbox reports read per backfill transaction
+BATCH_SIZE = 1000
+GROUP_COLUMNS = {
+    "location": ReportDailyCount.location_key,
+    "drug": ReportDailyCount.drug_key,
+    "day": ReportDailyCount.day,
+}
+
+_backfill_task: asyncio.Task | None = None
+
+
+# --- Normalization ---
+def normalize_drug(drug_name: str) -> str:
+    return " ".join(normalize_name(drug_name).split())
+
+
+def normalize_location(location: str) -> str:
+    """
+    Grouping key of a free-text location: accents, case and punctuation
+    dropped and whitespace collapsed, keeping the comma-separated parts,
+    so "Ikeja,  LAGOS." and "ikeja, lagos" count as the same place.
+    """
+    text = unicodedata.normalize("NFKD", location)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    parts = (" ".join(re.sub(r"[^\w]+", " ", part).replace("_", " ").split()) for part in text.split(","))
+    return ", ".join(part for part in parts if part)
+
+
+def report_day(created_at: datetime) -> date:
+    """Day of a (naive UTC) report time in REPORT_STATS_TIMEZONE."""
+    return created_at.replace(tzinfo=timezone.utc).astimezone(REPORT_STATS_ZONE).date()
+
+
+# --- Recording ---
+def _new_drug_report(outbox: ReportOutbox) -> DrugReport:
+    return DrugReport(
+        outbox_id=outbox.id,
+        drug_name=outbox.drug_name,
+        drug_key=normalize_drug(outbox.drug_name),
+        nafdac_number=outbox.nafdac_number,
+        nafdac_key=normalize_nafdac(outbox.nafdac_number),
+        location=outbox.location,
+        location_key=normalize_location(outbox.location),
+        reason=outbox.reason,
+        created_at=outbox.created_at,
+    )
+
+
+def _add_counts(session: Session, reports: list[DrugReport]) -> None:
+    """Adds the reports to the daily rollup with one upsert per distinct (day, location, drug)."""
+    counts = Counter((report_day(r.created_at), r.location_key, r.drug_key) for r in reports)
+    rows = [
+        {"day": day, "location_key": location_key, "drug_key": drug_key, "reports": count}
+        for (day, location_key, drug_key), count in counts.items()
+    ]
+    session.execute(upsert(ReportDailyCount, rows, ["day", "location_key", "drug_key"], [], ["reports"]))
+
+
+def record_report(session: Session, outbox: ReportOutbox) -> DrugReport:
+    """
+    Stores the report for analytics and counts it in the daily rollup, in the
+    caller's transaction (the outbox row must be flushed so it has an id).
+    """
+    report = _new_drug_report(outbox)
+    session.add(report)
+    _add_counts(session, [report])
+    return report
+
+
+def _backfill_batch(after: int) -> tuple[int, int | None]:
+    """Records the next batch of outbox reports stored before this table existed."""
+    with Session(engine) as session:
+        outboxes = list(session.exec(
+            select(ReportOutbox)
+            .outerjoin(DrugReport, DrugReport.outbox_id == ReportOutbox.id)
+            .where(DrugReport.id.is_(None))
+            .where(ReportOutbox.id > after)
+            .order_by(ReportOutbox.id)
+            .limit(BATCH_SIZE)
+        ).all())
+        if not outboxes:
+            return 0, None
+        reports = [_new_drug_report(outbox) for outbox in outboxes]
+        session.add_all(reports)
+        _add_counts(session, reports)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another worker recorded some of them first; its counts stand
+            session.rollback()
+            return 0, outboxes[-1].id
+        return len(reports), outboxes[-1].id
+
+
+def _backfill() -> int:
+    added, after = 0, 0
+    while after is not None:
+        count, after = _backfill_batch(after)
+        added += count
+    return added
+
+
+async def backfill_reports() -> None:
+    """Records outbox reports that were queued before reports were stored for analytics."""
+    try:
+        added = await asyncio.to_thread(_backfill)
+    except Exception:
+        logger.exception("Report backfill failed")
+        return
+    if added:
+        logger.info("Reports backfilled", extra={"reports": added})
+
+
+async def start_report_backfill() -> None:
+    global _backfill_task
+    _backfill_task = asyncio.create_task(backfill_reports())
+
+
+async def stop_report_backfill() -> None:
+    global _backfill_task
+    if _backfill_task is not None:
+        _backfill_task.cancel()
+        await asyncio.gather(_backfill_task, return_exceptions=True)
+        _backfill_task = None
+
+
+# --- Queries ---
+async def report_stats(
+    since: date | None = None,
+    until: date | None = None,
+    drug_name: str | None = None,
+    location: str | None = None,
+    group_by: str = "location",
+    limit: int = 20
+) -> dict:
+    """
+    Report counts from the daily rollup only, never the stored reports, so
+    the cost depends on the days, places and drugs in range and not on the
+    number of reports. `since` and `until` are inclusive days in
+    REPORT_STATS_TIMEZONE; the last REPORT_STATS_DEFAULT_DAYS by default.
+    Groups are ordered by count, or chronologically for "day".
+    """
+    until = until or datetime.now(REPORT_STATS_ZONE).date()
+    since = since or until - timedelta(days=REPORT_STATS_DEFAULT_DAYS - 1)
+    filters = [ReportDailyCount.day >= since, ReportDailyCount.day <= until]
+    if drug_name:
+        filters.append(ReportDailyCount.drug_key == normalize_drug(drug_name))
+    if location:
+        filters.append(ReportDailyCount.location_key == normalize_location(location))
+
+    column = GROUP_COLUMNS[group_by]
+    reports = func.sum(ReportDailyCount.reports).label("reports")
+    grouped = select(column, reports).where(*filters).group_by(column)
+    grouped = grouped.order_by(column) if group_by == "day" else grouped.order_by(reports.desc(), column)
+
+    async with AsyncSession(async_engine) as session:
+        total = (await session.exec(select(func.coalesce(func.sum(ReportDailyCount.reports), 0)).where(*filters))).one()
+        groups = (await session.exec(grouped.limit(limit))).all()
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "timezone": str(REPORT_STATS_ZONE),
+        "group_by": group_by,
+        "total": int(total),
+        "groups": [
+            {group_by: key.isoformat() if isinstance(key, date) else key, "reports": int(count)}
+            for key, count in groups
+        ],
+    }
@@ -0,0 +1,198 @@
+# internal imports
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Callable
+from fastapi import HTTPException
+from google.genai import errors as genai_errors
+import httpx
+
+# external imports
+from config.settings import (
+    CIRCUIT_WINDOW_SECONDS,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_ERROR_RATE,
+    CIRCUIT_SLOW_CALL_SECONDS,
+    CIRCUIT_SLOW_CALL_RATE,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_HALF_OPEN_PROBES,
+    GEMINI_RETRY_BASE_SECONDS,
+    GEMINI_RETRY_MAX_SECONDS,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    RETRY_BUDGET_WINDOW_SECONDS,
+)
+from services.metrics import CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class ModelUnavailable(HTTPException):
+    """
+    The model cannot be called right now (its circuit breaker is open).
+    Raised before any work is done so callers can fall back to a degraded
+    answer; as a plain HTTPException it is a 503 with Retry-After.
+    """
+
+    def __init__(self, model: str, retry_after: float):
+        self.model = model
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=503,
+            detail="Visual inspection is temporarily unavailable. Please try again later.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, rate limits, server errors and dropped connections are worth retrying."""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, genai_errors.APIError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def backoff_delay(retry: int) -> float:
+    """Full-jitter exponential backoff for the given retry (1-based)."""
+    cap = min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** (retry - 1))
+    return random.uniform(0, cap)
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome and latency of calls to one model over a sliding
+    time window and trips open when too many fail or are slow. While open,
+    `before_call` raises ModelUnavailable immediately; after
+    CIRCUIT_OPEN_SECONDS a limited number of probe calls are let through
+    (half-open) and the first result decides whether it closes again.
+
+    Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, model: str, clock: Callable[[], float] = time.monotonic):
+        self.model = model
+        self._clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes = 0
+        self._calls: deque[tuple[float, bool, bool]] = deque()  # (finished_at, failed, slow)
+        CIRCUIT_STATE.labels(model=model).set(0)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit breaker %s -> %s", self.state, state, extra={"model": self.model})
+        self.state = state
+        CIRCUIT_STATE.labels(model=self.model).set(_STATE_VALUES[state])
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - CIRCUIT_WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + CIRCUIT_OPEN_SECONDS - self._clock())
+
+    def allows_calls(self) -> bool:
+        """True unless the breaker is open and not yet due for a probe."""
+        if self.state == OPEN:
+            return self.retry_after() <= 0
+        if self.state == HALF_OPEN:
+            return self._probes < CIRCUIT_HALF_OPEN_PROBES
+        return True
+
+    def before_call(self) -> None:
+        """Admits a call or raises ModelUnavailable. Every admitted call must end in `record` or `release`."""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                raise ModelUnavailable(self.model, self.retry_after())
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= CIRCUIT_HALF_OPEN_PROBES:
+                raise ModelUnavailable(self.model, CIRCUIT_OPEN_SECONDS)
+            self._probes += 1
+
+    def release(self) -> None:
+        """Ends an admitted call without judging the model (cancelled, or failed on our side)."""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record(self, failed: bool, latency: float) -> None:
+        now = self._clock()
+        slow = latency >= CIRCUIT_SLOW_CALL_SECONDS
+        if self.state == HALF_OPEN:
+            self.release()
+            if failed or slow:
+                self._open(now)
+            else:
+                self._calls.clear()
+                self._set_state(CLOSED)
+            return
+        if self.state == OPEN:
+            # A call admitted before the breaker tripped
+            return
+
+        self._calls.append((now, failed, slow))
+        self._trim(now)
+        total = len(self._calls)
+        if total < CIRCUIT_MIN_CALLS:
+            return
+        failures = sum(1 for _, f, _ in self._calls if f)
+        slow_calls = sum(1 for _, _, s in self._calls if s)
+        if failures / total >= CIRCUIT_ERROR_RATE or slow_calls / total >= CIRCUIT_SLOW_CALL_RATE:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self._calls.clear()
+        self._set_state(OPEN)
+
+
+class RetryBudget:
+    """
+    Global cap on retries: over the last RETRY_BUDGET_WINDOW_SECONDS, retries
+    may not exceed RETRY_BUDGET_RATIO of first attempts plus a small floor of
+    RETRY_BUDGET_MIN_PER_SECOND, so retries cannot multiply load on an
+    already failing API.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._calls: deque[float] = deque()
+        self._retries: deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._calls, self._retries):
+            while events and events[0] < now - RETRY_BUDGET_WINDOW_SECONDS:
+                events.popleft()
+
+    def record_call(self) -> None:
+        self._calls.append(self._clock())
+
+    def try_spend(self) -> bool:
+        now = self._clock()
+        self._trim(now)
+        allowed = RETRY_BUDGET_RATIO * len(self._calls) + RETRY_BUDGET_MIN_PER_SECOND * RETRY_BUDGET_WINDOW_SECONDS
+        if len(self._retries) >= allowed:
+            return False
+        self._retries.append(now)
+        return True
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+retry_budget = RetryBudget()
+
+
+def circuit_breaker(model: str) -> CircuitBreaker:
+    """The breaker for `model` on this worker, created on first use."""
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(model)
+    return breaker
@@ -0,0 +1,90 @@
+# internal imports
+import logging
+from dataclasses import dataclass
+from fastapi import HTTPException, Request
+
+# external imports
+from config.settings import (
+    GEMINI_MODEL,
+    MODEL_TIERING_ENABLED,
+    GEMINI_FIRST_PASS_MODEL,
+    GEMINI_ESCALATION_MODEL,
+    ESCALATION_CONFIDENCE_THRESHOLD,
+    ESCALATE_HIGH_RISK,
+    INSPECTION_MODEL_OVERRIDES,
+)
+from services.context_cache import SharedContext
+from services.gemini import run_gemini_call
+from services.metrics import MODEL_ESCALATIONS
+from services.verdicts import InspectionVerdict
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    first_pass: str
+    escalation: str | None  # None: the first-pass verdict is final
+
+
+def resolve_model_tier(stage: str, drug_type: str) -> ModelTier:
+    """
+    Models for one inspection stage and drug type. INSPECTION_MODEL_OVERRIDES
+    entries for "<stage>:<drug_type>" win over "<stage>", which win over
+    the global first-pass/escalation models.
+    """
+    if not MODEL_TIERING_ENABLED:
+        return ModelTier(first_pass=GEMINI_MODEL, escalation=None)
+
+    tier = {"first_pass": GEMINI_FIRST_PASS_MODEL, "escalation": GEMINI_ESCALATION_MODEL}
+    tier.update(INSPECTION_MODEL_OVERRIDES.get(stage, {}))
+    tier.update(INSPECTION_MODEL_OVERRIDES.get(f"{stage}:{drug_type}", {}))
+    escalation = tier["escalation"]
+    if escalation == tier["first_pass"]:
+        escalation = None
+    return ModelTier(first_pass=tier["first_pass"], escalation=escalation)
+
+
+def escalation_reason(verdict: InspectionVerdict) -> str | None:
+    """Why a first-pass verdict needs the stronger model, or None if it can stand."""
+    if verdict.status == "HIGH-RISK":
+        return "high_risk" if ESCALATE_HIGH_RISK else None
+    # Verdicts without a confidence (e.g. cached before it was requested) stand
+    if verdict.confidence is not None and verdict.confidence < ESCALATION_CONFIDENCE_THRESHOLD:
+        return "low_confidence"
+    return None
+
+
+async def run_tiered_inspection(
+    stage: str,
+    drug_type: str,
+    system_prompt: str,
+    contents: list,
+    request: Request | None = None,
+    context: SharedContext | None = None
+) -> InspectionVerdict:
+    """
+    Runs one inspection on the stage's first-pass model and, when that
+    verdict is uncertain, HIGH-RISK or the call fails, re-runs it on the
+    escalation model whose verdict is then final. `context` is passed on
+    to run_gemini_call (each model caches it separately).
+    """
+    tier = resolve_model_tier(stage, drug_type)
+    if tier.escalation is None:
+        return await run_gemini_call(system_prompt, contents, request, stage=stage, model=tier.first_pass, context=context)
+
+    try:
+        verdict = await run_gemini_call(system_prompt, contents, request, stage=stage, model=tier.first_pass, context=context)
+        reason = escalation_reason(verdict)
+    except HTTPException as e:
+        if e.status_code == 499:
+            raise
+        reason = "first_pass_error"
+    if reason is None:
+        return verdict
+
+    MODEL_ESCALATIONS.labels(stage=stage, reason=reason).inc()
+    logger.info("Escalating inspection", extra={
+        "stage": stage, "reason": reason, "first_pass_model": tier.first_pass, "escalation_model": tier.escalation
+    })
+    return await run_gemini_call(system_prompt, contents, request, stage=stage, model=tier.escalation, context=context)
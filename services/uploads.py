@@ -0,0 +1,63 @@
+# internal imports
+import os
+import hashlib
+import asyncio
+import tempfile
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile
+
+# external imports
+from config.settings import UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES, UPLOAD_TMP_DIR
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+def _write_chunk(file, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    file.write(chunk)
+
+
+def _open_temp_file(directory: str | None) -> tuple:
+    handle = tempfile.NamedTemporaryFile(delete=False, dir=directory, prefix="upload-", mode="wb")
+    return handle, handle.name
+
+
+def discard(path: str | None) -> None:
+    """Deletes a spooled file, ignoring files that are already gone."""
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(upload: UploadFile, directory: str | None = None, max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """
+    Streams `upload` to a new file in `directory` chunk by chunk, hashing it
+    on the way. File I/O happens in worker threads, and the upload is
+    rejected with a 413 as soon as it grows past `max_bytes`, so neither
+    memory nor the event loop scale with the upload size.
+    """
+    file, path = await asyncio.to_thread(_open_temp_file, directory or UPLOAD_TMP_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"'{upload.filename}' is larger than the {max_bytes / (1024 * 1024):.1f} MB limit."
+                )
+            await asyncio.to_thread(_write_chunk, file, digest, chunk)
+    except BaseException:
+        await asyncio.to_thread(file.close)
+        await asyncio.to_thread(discard, path)
+        raise
+    await asyncio.to_thread(file.close)
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,150 @@
+# internal imports
+import os
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Collection
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def record_dtype(dim: int) -> np.dtype:
+    # The vector goes first so every float32 block stays 8-byte aligned
+    return np.dtype([
+        ("vector", "<f4", (dim,)),
+        ("reference_id", "<i8"),
+        ("medicine_id", "<i8"),
+        ("role", "<i8"),
+    ])
+
+
+@dataclass(frozen=True)
+class Match:
+    reference_id: int
+    medicine_id: int
+    role: int
+    score: float  # cosine similarity, 1.0 for identical images
+
+
+class VectorIndex:
+    """
+    Exact cosine-similarity search over unit-length vectors, each labelled
+    with the reference image, drug and role it belongs to. The records live
+    in one .npy file that is memory-mapped read-only, so a restart neither
+    recomputes nor copies them and workers on one host share the pages.
+
+    Changes write a complete new file and atomically rename it over the old
+    one; searches use whichever array was current when they started, so
+    they never lock. If the file cannot be written the index stays in memory.
+    """
+
+    def __init__(self, path: str | Path, dim: int):
+        self.path = Path(path)
+        self.dim = dim
+        self.dtype = record_dtype(dim)
+        self._records = np.zeros(0, dtype=self.dtype)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def load(self) -> bool:
+        """Maps the persisted records if the file exists and has this index's layout."""
+        try:
+            records = np.load(self.path, mmap_mode="r")
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable vector index %s: %s", self.path, e)
+            return False
+        if records.dtype != self.dtype or records.ndim != 1:
+            logger.warning("Ignoring vector index %s with a different layout", self.path)
+            return False
+        self._records = records
+        return True
+
+    def reference_ids(self) -> np.ndarray:
+        return np.asarray(self._records["reference_id"])
+
+    def new_records(self, count: int) -> np.ndarray:
+        return np.zeros(count, dtype=self.dtype)
+
+    def apply(self, added: np.ndarray, removed_ids: Collection[int] = ()) -> None:
+        """Adds `added` records and drops those of `removed_ids`, then persists the result (blocking)."""
+        with self._lock:
+            records = self._records
+            if removed_ids:
+                records = records[~np.isin(records["reference_id"], np.fromiter(removed_ids, dtype=np.int64))]
+            if len(added):
+                records = np.concatenate([records, added])
+            self._records = self._persist(np.ascontiguousarray(records))
+
+    def _persist(self, records: np.ndarray) -> np.ndarray:
+        if not len(records):
+            # An empty array cannot be memory-mapped; nothing worth keeping either
+            self.path.unlink(missing_ok=True)
+            return records
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handle = tempfile.NamedTemporaryFile(delete=False, dir=self.path.parent, prefix=".", suffix=".npy")
+            try:
+                with handle:
+                    np.save(handle, records)
+                os.replace(handle.name, self.path)
+            except BaseException:
+                os.unlink(handle.name)
+                raise
+            return np.load(self.path, mmap_mode="r")
+        except OSError as e:
+            logger.warning("Could not persist vector index %s: %s", self.path, e)
+            return records
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        role: int | None = None,
+        medicine_ids: Collection[int] | None = None,
+        per_medicine: bool = False
+    ) -> list[Match]:
+        """
+        The `k` records most similar to the unit vector `query`, best first,
+        optionally limited to one role and to some drugs. With `per_medicine`
+        only the best record of each drug counts, so the result is `k` drugs.
+        """
+        records = self._records
+        if not len(records) or k <= 0:
+            return []
+        mask = np.ones(len(records), dtype=bool)
+        if role is not None:
+            mask &= records["role"] == role
+        if medicine_ids is not None:
+            mask &= np.isin(records["medicine_id"], np.fromiter(medicine_ids, dtype=np.int64))
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        # Scoring every record is cheaper than copying out the candidate rows
+        scores = (records["vector"] @ query.astype(np.float32))[candidates]
+
+        if not per_medicine and k < len(candidates):
+            # Only the top k need sorting
+            top = np.argpartition(-scores, k - 1)[:k]
+            order = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            order = np.argsort(-scores, kind="stable")
+
+        matches, seen = [], set()
+        for position in order:
+            row = records[candidates[position]]
+            medicine_id = int(row["medicine_id"])
+            if per_medicine:
+                if medicine_id in seen:
+                    continue
+                seen.add(medicine_id)
+            matches.append(Match(int(row["reference_id"]), medicine_id, int(row["role"]), float(scores[position])))
+            if len(matches) == k:
+                break
+        return matches
@@ -0,0 +1,173 @@
+# internal imports
+import logging
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from google.genai import types
+from sqlalchemy import delete
+from sqlmodel import Session
+
+# external imports
+from config.settings import VERDICT_CACHE_BACKEND, VERDICT_CACHE_TTL_SECONDS, VERDICT_CACHE_MAX_ENTRIES
+from db.models import VerdictCacheEntry
+from db.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Expired database entries are deleted at most this often (per worker)
+PRUNE_INTERVAL_SECONDS = 60
+
+
+def verdict_cache_key(system_prompt: str, model: str, contents: list) -> str:
+    """
+    Content address of one model comparison: a sha256 over the model name,
+    the system prompt and every text/image part sent to the model (which
+    includes both the golden image and the user's image).
+    """
+    digest = hashlib.sha256()
+    for chunk in (model, system_prompt):
+        digest.update(chunk.encode())
+        digest.update(b"\x00")
+    for item in contents:
+        if isinstance(item, types.Part) and item.inline_data is not None:
+            digest.update((item.inline_data.mime_type or "").encode())
+            digest.update(item.inline_data.data or b"")
+        else:
+            digest.update(str(item).encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+# --- Backends ---
+class MemoryVerdictBackend:
+    """Per-worker verdict store with TTL expiry and an LRU entry cap."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, verdict = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return verdict
+
+    async def set(self, key: str, verdict: dict, ttl_seconds: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl_seconds, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class DatabaseVerdictBackend:
+    """
+    Verdict store backed by the VerdictCacheEntry table, shared by every
+    worker that points at the same database. Queries run in a worker
+    thread so they never block the event loop. Keys are mostly one-off
+    photos that are never read again, so expired rows are also deleted in
+    bulk (through the expires_at index) on a write once a minute.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._pruned_at = 0.0
+
+    def _get(self, key: str) -> dict | None:
+        with Session(self.engine) as session:
+            entry = session.get(VerdictCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.expires_at <= datetime.utcnow():
+                session.delete(entry)
+                session.commit()
+                return None
+            return json.loads(entry.verdict)
+
+    def _set(self, key: str, verdict: dict, ttl_seconds: int) -> None:
+        with Session(self.engine) as session:
+            now = time.monotonic()
+            if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                self._pruned_at = now
+                session.execute(delete(VerdictCacheEntry).where(VerdictCacheEntry.expires_at < datetime.utcnow()))
+                session.commit()
+            session.merge(VerdictCacheEntry(
+                key=key,
+                verdict=json.dumps(verdict),
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds)
+            ))
+            session.commit()
+
+    async def get(self, key: str) -> dict | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, verdict: dict, ttl_seconds: int) -> None:
+        await asyncio.to_thread(self._set, key, verdict, ttl_seconds)
+
+
+# --- Cache Front ---
+class VerdictCache:
+    """
+    Caches model verdicts by content address so byte-identical re-uploads
+    skip the Gemini call. Backend errors are logged and treated as misses;
+    the cache must never fail a verification.
+    """
+
+    def __init__(self, backend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        try:
+            verdict = await self.backend.get(key)
+        except Exception as e:
+            logger.warning("Verdict cache read error: %s", e)
+            verdict = None
+        if verdict is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return verdict
+
+    async def set(self, key: str, verdict: dict) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.backend.set(key, verdict, self.ttl_seconds)
+        except Exception as e:
+            logger.warning("Verdict cache write error: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "backend": VERDICT_CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _make_backend():
+    if VERDICT_CACHE_BACKEND == "memory":
+        return MemoryVerdictBackend(VERDICT_CACHE_MAX_ENTRIES)
+    if VERDICT_CACHE_BACKEND == "database":
+        return DatabaseVerdictBackend(engine)
+    if VERDICT_CACHE_BACKEND == "none":
+        return None
+    raise ValueError(f"Invalid VERDICT_CACHE_BACKEND '{VERDICT_CACHE_BACKEND}'. Must be 'memory', 'database' or 'none'.")
+
+
+verdict_cache = VerdictCache(_make_backend(), VERDICT_CACHE_TTL_SECONDS)
@@ -0,0 +1,111 @@
+# internal imports
+import re
+import ast
+import json
+from typing import Literal
+from pydantic import BaseModel, Field, ValidationError
+
+
+class ModelVerdict(BaseModel):
+    """
+    Response schema the inspection prompts are bound to: sent to Gemini as
+    `response_schema` with JSON mode, so the model can only answer with
+    this object.
+    """
+    status: Literal["VERIFIED", "HIGH-RISK"]
+    reason: str
+    confidence: float = Field(ge=0, le=1, description="How certain the model is of the status, from 0 to 1")
+
+
+class InspectionVerdict(ModelVerdict):
+    """A model verdict as used by the pipeline, tagged with the stage that produced it."""
+    # Verdicts cached before confidence was requested do not carry one
+    confidence: float | None = Field(default=None, ge=0, le=1)
+    stage: str | None = None
+
+    def to_dict(self) -> dict:
+        return self.model_dump(exclude_none=True)
+
+
+class VerdictParseError(ValueError):
+    """Model output that could not be turned into a verdict, even after repair."""
+
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _extract_object(text: str) -> dict:
+    """Finds the JSON object in text wrapped in markdown fences or prose."""
+    text = _FENCE.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise VerdictParseError("No JSON object in model output")
+    candidate = text[start:end + 1]
+    for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+        try:
+            data = json.loads(attempt)
+            break
+        except json.JSONDecodeError:
+            continue
+    else:
+        # Python-style dicts ('single quotes', True/None) are a common slip
+        try:
+            data = ast.literal_eval(candidate)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            raise VerdictParseError("Model output is not valid JSON")
+    if not isinstance(data, dict):
+        raise VerdictParseError("Model output is not a JSON object")
+    return data
+
+
+def _normalize_fields(data: dict) -> dict:
+    """Fixes key case, status spelling ("high risk", "Verified") and percent confidences."""
+    data = {str(key).strip().lower(): value for key, value in data.items()}
+
+    status = str(data.get("status", "")).strip().upper().replace("_", "-").replace(" ", "-")
+    if status == "HIGHRISK":
+        status = "HIGH-RISK"
+    data["status"] = status
+
+    if not data.get("reason"):
+        data["reason"] = "No reason given."
+
+    confidence = data.get("confidence")
+    if isinstance(confidence, str):
+        stripped = confidence.strip()
+        try:
+            confidence = float(stripped.rstrip("%")) / (100 if stripped.endswith("%") else 1)
+        except ValueError:
+            confidence = None
+    if isinstance(confidence, (int, float)) and 1 < confidence <= 100:
+        confidence = confidence / 100
+    if not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        confidence = None
+    data["confidence"] = confidence
+    return data
+
+
+def repair_verdict(text: str, stage: str | None = None) -> InspectionVerdict:
+    """
+    Local, best-effort recovery of a verdict from malformed model output,
+    tried before spending another model call on a re-query.
+    """
+    data = _normalize_fields(_extract_object(text))
+    try:
+        return InspectionVerdict.model_validate({**data, "stage": stage})
+    except ValidationError as e:
+        raise VerdictParseError(f"Model output is not a valid verdict: {e.errors()[0]['msg']}")
+
+
+def parse_verdict(text: str, stage: str | None = None) -> tuple[InspectionVerdict, bool]:
+    """
+    Returns (verdict, repaired). Well-formed JSON is validated directly;
+    anything else goes through repair_verdict.
+    """
+    try:
+        verdict = InspectionVerdict.model_validate_json(text)
+        verdict.stage = stage
+        return verdict, False
+    except ValidationError:
+        return repair_verdict(text, stage), True
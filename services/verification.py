@@ -0,0 +1,341 @@
+# internal imports
+import logging
+import asyncio
+from dataclasses import dataclass
+from fastapi import HTTPException, Request
+from google.genai import types
+from PIL import UnidentifiedImageError
+
+# external imports
+from config.system_prompts import PACKAGE_INSPECTOR, BLISTER_PACK_CHECK
+from config.settings import INSPECTION_MODE, PRESCREEN_ENABLED, REFERENCE_INDEX_ENABLED
+from db.models import CreateMedicine
+from services.catalog import catalog
+from services.context_cache import SharedContext
+from services.golden_cache import GoldenImages, golden_images
+from services.images import normalize_upload
+from services.metrics import IDENTIFICATIONS, time_stage, record_verdict
+from services.prescreen import (
+    compute_descriptor,
+    get_golden_descriptor,
+    get_reference_descriptor,
+    prescreen_box,
+    remember_verified_box,
+)
+from services.references import identify_product, is_identified, match_golden_views
+from services.tiering import run_tiered_inspection
+from services.verdicts import InspectionVerdict
+
+logger = logging.getLogger(__name__)
+
+
+VALID_DRUG_TYPES = ["syrup", "tablet"]
+
+
+# --- Input and Catalog Lookup ---
+def normalize_drug_type(drug_type: str) -> str:
+    """Lower-cases `drug_type` and rejects anything but syrup/tablet with a 400."""
+    drug_type_lower = drug_type.lower().strip()
+    if drug_type_lower not in VALID_DRUG_TYPES:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Invalid drug type '{drug_type}'. Must be either 'syrup' or 'tablet'."
+        )
+    return drug_type_lower
+
+
+def drug_not_found(drug_name: str, drug_type_lower: str) -> HTTPException:
+    """Builds the 404 for a (name, type) pair that is not in the catalog."""
+    same_name_drugs = catalog.same_name(drug_name)
+    if same_name_drugs:
+        # Drug exists but not with this type
+        available_types = [drug.drug_type for drug in same_name_drugs]
+        return HTTPException(
+            status_code=404,
+            detail=f"'{drug_name}' is not available as a '{drug_type_lower}'. Available types: {', '.join(available_types)}."
+        )
+    # Drug doesn't exist at all; point at likely misspellings
+    suggestions = catalog.suggest(drug_name)
+    hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+    return HTTPException(
+        status_code=404, 
+        detail=f"Drug '{drug_name}' not found in our database.{hint}"
+    )
+
+
+async def lookup_golden_drug(drug_name: str, drug_type_lower: str) -> CreateMedicine:
+    """Returns the registered CreateMedicine for (drug_name, drug_type) from the catalog or raises a 404."""
+    with time_stage("db_lookup"):
+        golden_drug = await catalog.get(drug_name, drug_type_lower)
+    if not golden_drug:
+        raise drug_not_found(drug_name, drug_type_lower)
+    return golden_drug
+
+
+async def identify_golden_drug(box_bytes: bytes, drug_name: str | None, drug_type_lower: str | None) -> CreateMedicine:
+    """
+    Resolves the drug from the box photo when the user did not give both its
+    name and type: the registered product whose box references look most
+    like the upload (among those matching whatever was given). Raises a 404
+    listing the closest products when no single one clearly matches.
+    """
+    if drug_name:
+        # A name that leaves a single drug needs no image search
+        await catalog.refresh_if_stale()
+        named = [m for m in catalog.same_name(drug_name) if drug_type_lower in (None, m.drug_type)]
+        if not named:
+            raise drug_not_found(drug_name, drug_type_lower or "")
+        if len(named) == 1:
+            return named[0]
+    if not REFERENCE_INDEX_ENABLED:
+        raise HTTPException(status_code=400, detail="Both drug_name and drug_type are required.")
+    try:
+        with time_stage("identify"):
+            candidates = await identify_product(box_bytes, drug_name, drug_type_lower)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a valid image.")
+
+    if is_identified(candidates):
+        IDENTIFICATIONS.labels(outcome="identified").inc()
+        logger.info("Product identified from box image", extra={
+            "drug_name": candidates[0].medicine.drug_name, "score": round(candidates[0].score, 4)
+        })
+        return candidates[0].medicine
+    IDENTIFICATIONS.labels(outcome="ambiguous").inc()
+    closest = ", ".join(f"{c.medicine.drug_name} ({c.medicine.drug_type})" for c in candidates[:3])
+    hint = f" Closest matches: {closest}." if closest else ""
+    raise HTTPException(
+        status_code=404,
+        detail=f"Could not identify the product from the box image; please provide drug_name and drug_type.{hint}"
+    )
+
+
+async def load_golden_images(golden_drug: CreateMedicine) -> GoldenImages:
+    """Fetches the golden standard images (served from memory after the first read)."""
+    try:
+        with time_stage("golden_image_load"):
+            return await golden_images.get_or_load(golden_drug)
+    except FileNotFoundError as e:
+        logger.error("Golden image not found: %s", e, extra={"drug_name": golden_drug.drug_name})
+        raise HTTPException(status_code=500, detail=f"Golden standard image not found: {str(e)}")
+    except Exception as e:
+        logger.exception("Error reading golden images", extra={"drug_name": golden_drug.drug_name})
+        raise HTTPException(status_code=500, detail=f"Error reading golden images: {str(e)}")
+
+
+# --- Inspection Runners ---
+@dataclass
+class Inspection:
+    stage: str  # "box_inspection" or "blister_inspection"
+    drug_type: str
+    system_prompt: str
+    contents: list
+    context: SharedContext | None = None  # golden part of `contents`, cacheable on the model side
+
+
+async def run_inspection(inspection: Inspection, request: Request | None = None) -> InspectionVerdict:
+    """One model inspection (tiered by stage and drug type), timed and counted under its stage."""
+    with time_stage(inspection.stage):
+        result = await run_tiered_inspection(
+            inspection.stage, inspection.drug_type, inspection.system_prompt, inspection.contents, request,
+            inspection.context
+        )
+    record_verdict(result.status, inspection.stage)
+    return result
+
+
+async def run_inspections_sequentially(inspections: list[Inspection], request: Request | None = None) -> list[InspectionVerdict]:
+    """
+    Runs the inspections one after the other and stops at the first
+    HIGH-RISK verdict, so later checks are never paid for.
+    """
+    results = []
+    for inspection in inspections:
+        result = await run_inspection(inspection, request)
+        if result.status == "HIGH-RISK":
+            raise HTTPException(status_code=404, detail=result.to_dict())
+        logger.info("Inspection passed", extra={"verdict": result.to_dict()})
+        results.append(result)
+    return results
+
+
+async def run_inspections_concurrently(inspections: list[Inspection], request: Request | None = None) -> list[InspectionVerdict]:
+    """
+    Starts all inspections at once. The first HIGH-RISK verdict (or error)
+    is raised immediately and the inspections still in flight are cancelled.
+    """
+    tasks = [asyncio.create_task(run_inspection(inspection, request)) for inspection in inspections]
+    results = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result.status == "HIGH-RISK":
+                raise HTTPException(status_code=404, detail=result.to_dict())
+            logger.info("Inspection passed", extra={"verdict": result.to_dict()})
+            results.append(result)
+        return results
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # Reap cancelled/failed tasks so their exceptions are not reported as unhandled
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# --- Verification Pipeline ---
+async def run_verification(
+    golden_drug: CreateMedicine,
+    golden: GoldenImages,
+    nafdac_number: str,
+    box_bytes: bytes,
+    blister_bytes: bytes | None = None,
+    request: Request | None = None
+) -> dict:
+    """
+    Runs every verification stage for one submission against `golden_drug`:
+    NAFDAC number check, upload normalization, reference image match, local
+    pre-screen, then the box and (for tablets) blister model inspections.
+
+    Returns the VERIFIED result; any HIGH-RISK verdict is raised as a 404
+    HTTPException whose detail is the verdict.
+    """
+    try:
+        # --- CALL 1 (REPLACED): Direct NAFDAC number check (no model call) ---
+        # Use the user-supplied nafdac_number form field and compare against the golden standard.
+        with time_stage("nafdac_check"):
+            user_nafdac = (nafdac_number or "").strip()
+            golden_nafdac = golden_drug.nafdac_number.strip()
+            nafdac_matches = user_nafdac == golden_nafdac
+
+        if not nafdac_matches:
+            record_verdict("HIGH-RISK", "nafdac_check")
+            message =  {
+                "status": "HIGH-RISK",
+                "reason": "NAFDAC number mismatch",
+                "expected_nafdac": golden_nafdac,
+                "provided_nafdac": user_nafdac
+            }
+
+            raise HTTPException(status_code=404, detail=message)
+
+        # Passed the NAFDAC check
+        logger.info("NAFDAC number matches", extra={"drug_name": golden_drug.drug_name})
+
+        # --- NORMALIZE: Orient, downscale and re-encode the uploads off the event loop ---
+        try:
+            uploads = [box_bytes]
+            if blister_bytes is not None:
+                uploads.append(blister_bytes)
+            with time_stage("normalize"):
+                normalized = await asyncio.gather(*(normalize_upload(data) for data in uploads))
+        except UnidentifiedImageError:
+            raise HTTPException(status_code=400, detail="Uploaded file is not a valid image.")
+        box_upload = normalized[0]
+        blister_upload = normalized[1] if len(normalized) > 1 else None
+
+        # --- REFERENCES: Compare against the closest golden views (no model call) ---
+        # A box that clearly shows another registered product is rejected here,
+        # and the model is shown the reference (packaging revision, angle)
+        # closest to each upload instead of always the registration image.
+        if REFERENCE_INDEX_ENABLED:
+            with time_stage("reference_match"):
+                views = await match_golden_views(
+                    golden_drug, golden, box_upload.data, blister_upload.data if blister_upload else None
+                )
+            if views.other_product is not None:
+                record_verdict("HIGH-RISK", "reference_match")
+                other = views.other_product.medicine
+                raise HTTPException(status_code=404, detail={
+                    "status": "HIGH-RISK",
+                    "reason": f"Reference Check: the box matches a different registered product "
+                              f"('{other.drug_name}', {other.drug_type}), not '{golden_drug.drug_name}'.",
+                })
+            golden = views.golden
+
+        # --- PRE-SCREEN: Local perceptual check of the box (no model call) ---
+        # Blank photos and obviously different products are rejected here, and
+        # near-duplicates of previously verified boxes skip the Package Inspector.
+        user_box_descriptor = None
+        box_prescreen_status = "INCONCLUSIVE"
+        if PRESCREEN_ENABLED:
+            try:
+                with time_stage("prescreen"):
+                    user_box_descriptor = await asyncio.to_thread(compute_descriptor, box_upload.data)
+                    if golden.box_path == golden_drug.golden_box_image_path:
+                        golden_descriptor = await get_golden_descriptor(golden_drug, golden.box_bytes)
+                    else:
+                        golden_descriptor = await get_reference_descriptor(golden.box_path, golden.box_bytes)
+            except Exception as e:
+                # Never fail verification because an image could not be described
+                # locally (e.g. HEIC without a decoder); the model still inspects it
+                logger.warning("Pre-screen skipped, descriptor unavailable: %s", e)
+                user_box_descriptor = None
+                golden_descriptor = None
+
+            if golden_descriptor is not None:
+                prescreen = prescreen_box(golden_drug, user_box_descriptor, golden_descriptor)
+                record_verdict(prescreen.status, "prescreen")
+                if prescreen.status == "HIGH-RISK":
+                    raise HTTPException(status_code=404, detail={"status": "HIGH-RISK", "reason": prescreen.reason})
+                box_prescreen_status = prescreen.status
+                logger.info("Pre-screen result", extra={"verdict": {"status": prescreen.status, "reason": prescreen.reason}})
+
+        # --- CALL 2: The "Package Inspector" (Box Check) ---
+        system_prompt_2 = PACKAGE_INSPECTOR
+        contents_2 = [
+            "GENUINE Box",
+            golden.box_part,
+            "USER'S Box. Compare this to the GENUINE Box.",
+            types.Part.from_bytes(
+                data=box_upload.data, 
+                mime_type=box_upload.mime_type
+            )
+        ]
+        inspections = []
+        if box_prescreen_status != "VERIFIED":
+            inspections.append(Inspection(
+                "box_inspection", golden_drug.drug_type, system_prompt_2, contents_2,
+                SharedContext(golden_drug.id, "box_inspection", prefix=2)
+            ))
+
+        if golden_drug.drug_type == "tablet":
+            # --- CALL 3: The "Pharmacist" (Blister Pack) ---
+            # Ensure we actually have the golden blister and the user's blister bytes before passing to from_bytes
+            if golden.blister_part is None:
+                raise HTTPException(status_code=500, detail="Golden blister image not available for this product.")
+            if blister_upload is None:
+                raise HTTPException(status_code=400, detail="User blister pack image not provided.")
+    
+            system_prompt_3 = BLISTER_PACK_CHECK
+            contents_3 = [
+                "GENUINE Blister Pack",
+                golden.blister_part,
+                "USER'S Blister Pack. Compare this to the GENUINE Blister Pack",
+                types.Part.from_bytes(
+                    data=blister_upload.data,
+                    mime_type=blister_upload.mime_type
+                )
+            ]
+            inspections.append(Inspection(
+                "blister_inspection", golden_drug.drug_type, system_prompt_3, contents_3,
+                SharedContext(golden_drug.id, "blister_inspection", prefix=2)
+            ))
+
+        if INSPECTION_MODE == "concurrent":
+            await run_inspections_concurrently(inspections, request)
+        else:
+            await run_inspections_sequentially(inspections, request)
+
+        # Remember this box so near-identical re-submissions take the fast path
+        if user_box_descriptor is not None and box_prescreen_status != "VERIFIED":
+            remember_verified_box(golden_drug, user_box_descriptor)
+
+        # --- 6. All Checks Passed ---
+        record_verdict("VERIFIED", "final")
+        return {"status": "VERIFIED", "reason": "All checks passed."}
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.exception("Verification failed", extra={"drug_name": golden_drug.drug_name})
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
@@ -0,0 +1,95 @@
+"""
+Shared setup for the test suite. Settings are read when the app is
+imported, so everything is put in place here, before any test module
+imports it: a scratch working directory with a copy of medicine_images/,
+a SQLite database seeded from it (as the bench does), a local SMTP sink
+for report emails and the fake Gemini client.
+"""
+# internal imports
+import os
+import time
+import shutil
+import socket
+import tempfile
+from pathlib import Path
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Everything the app writes goes to a scratch directory, not the checkout
+WORKDIR = Path(tempfile.mkdtemp(prefix="checkmed-tests-"))
+shutil.copytree(REPO_ROOT / "medicine_images", WORKDIR / "medicine_images")
+os.chdir(WORKDIR)
+
+# external imports
+from bench.smtp_sink import SmtpSink  # noqa: E402
+
+SMTP_SINK = SmtpSink(port=_free_port())
+os.environ.update(SMTP_SINK.env())
+os.environ.update({
+    "GOOGLE_API_KEY": "test-fake-key",
+    "RENDER_DATABASE_URL": f"sqlite:///{WORKDIR / 'test.db'}",
+    "LOG_LEVEL": "WARNING",
+    "REPORT_POLL_SECONDS": "0.2",
+    # Tests post the same fixture images over and over
+    "VERDICT_CACHE_BACKEND": "none",
+    "PRESCREEN_ENABLED": "false",
+    # Every test client shares one address; admission tests enable it themselves
+    "ADMISSION_ENABLED": "false",
+})
+
+from bench.fixtures import discover_seed_drugs, reset_and_seed  # noqa: E402
+
+SEED_DRUGS = discover_seed_drugs()
+reset_and_seed(SEED_DRUGS)
+
+
+@pytest.fixture(scope="session")
+def seed_drugs():
+    """The drugs registered from medicine_images/, one per folder."""
+    return SEED_DRUGS
+
+
+@pytest.fixture(scope="session")
+def smtp_sink():
+    SMTP_SINK.start()
+    yield SMTP_SINK
+    SMTP_SINK.stop()
+
+
+@pytest.fixture(scope="session")
+def fake_model():
+    """Gemini stand-in answering VERIFIED with high confidence, without delay."""
+    from bench.fake_genai import FakeModelProfile, install_fake_genai
+
+    return install_fake_genai(FakeModelProfile(
+        median_latency_ms=0, high_risk_rate=0, low_confidence_rate=0, seed=1
+    ))
+
+
+@pytest.fixture(scope="module")
+def client(smtp_sink, fake_model):
+    """The app with its background workers running (job workers, report sender, ...)."""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def wait_until(condition, timeout: float = 10, interval: float = 0.05):
+    """Polls `condition` until it returns something truthy; returns that or fails."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(interval)
+    pytest.fail(f"Timed out after {timeout}s waiting for {condition.__name__}")
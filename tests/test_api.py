@@ -0,0 +1,220 @@
+"""
+End-to-end tests of the HTTP API against the fake Gemini client and the
+local SMTP sink (see conftest.py).
+"""
+# internal imports
+import json
+from pathlib import Path
+import pytest
+
+# external imports
+import services.admission as admission_module
+from conftest import wait_until
+
+
+def _files(drug, box_field: str = "box_image", blister_field: str = "blister_pack_image") -> dict:
+    files = {box_field: ("box.jpg", Path(drug.box_image_path).read_bytes(), "image/jpeg")}
+    if drug.blister_image_path:
+        files[blister_field] = ("blister.jpg", Path(drug.blister_image_path).read_bytes(), "image/jpeg")
+    return files
+
+
+def _form(drug) -> dict:
+    return {"drug_name": drug.drug_name, "drug_type": drug.drug_type, "nafdac_number": drug.nafdac_number}
+
+
+@pytest.fixture
+def tablet(seed_drugs):
+    return next(drug for drug in seed_drugs if drug.drug_type == "tablet")
+
+
+@pytest.fixture
+def syrup(seed_drugs):
+    return next(drug for drug in seed_drugs if drug.drug_type == "syrup")
+
+
+@pytest.fixture
+def admission_enabled(monkeypatch):
+    """Per-worker admission control with a bucket of two requests that never refills during the test."""
+    monkeypatch.setattr(admission_module.admission, "backend", admission_module.MemoryAdmissionBackend())
+    monkeypatch.setattr(admission_module, "RATE_LIMIT_BURST", 2)
+    monkeypatch.setattr(admission_module, "RATE_LIMIT_PER_MINUTE", 0.001)
+
+
+# --- /api/verify/ ---
+def test_verify_tablet(client, fake_model, tablet):
+    calls = fake_model.calls
+    response = client.post("/api/verify/", data=_form(tablet), files=_files(tablet))
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "VERIFIED"
+    assert fake_model.calls > calls
+
+
+def test_verify_wrong_nafdac_number_is_high_risk_without_model_call(client, fake_model, syrup):
+    calls = fake_model.calls
+    form = {**_form(syrup), "nafdac_number": "X00-0000"}
+    response = client.post("/api/verify/", data=form, files=_files(syrup))
+    assert response.status_code == 404
+    assert response.json()["detail"]["status"] == "HIGH-RISK"
+    assert fake_model.calls == calls
+
+
+def test_verify_unknown_drug(client, syrup):
+    form = {**_form(syrup), "drug_name": "no-such-drug"}
+    response = client.post("/api/verify/", data=form, files=_files(syrup))
+    assert response.status_code == 404
+
+
+def test_verify_rejects_invalid_drug_type(client, syrup):
+    form = {**_form(syrup), "drug_type": "capsule"}
+    response = client.post("/api/verify/", data=form, files=_files(syrup))
+    assert response.status_code == 400
+
+
+# --- /api/verify/batch ---
+def _batch_request(drugs) -> tuple[dict, list]:
+    manifest, files = [], []
+    for i, drug in enumerate(drugs):
+        item = {**_form(drug), "box_image": f"box-{i}.jpg"}
+        files.append(("images", (f"box-{i}.jpg", Path(drug.box_image_path).read_bytes(), "image/jpeg")))
+        if drug.blister_image_path:
+            item["blister_pack_image"] = f"blister-{i}.jpg"
+            files.append(("images", (f"blister-{i}.jpg", Path(drug.blister_image_path).read_bytes(), "image/jpeg")))
+        manifest.append(item)
+    return {"manifest": json.dumps(manifest)}, files
+
+
+def test_batch_streams_one_line_per_item(client, seed_drugs):
+    data, files = _batch_request(seed_drugs)
+    response = client.post("/api/verify/batch", data=data, files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(len(seed_drugs)))
+    assert all(line["status_code"] == 200 for line in lines), lines
+    assert all(line["result"]["status"] == "VERIFIED" for line in lines)
+
+
+def test_batch_reports_bad_items_and_goes_on(client, syrup):
+    manifest = [
+        {**_form(syrup), "box_image": "box.jpg"},
+        {**_form(syrup), "box_image": "missing.jpg"},
+        {**_form(syrup), "drug_name": "no-such-drug", "box_image": "box.jpg"},
+    ]
+    files = [("images", ("box.jpg", Path(syrup.box_image_path).read_bytes(), "image/jpeg"))]
+    response = client.post("/api/verify/batch", data={"manifest": json.dumps(manifest)}, files=files)
+    assert response.status_code == 200
+    codes = {line["index"]: line["status_code"] for line in map(json.loads, response.text.splitlines())}
+    assert codes[0] == 200
+    assert codes[1] == 400
+    assert codes[2] == 404
+
+
+def test_batch_rejects_empty_manifest(client):
+    response = client.post("/api/verify/batch", data={"manifest": "[]"})
+    assert response.status_code == 400
+
+
+def test_batch_takes_one_rate_limit_token(client, admission_enabled, seed_drugs):
+    # More items than the bucket holds: the batch is charged once, not per item
+    data, files = _batch_request(seed_drugs * 2)
+    for _ in range(2):
+        response = client.post("/api/verify/batch", data=data, files=files)
+        assert response.status_code == 200
+        assert all(json.loads(line)["status_code"] == 200 for line in response.text.splitlines())
+
+    response = client.post("/api/verify/batch", data=data, files=files)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+# --- /api/verify/jobs ---
+def test_job_completes_with_verify_result(client, tablet):
+    response = client.post("/api/verify/jobs", data=_form(tablet), files=_files(tablet))
+    assert response.status_code == 202, response.text
+    status_url = response.json()["status_url"]
+
+    def finished():
+        job = client.get(status_url).json()
+        return job if job["status"] in ("completed", "failed") else None
+
+    job = wait_until(finished)
+    assert job["status"] == "completed"
+    assert job["status_code"] == 200
+    assert job["result"]["status"] == "VERIFIED"
+
+
+def test_job_failure_carries_status_code(client, syrup):
+    form = {**_form(syrup), "drug_name": "no-such-drug"}
+    status_url = client.post("/api/verify/jobs", data=form, files=_files(syrup)).json()["status_url"]
+    job = wait_until(lambda: (job := client.get(status_url).json())["status"] in ("completed", "failed") and job)
+    assert job["status_code"] == 404
+
+
+def test_job_rejects_private_callback_url(client, syrup):
+    form = {**_form(syrup), "callback_url": "http://127.0.0.1:8080/hook"}
+    response = client.post("/api/verify/jobs", data=form, files=_files(syrup))
+    assert response.status_code == 400
+
+
+def test_unknown_job(client):
+    assert client.get("/api/verify/jobs/no-such-job").status_code == 404
+
+
+# --- /api/report/ ---
+def test_report_is_emailed(client, smtp_sink, tablet):
+    emails = smtp_sink.handler.messages
+    form = {
+        "drug_name": tablet.drug_name,
+        "nafdac_number": tablet.nafdac_number,
+        "reason": "Blurred print on the box",
+        "location": "Ikeja, Lagos",
+    }
+    response = client.post("/api/report/", data=form, files=_files(tablet, blister_field="blister_image"))
+    assert response.status_code == 200, response.text
+    assert smtp_sink.wait_for(emails + 1, timeout=10)
+
+
+def test_report_rejects_non_image(client):
+    form = {"drug_name": "x", "nafdac_number": "A1-1", "reason": "fake", "location": "Lagos"}
+    response = client.post("/api/report/", data=form, files={"box_image": ("box.jpg", b"not an image", "image/jpeg")})
+    assert response.status_code == 400
+
+
+def test_report_stats_count_reports(client, tablet):
+    response = client.get("/api/report/stats", params={"drug_name": tablet.drug_name, "group_by": "location"})
+    assert response.status_code == 200
+    assert response.json()["total"] >= 1
+
+
+# --- /api/register-drug/ ---
+def test_register_then_verify(client, syrup):
+    form = {
+        "drug_name": "Test Syrup",
+        "drug_type": "syrup",
+        "nafdac_number": "T01-0001",
+        "manufacturer": "Test Labs",
+    }
+    response = client.post("/api/register-drug/", data=form, files=_files(syrup))
+    assert response.status_code == 200, response.text
+    assert response.json()["data"]["drug_name"] == "test syrup"
+
+    duplicate = client.post("/api/register-drug/", data=form, files=_files(syrup))
+    assert duplicate.status_code == 400
+
+    verify_form = {"drug_name": "Test Syrup", "drug_type": "syrup", "nafdac_number": "T01-0001"}
+    response = client.post("/api/verify/", data=verify_form, files=_files(syrup))
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "VERIFIED"
+
+
+def test_register_rejects_non_image(client):
+    form = {
+        "drug_name": "Test Tablet",
+        "drug_type": "tablet",
+        "nafdac_number": "T01-0002",
+        "manufacturer": "Test Labs",
+    }
+    response = client.post("/api/register-drug/", data=form, files={"box_image": ("box.jpg", b"not an image", "image/jpeg")})
+    assert response.status_code == 400
+    assert client.post("/api/verify/", data=form, files={"box_image": ("box.jpg", b"x", "image/jpeg")}).status_code == 404
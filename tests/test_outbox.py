@@ -0,0 +1,196 @@
+"""
+Report outbox delivery (services/outbox.py) against the local SMTP sink.
+The sender is driven by hand here: these tests do not start the app, so
+its background sender is not running.
+"""
+# internal imports
+import json
+import email
+from email import policy
+import shutil
+import asyncio
+from pathlib import Path
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete
+from sqlmodel import Session, update
+
+# external imports
+import services.outbox as outbox
+from config.settings import REPORT_OUTBOX_DIR, REPORT_RETRY_BASE_SECONDS, REPORT_STALE_SECONDS
+from db.database import engine
+from db.models import DrugReport, ReportDailyCount, ReportOutbox
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox(smtp_sink):
+    with Session(engine) as session:
+        for model in (DrugReport, ReportDailyCount, ReportOutbox):
+            session.execute(delete(model))
+        session.commit()
+    yield
+    smtp_sink.reject(0)
+
+
+def _attachment(tmp_path: Path, seed_drugs, name: str) -> str:
+    path = tmp_path / f"{name}.jpg"
+    shutil.copy(seed_drugs[0].box_image_path, path)
+    return str(path)
+
+
+def _enqueue(tmp_path: Path, seed_drugs, name: str) -> ReportOutbox:
+    return asyncio.run(outbox.enqueue_report(
+        drug_name=name,
+        nafdac_number="A1-1234",
+        reason="Blurred print",
+        location="Ikeja, Lagos",
+        attachments=[_attachment(tmp_path, seed_drugs, name)],
+    ))
+
+
+def _drain() -> int:
+    """Sends everything due, batch by batch over one SMTP connection, as the sender loop does."""
+    async def drain():
+        mailer = outbox.SmtpMailer()
+        claimed = 0
+        try:
+            while (count := await outbox.send_due_reports(mailer)) > 0:
+                claimed += count
+                if count < outbox.REPORT_BATCH_SIZE:
+                    break
+        finally:
+            await mailer.close()
+        return claimed
+
+    return asyncio.run(drain())
+
+
+def _row(report_id: int) -> ReportOutbox:
+    with Session(engine) as session:
+        return session.get(ReportOutbox, report_id)
+
+
+def _set(report_id: int, **values) -> None:
+    with Session(engine) as session:
+        session.execute(update(ReportOutbox).where(ReportOutbox.id == report_id).values(**values))
+        session.commit()
+
+
+def test_enqueue_persists_report_and_attachments(tmp_path, seed_drugs):
+    report = _enqueue(tmp_path, seed_drugs, "queued")
+
+    row = _row(report.id)
+    assert (row.status, row.attempts) == ("pending", 0)
+    [stored] = json.loads(row.attachment_paths)
+    assert Path(stored).is_file()
+    assert Path(REPORT_OUTBOX_DIR).resolve() in Path(stored).resolve().parents
+    assert not (tmp_path / "queued.jpg").exists()
+
+
+def test_sends_due_reports_over_one_connection(tmp_path, seed_drugs, smtp_sink, monkeypatch):
+    monkeypatch.setattr(outbox, "REPORT_BATCH_SIZE", 2)
+    reports = [_enqueue(tmp_path, seed_drugs, f"drug-{i}") for i in range(5)]
+    messages, sessions = smtp_sink.handler.messages, smtp_sink.handler.sessions
+
+    assert _drain() == 5
+
+    assert smtp_sink.handler.messages == messages + 5
+    assert smtp_sink.handler.sessions == sessions + 1
+    for report in reports:
+        row = _row(report.id)
+        assert (row.status, row.attempts, row.attachment_paths) == ("sent", 1, "[]")
+        assert row.sent_at is not None
+        assert not Path(json.loads(report.attachment_paths)[0]).parent.exists()
+    message = email.message_from_bytes(smtp_sink.handler.recent[-1], policy=policy.default)
+    assert message["Subject"] == outbox.REPORT_SUBJECT
+    assert [part.get_filename() for part in message.iter_attachments()] == ["drug-4.jpg"]
+
+
+def test_failed_send_is_retried_with_backoff(tmp_path, seed_drugs, smtp_sink):
+    report = _enqueue(tmp_path, seed_drugs, "flaky")
+    smtp_sink.reject(1)
+    before = datetime.utcnow()
+
+    _drain()
+    row = _row(report.id)
+    assert (row.status, row.attempts) == ("pending", 1)
+    assert "451" in row.last_error
+    delay = (row.next_attempt_at - before).total_seconds()
+    assert REPORT_RETRY_BASE_SECONDS * 0.5 - 1 <= delay <= REPORT_RETRY_BASE_SECONDS * 1.5 + 1
+    assert Path(json.loads(row.attachment_paths)[0]).is_file()
+
+    # Not due yet
+    assert _drain() == 0
+
+    _set(report.id, next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+    assert _drain() == 1
+    row = _row(report.id)
+    assert (row.status, row.attempts, row.last_error) == ("sent", 2, None)
+
+
+def test_backoff_doubles_per_attempt(tmp_path, seed_drugs, smtp_sink):
+    report = _enqueue(tmp_path, seed_drugs, "flaky")
+    _set(report.id, attempts=3)
+    smtp_sink.reject(1)
+    before = datetime.utcnow()
+
+    _drain()
+    delay = (_row(report.id).next_attempt_at - before).total_seconds()
+    # The fourth attempt waits 2**3 times the base delay, capped
+    base = min(REPORT_RETRY_BASE_SECONDS * 2 ** 3, outbox.MAX_RETRY_DELAY_SECONDS)
+    assert base * 0.5 - 1 <= delay <= base * 1.5 + 1
+
+
+def test_gives_up_after_max_attempts(tmp_path, seed_drugs, smtp_sink, monkeypatch):
+    monkeypatch.setattr(outbox, "REPORT_MAX_ATTEMPTS", 2)
+    report = _enqueue(tmp_path, seed_drugs, "doomed")
+    smtp_sink.reject(2)
+
+    _drain()
+    _set(report.id, next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+    _drain()
+
+    row = _row(report.id)
+    assert (row.status, row.attempts) == ("failed", 2)
+    assert _drain() == 0
+
+
+def test_digest_groups_reports_into_one_email(tmp_path, seed_drugs, smtp_sink, monkeypatch):
+    monkeypatch.setattr(outbox, "REPORT_DIGEST_SECONDS", 60)
+    reports = [_enqueue(tmp_path, seed_drugs, f"drug-{i}") for i in range(3)]
+    # One report lost its attachment: it fails alone and the digest goes out without it
+    broken = reports[1]
+    shutil.rmtree(Path(json.loads(broken.attachment_paths)[0]).parent)
+    messages, sessions = smtp_sink.handler.messages, smtp_sink.handler.sessions
+
+    assert _drain() == 3
+
+    assert smtp_sink.handler.messages == messages + 1
+    assert smtp_sink.handler.sessions == sessions + 1
+    message = email.message_from_bytes(smtp_sink.handler.recent[-1], policy=policy.default)
+    assert message["Subject"] == outbox.DIGEST_SUBJECT
+    assert sorted(part.get_filename() for part in message.iter_attachments()) == [
+        f"report-{reports[0].id}-drug-0.jpg",
+        f"report-{reports[2].id}-drug-2.jpg",
+    ]
+    assert [_row(r.id).status for r in reports] == ["sent", "failed", "sent"]
+    assert "FileNotFoundError" in _row(broken.id).last_error
+    assert _drain() == 0
+
+
+def test_reclaims_reports_left_sending_by_a_crashed_worker(tmp_path, seed_drugs, smtp_sink):
+    report = _enqueue(tmp_path, seed_drugs, "orphan")
+    # A worker claims the report and dies before sending it
+    [claimed] = outbox._claim_due_reports(10)
+    assert claimed.id == report.id
+    assert _row(report.id).status == "sending"
+
+    # Another worker leaves it alone while the claim may still be live
+    assert _drain() == 0
+
+    _set(report.id, updated_at=datetime.utcnow() - timedelta(seconds=REPORT_STALE_SECONDS + 1))
+    messages = smtp_sink.handler.messages
+    assert _drain() == 1
+    assert smtp_sink.handler.messages == messages + 1
+    row = _row(report.id)
+    assert (row.status, row.attempts) == ("sent", 2)
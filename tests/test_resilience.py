@@ -0,0 +1,184 @@
+"""Circuit breaker and retry budget state (services/resilience.py), on an injected clock."""
+# internal imports
+import math
+import pytest
+
+# external imports
+from services.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CIRCUIT_WINDOW_SECONDS,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_SLOW_CALL_SECONDS,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_HALF_OPEN_PROBES,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    RETRY_BUDGET_WINDOW_SECONDS,
+    CircuitBreaker,
+    ModelUnavailable,
+    RetryBudget,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test-model", clock=clock)
+
+
+def _calls(breaker: CircuitBreaker, count: int, failed: bool = False, latency: float = 0.1) -> None:
+    for _ in range(count):
+        breaker.before_call()
+        breaker.record(failed=failed, latency=latency)
+
+
+def _trip(breaker: CircuitBreaker) -> None:
+    _calls(breaker, CIRCUIT_MIN_CALLS, failed=True)
+    assert breaker.state == OPEN
+
+
+# --- Circuit breaker ---
+def test_stays_closed_below_min_calls(breaker):
+    _calls(breaker, CIRCUIT_MIN_CALLS - 1, failed=True)
+    assert breaker.state == CLOSED
+    assert breaker.allows_calls()
+
+
+def test_opens_on_error_rate(breaker):
+    _calls(breaker, CIRCUIT_MIN_CALLS, failed=True)
+    assert breaker.state == OPEN
+    assert not breaker.allows_calls()
+
+
+def test_stays_closed_under_error_rate(breaker):
+    _calls(breaker, CIRCUIT_MIN_CALLS * 4)
+    _calls(breaker, CIRCUIT_MIN_CALLS, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_slow_calls(breaker):
+    _calls(breaker, CIRCUIT_MIN_CALLS, latency=CIRCUIT_SLOW_CALL_SECONDS)
+    assert breaker.state == OPEN
+
+
+def test_forgets_calls_outside_the_window(breaker, clock):
+    _calls(breaker, CIRCUIT_MIN_CALLS - 1, failed=True)
+    clock.advance(CIRCUIT_WINDOW_SECONDS + 1)
+    _calls(breaker, 1, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_open_rejects_with_retry_after(breaker, clock):
+    _trip(breaker)
+    clock.advance(CIRCUIT_OPEN_SECONDS / 2)
+    with pytest.raises(ModelUnavailable) as raised:
+        breaker.before_call()
+    assert raised.value.status_code == 503
+    assert raised.value.retry_after == math.ceil(CIRCUIT_OPEN_SECONDS / 2)
+    assert raised.value.headers["Retry-After"] == str(raised.value.retry_after)
+
+
+def test_ignores_results_of_calls_admitted_before_opening(breaker):
+    _trip(breaker)
+    breaker.record(failed=False, latency=0.1)
+    assert breaker.state == OPEN
+
+
+def test_half_open_after_open_seconds(breaker, clock):
+    _trip(breaker)
+    clock.advance(CIRCUIT_OPEN_SECONDS)
+    assert breaker.allows_calls()
+    for _ in range(CIRCUIT_HALF_OPEN_PROBES):
+        breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allows_calls()
+    with pytest.raises(ModelUnavailable):
+        breaker.before_call()
+
+
+def test_half_open_probe_success_closes(breaker, clock):
+    _trip(breaker)
+    clock.advance(CIRCUIT_OPEN_SECONDS)
+    breaker.before_call()
+    breaker.record(failed=False, latency=0.1)
+    assert breaker.state == CLOSED
+    # The failures from before it opened no longer count
+    _calls(breaker, CIRCUIT_MIN_CALLS - 1, failed=True)
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.parametrize("failed, latency", [(True, 0.1), (False, CIRCUIT_SLOW_CALL_SECONDS)], ids=["failed", "slow"])
+def test_half_open_probe_failure_reopens(breaker, clock, failed, latency):
+    _trip(breaker)
+    clock.advance(CIRCUIT_OPEN_SECONDS)
+    breaker.before_call()
+    breaker.record(failed=failed, latency=latency)
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == CIRCUIT_OPEN_SECONDS
+
+
+def test_released_probe_frees_its_slot(breaker, clock):
+    _trip(breaker)
+    clock.advance(CIRCUIT_OPEN_SECONDS)
+    for _ in range(CIRCUIT_HALF_OPEN_PROBES):
+        breaker.before_call()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allows_calls()
+    breaker.before_call()
+
+
+# --- Retry budget ---
+def _spend_all(budget: RetryBudget) -> int:
+    spent = 0
+    while budget.try_spend():
+        spent += 1
+    return spent
+
+
+def test_retry_budget_floor(clock):
+    budget = RetryBudget(clock=clock)
+    assert _spend_all(budget) == math.ceil(RETRY_BUDGET_MIN_PER_SECOND * RETRY_BUDGET_WINDOW_SECONDS)
+    assert not budget.try_spend()
+
+
+def test_retry_budget_grows_with_calls(clock):
+    budget = RetryBudget(clock=clock)
+    calls = 200
+    for _ in range(calls):
+        budget.record_call()
+    floor = RETRY_BUDGET_MIN_PER_SECOND * RETRY_BUDGET_WINDOW_SECONDS
+    assert _spend_all(budget) == math.ceil(RETRY_BUDGET_RATIO * calls + floor)
+
+
+def test_retry_budget_refills_after_the_window(clock):
+    budget = RetryBudget(clock=clock)
+    for _ in range(100):
+        budget.record_call()
+    spent = _spend_all(budget)
+
+    clock.advance(RETRY_BUDGET_WINDOW_SECONDS / 2)
+    assert not budget.try_spend()
+
+    # The calls and retries have left the window; only the floor remains
+    clock.advance(RETRY_BUDGET_WINDOW_SECONDS / 2 + 1)
+    floor = _spend_all(budget)
+    assert floor == math.ceil(RETRY_BUDGET_MIN_PER_SECOND * RETRY_BUDGET_WINDOW_SECONDS)
+    assert floor < spent
@@ -0,0 +1,144 @@
+"""Parsing and local repair of model verdicts (services/verdicts.py)."""
+# internal imports
+import pytest
+
+# external imports
+from services.verdicts import VerdictParseError, parse_verdict, repair_verdict
+
+
+# (model output, expected status, reason, confidence)
+MALFORMED = [
+    pytest.param(
+        '```json\n{"status": "VERIFIED", "reason": "ok", "confidence": 0.9}\n```',
+        "VERIFIED", "ok", 0.9, id="markdown-fence",
+    ),
+    pytest.param(
+        '```\n{"status": "HIGH-RISK", "reason": "bad print", "confidence": 0.8}\n```',
+        "HIGH-RISK", "bad print", 0.8, id="bare-fence",
+    ),
+    pytest.param(
+        'Here is my verdict: {"status": "VERIFIED", "reason": "ok", "confidence": 0.7} Hope this helps.',
+        "VERIFIED", "ok", 0.7, id="surrounding-prose",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "ok", "confidence": 0.9,}',
+        "VERIFIED", "ok", 0.9, id="trailing-comma",
+    ),
+    pytest.param(
+        "{'status': 'HIGH-RISK', 'reason': 'logo differs', 'confidence': 0.95}",
+        "HIGH-RISK", "logo differs", 0.95, id="python-dict",
+    ),
+    pytest.param(
+        '{"Status": "VERIFIED", "REASON": "ok", "Confidence": 0.6}',
+        "VERIFIED", "ok", 0.6, id="key-case",
+    ),
+    pytest.param(
+        '{"status": "high risk", "reason": "x", "confidence": 0.9}',
+        "HIGH-RISK", "x", 0.9, id="status-with-space",
+    ),
+    pytest.param(
+        '{"status": "High_Risk", "reason": "x", "confidence": 0.9}',
+        "HIGH-RISK", "x", 0.9, id="status-with-underscore",
+    ),
+    pytest.param(
+        '{"status": "HIGHRISK", "reason": "x", "confidence": 0.9}',
+        "HIGH-RISK", "x", 0.9, id="status-without-separator",
+    ),
+    pytest.param(
+        '{"status": " verified ", "reason": "x", "confidence": 0.9}',
+        "VERIFIED", "x", 0.9, id="status-case-and-padding",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x", "confidence": 85}',
+        "VERIFIED", "x", 0.85, id="confidence-percent-number",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x", "confidence": "85%"}',
+        "VERIFIED", "x", 0.85, id="confidence-percent-string",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x", "confidence": "very sure"}',
+        "VERIFIED", "x", None, id="confidence-unparseable",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x", "confidence": 250}',
+        "VERIFIED", "x", None, id="confidence-out-of-range",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x", "confidence": -0.5}',
+        "VERIFIED", "x", None, id="confidence-negative",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "confidence": 0.9}',
+        "VERIFIED", "No reason given.", 0.9, id="reason-missing",
+    ),
+]
+
+# Valid for the schema, so parse_verdict takes them as they are; repair_verdict still normalizes them
+NORMALIZED = [
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x", "confidence": "0.4"}',
+        "VERIFIED", "x", 0.4, id="confidence-string",
+    ),
+    pytest.param(
+        '{"status": "HIGH-RISK", "reason": "", "confidence": 0.9}',
+        "HIGH-RISK", "No reason given.", 0.9, id="reason-empty",
+    ),
+    pytest.param(
+        '{"status": "VERIFIED", "reason": "x"}',
+        "VERIFIED", "x", None, id="confidence-missing",
+    ),
+]
+
+UNREPAIRABLE = [
+    pytest.param("", id="empty"),
+    pytest.param("I cannot tell from these images.", id="prose-only"),
+    pytest.param('{"status": "VERIFIED", "reason": "x"', id="unclosed-object"),
+    pytest.param('["VERIFIED", "x", 0.9]', id="array"),
+    pytest.param('{"status": "VERIFIED" "reason": "x"}', id="missing-comma"),
+    pytest.param('{"status": "MAYBE", "reason": "x", "confidence": 0.5}', id="unknown-status"),
+    pytest.param('{"reason": "x", "confidence": 0.5}', id="status-missing"),
+    pytest.param("{'status': __import__('os')}", id="python-expression"),
+]
+
+
+@pytest.mark.parametrize("text, status, reason, confidence", MALFORMED + NORMALIZED)
+def test_repair_verdict(text, status, reason, confidence):
+    verdict = repair_verdict(text, stage="box")
+    assert verdict.status == status
+    assert verdict.reason == reason
+    if confidence is None:
+        assert verdict.confidence is None
+    else:
+        assert verdict.confidence == pytest.approx(confidence)
+    assert verdict.stage == "box"
+
+
+@pytest.mark.parametrize("text", UNREPAIRABLE)
+def test_repair_verdict_gives_up(text):
+    with pytest.raises(VerdictParseError):
+        repair_verdict(text)
+
+
+@pytest.mark.parametrize("text", UNREPAIRABLE)
+def test_parse_verdict_raises_parse_error(text):
+    with pytest.raises(VerdictParseError):
+        parse_verdict(text)
+
+
+def test_parse_verdict_takes_well_formed_output_as_is():
+    verdict, repaired = parse_verdict('{"status": "VERIFIED", "reason": "ok", "confidence": 0.9}', stage="blister")
+    assert not repaired
+    assert (verdict.status, verdict.reason, verdict.confidence, verdict.stage) == ("VERIFIED", "ok", 0.9, "blister")
+
+
+@pytest.mark.parametrize("text, status, reason, confidence", MALFORMED)
+def test_parse_verdict_repairs_malformed_output(text, status, reason, confidence):
+    verdict, repaired = parse_verdict(text)
+    assert repaired
+    assert verdict.status == status
+
+
+def test_verdict_without_confidence_omits_it():
+    verdict, _ = parse_verdict('{"status": "VERIFIED", "reason": "ok"}')
+    assert verdict.to_dict() == {"status": "VERIFIED", "reason": "ok"}